@@ -5,3 +5,4 @@ from .wave2DCase import Wave2DCase
 from .dropTestCase import DropTestCase
 from .dropTestMesher import DropTestMesher
 from .ofCase import OfCase
+from .campaign import DropTestCampaign, SeakeepingCampaign
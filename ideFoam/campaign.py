@@ -0,0 +1,515 @@
+#!/usr/bin/env python
+import os
+import json
+import hashlib
+import inspect
+import itertools
+import threading
+from os.path import join, abspath, basename
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+from ideFoam.dropTestMesher import DropTestMesher
+from ideFoam.dropTestCase import DropTestCase
+from ideFoam.seakeepingMesher import SeakeepingMesher
+from ideFoam.seakeepingCase import SeakeepingCase
+
+"""
+  Campaigns of cases : all combinations of a parameter grid, the cases sharing the meshes built with identical
+  parameters.
+
+  Parameters are routed to the mesher and/or the case according to the arguments of their BuildFromParams. Meshes are
+  stored in "root/mesh/<name>", with name depending on a hash of the mesher parameters, and cases in
+  "root/cases/<name>". Each folder contains a log.input file with its parameters, and a log.sha1 file with their hash
+  once completed : meshes and cases already completed with the same parameters are not built again. The hash of a
+  stage includes the one of the stage it depends on (STL files for meshes, mesh for cases), so that rebuilding a
+  stage rebuilds the following ones. Paths are absolute, the working directory is never changed.
+"""
+
+
+def parameterGrid(grid):
+    """Return list of dictionaries, one for each combination of the values of grid {name : list of values}
+    """
+    names = sorted(grid.keys())
+    return [ dict(zip(names, values)) for values in itertools.product(*[ grid[n] for n in names ]) ]
+
+
+def buildArguments(func):
+    """Names of the arguments of a BuildFromParams classmethod (except case)
+    """
+    return set(inspect.signature(func).parameters.keys()) - {"case"}
+
+
+def parametersKey(params):
+    """Hash of a parameter dictionary (independent of the order of the keys)
+    """
+    return hashlib.sha1(json.dumps(params, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def writeInput(case, params):
+    with open(join(case, "log.input"), "w") as f:
+        f.write(str(params))
+
+
+def readKey(fkey):
+    """Content of hash file fkey (None if it does not exist)
+    """
+    if not os.path.exists(fkey): return None
+    with open(fkey) as f:
+        return f.read()
+
+
+def fileKey(fname):
+    """Hash of the content of file fname (None if it does not exist)
+    """
+    if not os.path.exists(fname): return None
+    h = hashlib.sha1()
+    with open(fname, "rb") as f:
+        for chunk in iter(lambda : f.read(1 << 20), b""): h.update(chunk)
+    return h.hexdigest()
+
+
+def stlKey(fstl):
+    """Hash of a STL file : the one stored in <fstl>.sha1 when created by the campaign, otherwise its content hash
+    """
+    key = readKey(fstl + ".sha1")
+    return key if key is not None else fileKey(fstl)
+
+
+def isUpToDate(folder, key):
+    """Check if folder was completed with the parameters of hash key (stored in folder/log.sha1)
+    """
+    return readKey(join(folder, "log.sha1")) == key
+
+
+def writeKey(folder, key):
+    with open(join(folder, "log.sha1"), "w") as f:
+        f.write(key)
+
+
+def absolutePath(path):
+    """Absolute path(s), relative paths being relative to the current folder
+    """
+    if isinstance(path, (list, tuple)): return [ absolutePath(p) for p in path ]
+    if isinstance(path, str): return abspath(path)
+    return path
+
+
+def _buildCase(caseClass, case, params, inputs, key):
+    """Build a case and store its inputs and their hash (run in a worker process, the PyFoam parser is not thread-safe)
+    """
+    caseClass.BuildFromParams(case, **params)
+    writeInput(case, inputs)
+    writeKey(case, key)
+    return case
+
+
+def runWithCoreBudget(tasks, coreBudget=None):
+    """Run tasks concurrently, the cores used by running tasks not exceeding coreBudget
+
+    Parameters
+    ----------
+    tasks : list of (callable, int)
+        Function to call, and number of cores it uses
+    coreBudget : int, default None
+        Number of available cores (default to os.cpu_count())
+
+    Returns
+    -------
+    List of the results of the tasks
+    """
+    if coreBudget is None: coreBudget = os.cpu_count()
+    if len(tasks) == 0: return []
+    cond = threading.Condition()
+    free = [coreBudget]
+
+    def run(task):
+        func, nCores = task
+        nCores = min(max(int(nCores), 1), coreBudget)
+        with cond:
+            cond.wait_for(lambda : free[0] >= nCores)
+            free[0] -= nCores
+        try:
+            return func()
+        finally:
+            with cond:
+                free[0] += nCores
+                cond.notify_all()
+
+    #Largest tasks first, so that they are not delayed by smaller ones
+    order = sorted(range(len(tasks)), key = lambda i : -tasks[i][1])
+    with ThreadPoolExecutor(max_workers=min(len(tasks), coreBudget)) as pool:
+        results = list(pool.map(run, [ tasks[i] for i in order ]))
+    res = [None] * len(tasks)
+    for i, r in zip(order, results): res[i] = r
+    return res
+
+
+class Campaign(object):
+    """Campaign of cases built with mesherClass and caseClass (see DropTestCampaign and SeakeepingCampaign)
+
+    Parameters
+    ----------
+    root : str
+        Campaign folder
+    grid : dict
+        Values of each varying parameter {name : list of values}, given to mesherClass.BuildFromParams and/or
+        caseClass.BuildFromParams depending on their arguments
+    meshParams : dict
+        Fixed parameters of mesherClass.BuildFromParams
+    caseParams : dict
+        Fixed parameters of caseClass.BuildFromParams
+    """
+
+    mesherClass = None
+    caseClass = None
+    meshExtraArgs = set()   # Parameters used by the campaign to define the mesh, not given to mesherClass
+    pathArgs = set()        # Parameters containing paths, made absolute
+    stlArgs = set()         # Mesher parameters containing STL files, whose hash is part of the mesh key
+
+    def __init__(self, root, grid, meshParams={}, caseParams={}):
+        self.root = abspath(root)
+        meshArgs = buildArguments(self.mesherClass.BuildFromParams) | self.meshExtraArgs
+        caseArgs = buildArguments(self.caseClass.BuildFromParams)
+        unknown = set(grid.keys()) - meshArgs - caseArgs
+        if len(unknown) > 0:
+            raise(ValueError("Unknown parameters {}".format(sorted(unknown))))
+
+        self.meshes = OrderedDict()   # mesh folder : mesher parameters
+        self.cases = OrderedDict()    # case folder : (mesh folder, case parameters)
+        for i, values in enumerate(parameterGrid(grid)):
+            values = self.pointParameters(values)
+            meshP = dict(meshParams, **{ k : v for k, v in values.items() if k in meshArgs })
+            caseP = dict(caseParams, **{ k : v for k, v in values.items() if k in caseArgs })
+            #relative paths are relative to the current folder
+            for p in (meshP, caseP):
+                for k in self.pathArgs & set(p.keys()): p[k] = absolutePath(p[k])
+            meshDir = join(self.root, "mesh", self.meshName(meshP))
+            self.meshes[meshDir] = meshP
+            self.cases[join(self.root, "cases", self.caseName(i, meshDir, caseP))] = (meshDir, caseP)
+        self.mesher = None
+        self.meshKeys = {}
+
+    def pointParameters(self, values):
+        """Parameters of a point of the grid (to be completed in subclass)
+        """
+        return values
+
+    def meshName(self, meshP):
+        return "mesh_" + parametersKey(meshP)[:8]
+
+    def caseName(self, i, meshDir, caseP):
+        return "case_{:03d}".format(i)
+
+    def meshKey(self, meshDir):
+        """Hash of the mesher parameters and of the STL files they use
+        """
+        meshP = self.meshes[meshDir]
+        args = self.mesherParameters(meshP)
+        stl = {}
+        for k in self.stlArgs & set(args.keys()):
+            if args[k] is None: continue
+            files = args[k] if isinstance(args[k], (list, tuple)) else [args[k]]
+            stl[k] = [ stlKey(f) for f in files ]
+        return parametersKey(dict(meshP, stlKeys=stl))
+
+    def isMeshCompleted(self, meshDir):
+        """Check if the mesh was completed with its current key (STL files and mesher parameters)
+        """
+        if meshDir not in self.meshKeys: self.meshKeys[meshDir] = self.meshKey(meshDir)
+        return isUpToDate(meshDir, self.meshKeys[meshDir])
+
+    def caseKey(self, case):
+        """Hash of the case parameters and of the mesh (log.sha1 of the mesh folder, read once meshes are run)
+        """
+        meshDir, caseP = self.cases[case]
+        return parametersKey(dict(caseP, meshDir=basename(meshDir), meshKey=readKey(join(meshDir, "log.sha1"))))
+
+    def mesherParameters(self, meshP):
+        """Arguments of mesherClass.BuildFromParams
+        """
+        return { k : v for k, v in meshP.items() if k not in self.meshExtraArgs }
+
+    def caseParameters(self, meshDir, caseP):
+        """Arguments of caseClass.BuildFromParams
+        """
+        return dict(caseP, meshDir=meshDir)
+
+    def buildMeshes(self, clean=True, force=False):
+        """Write input files of the meshes not already completed with the same parameters
+
+        Returns
+        -------
+        dict {mesh folder : mesher} of the meshes to run
+        """
+        self.mesher = OrderedDict()
+        for meshDir, meshP in self.meshes.items():
+            #Computed once STL files are created, stored when the mesh is completed
+            self.meshKeys[meshDir] = self.meshKey(meshDir)
+            if not force and isUpToDate(meshDir, self.meshKeys[meshDir]):
+                print("Mesh {} is up to date".format(meshDir))
+                continue
+            self.mesher[meshDir] = self.mesherClass.BuildFromParams(meshDir, clean=clean, **self.mesherParameters(meshP))
+            writeInput(meshDir, meshP)
+        return self.mesher
+
+    def runMeshes(self, coreBudget=None):
+        """Run mesh generation (Allinit) of the meshes to run, several meshes at a time within coreBudget cores
+
+        Meshes are run locally : meshes with onLiger (submitted as batch jobs) are refused. Meshes completed
+        successfully are marked (log.sha1), the others are built again on next run.
+        """
+        if self.mesher is None: self.buildMeshes()
+        #With onLiger, Allinit only submits the job (sbatch) : its exit status does not tell if the mesh is completed
+        batch = [ meshDir for meshDir, m in self.mesher.items() if getattr(m, "onLiger", False) and m.nProcs > 1 ]
+        if len(batch) > 0:
+            raise(ValueError("Meshes submitted as batch jobs (onLiger) can not be run by the campaign : {}".format(batch)))
+        print("Running {} meshes ({} cores)".format(len(self.mesher), coreBudget or os.cpu_count()))
+
+        def runMesh(meshDir):
+            #Only successful meshes are marked as completed (failed ones are built again on next run)
+            returnCode = self.mesher[meshDir].runInit()
+            if returnCode == 0:
+                writeKey(meshDir, self.meshKeys[meshDir])
+            else:
+                print("Mesh {} failed (exit status {}), see {}".format(meshDir, returnCode, join(meshDir, "log.mesh")))
+            return returnCode
+
+        runWithCoreBudget([ (lambda meshDir=meshDir : runMesh(meshDir), m.nProcs) for meshDir, m in self.mesher.items() ], coreBudget)
+
+    def buildCases(self, clean=True, meshLinkMode="auto", nWorkers=4, force=False):
+        """Build the cases not already built with the same parameters, in nWorkers processes
+
+        Meshes are shared between the cases (reflinked when possible, see OfCase.copyMesh). Cases whose mesh is not
+        completed (failed, or submitted as a batch job) are skipped.
+
+        Returns
+        -------
+        list of the built case folders
+        """
+        skipped = set( case for case, (meshDir, caseP) in self.cases.items() if not self.isMeshCompleted(meshDir) )
+        for case in sorted(skipped):
+            print("Skip case {} : mesh {} is not completed".format(case, self.cases[case][0]))
+        todo = [ case for case in self.cases.keys() if case not in skipped
+                 and (force or not isUpToDate(case, self.caseKey(case))) ]
+        print("Building {} cases ({} up to date, {} skipped)".format(len(todo), len(self.cases) - len(todo) - len(skipped), len(skipped)))
+        if len(todo) == 0: return []
+
+        args = []
+        for case in todo:
+            meshDir, caseP = self.cases[case]
+            params = dict({"meshLinkMode" : meshLinkMode}, clean=clean, **self.caseParameters(meshDir, caseP))
+            args.append( (self.caseClass, case, params, dict(caseP, meshDir=meshDir), self.caseKey(case)) )
+        with ProcessPoolExecutor(max_workers=max(1, min(nWorkers, len(todo)))) as pool:
+            return list(pool.map(_buildCase, *zip(*args)))
+
+    def run(self, coreBudget=None, clean=True, meshLinkMode="auto", nWorkers=4, force=False):
+        """Build and run the meshes, then build the cases
+        """
+        self.buildMeshes(clean=clean, force=force)
+        self.runMeshes(coreBudget=coreBudget)
+        return self.buildCases(clean=clean, meshLinkMode=meshLinkMode, nWorkers=nWorkers, force=force)
+
+
+class DropTestCampaign(Campaign):
+    """Drop test campaign (for instance sections x drop velocities x heel angles)
+
+    Examples
+    --------
+    >>> from ideFoam.campaign import DropTestCampaign
+    >>> from pythonScripts.fsTools import readSections, createSectionStl
+    >>> #
+    >>> createSectionStl(readSections('Slamming_sections.out'))
+    >>> campaign = DropTestCampaign( "campaign",
+    >>>                              grid = { 'section'    : [1,2,3],
+    >>>                                       'gridLevel'  : [1,2],
+    >>>                                       'dispSignal' : ['v1.dat','v2.dat'],
+    >>>                                       'rotate'     : [[0.,0.,0.],[10.,0.,0.]] },
+    >>>                              meshParams = { 'nProcs' : 4, 'domain' : [-0.5,0.5,-9.,9.,-6.,3.] },
+    >>>                              caseParams = { 'nProcs' : 12, 'endTime' : 4.0, 'timeStep' : 0.000625 } )
+    >>> campaign.run(coreBudget = 32)
+
+    The 24 cases share 6 meshes, built 8 at a time.
+
+    Parameters
+    ----------
+    root : str
+        Campaign folder
+    grid : dict
+        Values of each varying parameter {name : list of values}, given to DropTestMesher.BuildFromParams and/or
+        DropTestCase.BuildFromParams depending on their arguments
+    meshParams : dict
+        Fixed parameters of DropTestMesher.BuildFromParams
+    caseParams : dict
+        Fixed parameters of DropTestCase.BuildFromParams
+    stlDir : str, default "stl"
+        Folder containing section STL files (section_N.stl, see fsTools.createSectionStl), for 2D meshes
+    """
+
+    mesherClass = DropTestMesher
+    caseClass = DropTestCase
+    pathArgs = {"stlFile", "dispSignal"}
+    stlArgs = {"stlFile"}
+
+    def __init__(self, root, grid, meshParams={}, caseParams={}, stlDir="stl"):
+        self.stlDir = abspath(stlDir)
+        Campaign.__init__(self, root, grid, meshParams=meshParams, caseParams=caseParams)
+
+    def meshName(self, meshP):
+        h = parametersKey(meshP)[:8]
+        if "section" in meshP: return "section_{}_{}".format(meshP["section"], h)
+        return "mesh_" + h
+
+    def mesherParameters(self, meshP):
+        """Complete mesher parameters with the section STL file
+        """
+        meshP = dict(meshP)
+        if meshP.get("stlFile") is None and meshP.get("ndim", 2) == 2:
+            meshP["stlFile"] = join(self.stlDir, "section_{}.stl".format(meshP.get("section", 1)))
+        return meshP
+
+    def caseParameters(self, meshDir, caseP):
+        """Complete case parameters with the mesh data (folder, hull patch, symmetry, dimension)
+        """
+        meshP = self.meshes[meshDir]
+        caseP = dict(caseP)
+        caseP["meshDir"] = meshDir
+        ndim = caseP.setdefault("ndim", meshP.get("ndim", 2))
+        caseP.setdefault("meshTime", "constant" if ndim == 2 else "latestTime")
+        caseP.setdefault("symmetry", int(bool(meshP.get("symmetry", False))))
+        if "hullPatch" not in caseP:
+            if meshP.get("hullPatch") is not None: caseP["hullPatch"] = meshP["hullPatch"]
+            elif ndim == 2: caseP["hullPatch"] = "section_{}".format(meshP.get("section", 1))
+        return caseP
+
+
+class SeakeepingCampaign(Campaign):
+    """Seakeeping campaign (for instance ships x loadings x speeds x headings x wave periods x wave heights)
+
+    Each point of the grid is a SeakeepingCase, sharing the SeakeepingMesher meshes built with the same parameters
+    (ship, loading, heading...). The STL of each (ship, loading) is root/stl/<ship>_<loading>.stl, created with
+    stlFunction if given.
+
+    Stages are cached : STL files, meshes and cases are only built if their parameters changed, so that adding a wave
+    period only builds the new cases.
+
+    Examples
+    --------
+    >>> from ideFoam.campaign import SeakeepingCampaign
+    >>> #
+    >>> campaign = SeakeepingCampaign( "database",
+    >>>                                grid = { 'ship'    : ['C01','C03'],
+    >>>                                         'loading' : ['Full'],
+    >>>                                         'speed'   : [0., 5.],
+    >>>                                         'heading' : [180., 150.],
+    >>>                                         'waveT'   : [8., 10., 12.],
+    >>>                                         'waveH'   : [1.] },
+    >>>                                shipParams = { ('C01','Full') : { 'draft' : 11.2 },
+    >>>                                               ('C03','Full') : { 'draft' : 14.5 } },
+    >>>                                stlFunction = createShipStl,
+    >>>                                meshParams = { 'nProcs' : 'auto', 'refBoxType' : 'wave' },
+    >>>                                caseParams = { 'nProcs' : 36, 'waveType' : 'streamFunction', 'endTime' : 200. } )
+    >>> campaign.run(coreBudget = 72)
+
+    The 24 cases share 4 meshes.
+
+    Parameters
+    ----------
+    root : str
+        Campaign folder
+    grid : dict
+        Values of each varying parameter {name : list of values}. 'ship' and 'loading' define the STL file, other
+        parameters are given to SeakeepingMesher.BuildFromParams and/or SeakeepingCase.BuildFromParams depending on
+        their arguments
+    meshParams : dict
+        Fixed parameters of SeakeepingMesher.BuildFromParams
+    caseParams : dict
+        Fixed parameters of SeakeepingCase.BuildFromParams
+    shipParams : dict
+        Parameters depending on the ship {(ship, loading) or ship : dict} (draft, mass, COG...), routed as grid
+        parameters
+    stlFunction : callable, default None
+        stlFunction(ship, loading, stlFile, **stlParams) writes the STL file of a ship. If None, STL files must exist
+    stlParams : dict
+        Additional arguments of stlFunction
+    """
+
+    mesherClass = SeakeepingMesher
+    caseClass = SeakeepingCase
+    meshExtraArgs = {"ship", "loading"}
+    pathArgs = {"stlFiles", "refSurfExtra", "donFile", "datFile", "dmigFile", "mdFile", "hmrUserOutput", "decompositionCache"}
+    stlArgs = {"stlFiles", "refSurfExtra"}
+
+    def __init__(self, root, grid, meshParams={}, caseParams={}, shipParams={}, stlFunction=None, stlParams={}):
+        self.shipParams = shipParams
+        self.stlFunction = stlFunction
+        self.stlParams = stlParams
+        Campaign.__init__(self, root, grid, meshParams=meshParams, caseParams=caseParams)
+
+    def pointParameters(self, values):
+        ship, loading = values.get("ship"), values.get("loading")
+        return dict(self.shipParams.get((ship, loading), self.shipParams.get(ship, {})), **values)
+
+    def stlFile(self, ship, loading):
+        return join(self.root, "stl", "{}_{}.stl".format(ship, loading))
+
+    def ships(self):
+        """List of distinct (ship, loading) of the campaign
+        """
+        return list(OrderedDict.fromkeys( (meshP.get("ship"), meshP.get("loading")) for meshP in self.meshes.values()
+                                          if meshP.get("stlFiles") is None ))
+
+    def meshName(self, meshP):
+        h = parametersKey(meshP)[:8]
+        if "ship" in meshP: return "{}_{}_{}".format(meshP["ship"], meshP.get("loading"), h)
+        return "mesh_" + h
+
+    def caseName(self, i, meshDir, caseP):
+        meshP = self.meshes[meshDir]
+        h = parametersKey(dict(caseP, meshDir=basename(meshDir)))[:8]
+        if "ship" in meshP: return "{}_{}_{}".format(meshP["ship"], meshP.get("loading"), h)
+        return "case_" + h
+
+    def mesherParameters(self, meshP):
+        """Mesher parameters, with the ship STL file
+        """
+        res = Campaign.mesherParameters(self, meshP)
+        if res.get("stlFiles") is None:
+            res["stlFiles"] = self.stlFile(meshP.get("ship"), meshP.get("loading"))
+        return res
+
+    def caseParameters(self, meshDir, caseP):
+        """Complete case parameters with the mesh data (folder, STL, hull patch, symmetry)
+        """
+        meshP = self.meshes[meshDir]
+        caseP = dict(caseP)
+        caseP["meshDir"] = meshDir
+        caseP.setdefault("meshTime", "latestTime")
+        caseP.setdefault("stlFile", meshP.get("stlName", "ship") + ".stl")
+        caseP.setdefault("hullPatch", meshP.get("stlName", "ship"))
+        caseP.setdefault("symmetry", 1 if meshP.get("side", "port") in ["port", "starboard"] else 0)
+        return caseP
+
+    def createStl(self, force=False):
+        """Create the STL files with stlFunction, unless created with the same parameters
+
+        <stlFile>.sha1 stores the hash of the parameters and of the created file, which is part of the mesh key : meshes
+        using a re-created (or modified) STL file are built again.
+        """
+        if self.stlFunction is None: return
+        for ship, loading in self.ships():
+            fstl = self.stlFile(ship, loading)
+            params = dict(self.stlParams, ship=ship, loading=loading)
+            if not force and readKey(fstl+'.sha1') == parametersKey(dict(params, sha1=fileKey(fstl))):
+                print("STL {} is up to date".format(fstl))
+                continue
+            if not os.path.exists(os.path.dirname(fstl)): os.makedirs(os.path.dirname(fstl))
+            print("Create STL {}".format(fstl))
+            self.stlFunction(ship, loading, fstl, **self.stlParams)
+            with open(fstl+'.sha1', 'w') as f: f.write(parametersKey(dict(params, sha1=fileKey(fstl))))
+
+    def run(self, coreBudget=None, clean=True, meshLinkMode="auto", nWorkers=4, force=False):
+        """Create the STL files, build and run the meshes, then build the cases
+        """
+        self.createStl(force=force)
+        return Campaign.run(self, coreBudget=coreBudget, clean=clean, meshLinkMode=meshLinkMode, nWorkers=nWorkers, force=force)
@@ -1,5 +1,6 @@
 import os
 from ideFoam.ofRun import OfRun
+from ideFoam.ofCase import unlinkFile
 
 from ideFoam.inputFiles import ControlDict, FvSchemes, FvSolution, DecomposeParDict
 from ideFoam.inputFiles import DynamicMeshDict, WaveProperties, RelaxZone, noWaves, TransportProperties
@@ -130,7 +131,8 @@ class DropTestCase( OfRun ) :
                              COG              = [0.0,0.0,0.0],
                              gravity          = 0.0,
                              turbulenceModel  = "laminar",
-                             clean            = False
+                             clean            = False,
+                             meshLinkMode     = "copy"
                              ):
         """Build mesh for CFD drop test case from a few parameters.
         
@@ -201,6 +203,8 @@ class DropTestCase( OfRun ) :
             OpenFOAM version
         clean : boolean, default False
             Logical to force case overwrite
+        meshLinkMode : str, default "copy"
+            How the mesh is copied from meshDir : "copy", "hardlink", "reflink" or "auto" (see OfCase.copyMesh)
      
         """
 
@@ -286,6 +290,7 @@ class DropTestCase( OfRun ) :
                                             application = application)
     
         boundaryVelocity = BoundaryVelocity.Build(case          = case,
+                                                  speed         = 0.,
                                                   symmetry      = symmetry,
                                                   case2D      = (ndim==2),
                                                   wave        = False,
@@ -319,7 +324,8 @@ class DropTestCase( OfRun ) :
                           boundaryPressure          = boundaryPressure,
                           boundaryPointDisplacement = boundaryPointDisplacement,
                           gravity                   = gravity,
-                          application               = application
+                          application               = application,
+                          clean                     = clean
                         )
 
         res.dispSignal = dispSignal
@@ -331,7 +337,7 @@ class DropTestCase( OfRun ) :
         res.symmetry = symmetry
         res.ndim = ndim
 
-        res.copyMesh(meshDir, meshTime)
+        res.copyMesh(meshDir, meshTime, linkMode=meshLinkMode)
         res.setBoundaries()
 
         res.writeFiles()
@@ -349,8 +355,8 @@ class DropTestCase( OfRun ) :
             if self.dispSignal is not None:
                 f.write('function copyDisp()\n')
                 f.write('{\n')
-                fin  = os.path.join(os.getcwd(),self.dispSignal)
-                fout = os.path.join(os.getcwd(),self.case,"dispSignal.dat")
+                fin  = os.path.abspath(self.dispSignal)
+                fout = os.path.join(self.case,"dispSignal.dat")
                 f.write('    cp {:s} {:s}\n'.format(fin,fout))
                 f.write('}\n\n')
             
@@ -410,6 +416,7 @@ class DropTestCase( OfRun ) :
 
     def setBoundaries(self):
         boundfile = os.path.join(self.constfolder_,"polyMesh","boundary")
+        unlinkFile(boundfile)
         boundDict = ParsedParameterFile(boundfile,boundaryDict=True)
         nbound = int(len(boundDict)/2)
         for i in range(nbound):
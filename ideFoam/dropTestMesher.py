@@ -13,11 +13,14 @@
 #########################################################################
 
 import os
+import numpy as np
 
 from ideFoam.ofMesher import OfMesher
 from ideFoam.inputFiles import ControlDict, FvSchemes, FvSolution, DecomposeParDict
 from ideFoam.inputFiles import BlockMeshDict, ExtrudeMeshDict, RefineMeshDict, SurfaceFeatureExtractDict, SnappyHexMeshDict
-from pythonScripts.fsTools import findBoundingBox, findSTLPatches
+from pythonScripts.stlTools import stlInfo
+from ideFoam.inputFiles.blockMeshDict import boxCellCounts
+from ideFoam.meshEstimator import CellCountEstimator, expandBox, memoryEstimate
 
 class DropTestMesher( OfMesher ):
     """Class used to generate a CFD mesh for drop test cases (i.e. without wave propagation)
@@ -203,9 +206,11 @@ class DropTestMesher( OfMesher ):
 
         #get STL size
         if (ndim==2) and (stlFile is None): stlFile = os.path.join('stl',hullPatch+'.stl')
-        stlFile = os.path.join(os.getcwd(),stlFile)
+        stlFile = os.path.abspath(stlFile)
 
-        bBox = findBoundingBox(stlFile, verbose=True)
+        print("Compute STL bounding box: "+stlFile)
+        stlPatches, bBox = stlInfo(stlFile)
+        print("   ",bBox)
         Length = bBox[3]-bBox[0]
         Beam   = bBox[4]-bBox[1]
         Depth  = bBox[5]-bBox[2]
@@ -261,9 +266,6 @@ class DropTestMesher( OfMesher ):
                                                     useHexTopology = True,
                                                     geometricCut   = False))
 
-        #read stl patches
-        stlPatches = findSTLPatches(stlFile)
-
         #snappyHexMeshDict
         stlName = os.path.splitext(os.path.basename(stlFile))[0]
         referenceLength = min(Beam*0.5,Depth)
@@ -354,6 +356,95 @@ class DropTestMesher( OfMesher ):
         res.writeFiles()
         return res
 
+    @classmethod
+    def estimate(cls, bBox,
+                      ndim         = 2,
+                      gridLevel    = 1,
+                      symmetry     = False,
+                      domain       = [-0.5,0.5,-9.,9.,-2.,3.],
+                      cellRatio    = 1,
+                      nRefBoxes    = 6,
+                      xRefineBox   = [-0.6,-0.5,-0.4,-0.3,-0.2,-0.1,1.6,1.5,1.4,1.3,1.2,1.1],
+                      yRefineBox   = [-6.5,-4.5,-3.0,-2.0,-1.5,-1.2,6.5,4.5,3.0,2.0,1.5,1.2],
+                      zRefineBox   = [-2.0,-2.0,-2.0,-1.5,-1.0,-0.5,3.0,2.5,2.0,1.8,1.6,1.4],
+                      nfsRefBoxes  = 5,
+                      fsRefineBox  = [-1.5,-1.0,-0.5,-0.3,-0.2,2.5,2.0,1.5,1.3,1.2],
+                      refineLength = [0.1],
+                      layerLength  = 0.005,
+                      fillRatio    = 0.7,
+                      hullArea     = None,
+                      application  = "foamStar",
+                      verbose      = False
+                      ):
+        """Estimate number of cells and memory of the mesh built by BuildFromParams, without writing nor running anything
+
+        Parameters
+        ----------
+        bBox : list of float
+            Bounding box of the STL file [xmin, ymin, zmin, xmax, ymax, zmax]
+        fillRatio : float, default 0.7
+            Ratio between body volume and bounding box volume
+        hullArea : float, default None
+            Area of the meshed body surface (length of the section contour for 2D meshes). Default from bounding box.
+        application : str, default "foamStar"
+            Application used for the memory estimate
+        verbose : bool, default False
+            Print number of cells after each refinement
+
+        Other parameters are the ones of BuildFromParams
+
+        Returns
+        -------
+        dict with "background", "refined" and "final" cell counts, "removed" and "layers" (cells removed by and added
+        by snappyHexMesh), "stages" (list of (refinement name, number of cells)) and "memory" (GB)
+        """
+        Length = bBox[3]-bBox[0]
+        Beam   = bBox[4]-bBox[1]
+        Depth  = bBox[5]-bBox[2]
+        xmin, xmax = (domain[0], domain[1]) if ndim==2 else (domain[0]*Length, domain[1]*Length)
+        ymin, ymax = domain[2]*Beam*0.5*(not symmetry), domain[3]*Beam*0.5
+        zmin, zmax = domain[4]*Depth, domain[5]*Depth
+        nx, ny, nz = boxCellCounts(ndim, xmin, xmax, ymin, ymax, zmin, zmax, cellRatio=cellRatio, sym=symmetry, gridlvl=gridLevel)
+        est = CellCountEstimator( np.linspace(xmin, xmax, nx+1), np.linspace(ymin, ymax, ny+1), np.linspace(zmin, zmax, nz+1) )
+        axes = (1, 2) if ndim==2 else (0, 1, 2)
+        directions = "tan2 normal" if ndim==2 else "tan1 tan2 normal"
+
+        stages = []
+        nbx, nby, nbz, nf = [ int(len(b)/2) for b in (xRefineBox, yRefineBox, zRefineBox, fsRefineBox) ]
+        for i in range(nRefBoxes):
+            xb = (-1e6, 1e6) if ndim==2 else (xRefineBox[i]*Length, xRefineBox[i+nbx]*Length)
+            est.refine([xb[0], yRefineBox[i]*Beam*0.5, zRefineBox[i]*Depth, xb[1], yRefineBox[i+nby]*Beam*0.5, zRefineBox[i+nbz]*Depth], directions)
+            stages.append( ("box_{}".format(i), est.nCells) )
+        for i in range(min(nfsRefBoxes, nRefBoxes)):
+            est.refine([-1e6, -1e6, fsRefineBox[i]*Depth, 1e6, 1e6, fsRefineBox[i+nf]*Depth], "normal", maxLevel=nRefBoxes)
+            stages.append( ("fs_{}".format(i), est.nCells) )
+
+        #snappyHexMesh distance refinement around the body
+        domainBB = [xmin, ymin, zmin, xmax, ymax, zmax]
+        referenceLength = min(Beam*0.5,Depth)
+        for i, rl in enumerate(refineLength):
+            est.refineToLevel(expandBox(bBox, referenceLength*rl, domainBB), len(refineLength)-i, axes)
+            stages.append( ("level_{}".format(len(refineLength)-i), est.nCells) )
+
+        refined = est.nCells
+        hullBB = expandBox(bBox, 0., domainBB)
+        removed, layers = est.snap(hullBB, fillRatio = fillRatio, area = hullArea, nLayers = 3 if layerLength>0.0 else 0, axes = axes)
+        final = refined - removed + layers
+        res = { "background" : est.nBackground,
+                "refined"    : refined,
+                "removed"    : removed,
+                "layers"     : layers,
+                "final"      : final,
+                "stages"     : stages,
+                "memory"     : memoryEstimate(final, application),
+              }
+        if verbose:
+            print("Background mesh : {} cells".format(res["background"]))
+            for name, n in stages:
+                print("    after {:8s} : {:.0f} cells".format(name, n))
+            print("Final mesh : {:.0f} cells ({:.0f} removed, {:.0f} in layers), {:.1f} GB".format(final, removed, layers, res["memory"]))
+        return res
+
     # def writeFiles(self) :
         # OfMesher.writeFiles(self)
 
@@ -366,7 +457,9 @@ class DropTestMesher( OfMesher ):
         ainit = os.path.join(self.case,'Allinit')
         with open(ainit,'w') as f:
             f.write('#! /bin/bash\n')
-            f.write('set -x\n\n')
+            f.write('set -x\n')
+            #stop at the first failing step (also within "| tee"), so that the exit status reports a failed mesh
+            f.write('set -eo pipefail\n\n')
 
             #clearMeshInfo
             f.write('function clearMeshInfo()\n')
@@ -57,6 +57,19 @@ default_patches = '''
 )
 '''
 
+def boxCellCounts(ndim, xmin, xmax, ymin, ymax, zmin, zmax, Ycells=12, cellRatio=1, sym=False, gridlvl=1):
+    """Number of cells (nx, ny, nz) of the single block background mesh (not waveMesh)
+    """
+    ny = Ycells*(1+(not sym))
+    rXY = (xmax - xmin)/(ymax - ymin)
+    rYZ = (zmax - zmin)/(ymax - ymin)
+    ny = int(round(ny*(np.sqrt(2)**(gridlvl-1))))
+    nz = int(round(ny*rYZ*cellRatio))
+    if ndim>2: nx= int(round(ny*rXY))
+    else: nx = 1
+    return nx, ny, nz
+
+
 class BlockMeshDict(ReadWriteFile) :
     """
       blockMeshDict dictionary
@@ -153,13 +166,7 @@ class BlockMeshDict(ReadWriteFile) :
                 blockstr += 'hex ({} {} {} {} {} {} {} {}) ( {:d} {:d} {:d} ) simpleGrading (1 1 {})\n    '.format(*range(4*i,4*i+8), Xcells, Ycells, Zcells[i],Zgrading[i])
             res["blocks"]  = [ blockstr ]
         else:
-            ny = Ycells*(1+(not sym))
-            rXY = (xmax - xmin)/(ymax - ymin)
-            rYZ = (zmax - zmin)/(ymax - ymin)
-            ny = int(round(ny*(np.sqrt(2)**(gridlvl-1))))
-            nz = int(round(ny*rYZ*cellRatio))
-            if ndim>2: nx= int(round(ny*rXY))
-            else: nx = 1
+            nx, ny, nz = boxCellCounts(ndim, xmin, xmax, ymin, ymax, zmin, zmax, Ycells=Ycells, cellRatio=cellRatio, sym=sym, gridlvl=gridlvl)
             res["blocks"]  = '( hex (0 1 2 3 4 5 6 7) ( {:d} {:d} {:d} ) simpleGrading (1 1 1) )'.format(nx, ny,nz)
 
         res["edges"]   = '()'
@@ -3,40 +3,126 @@
 from ideFoam.inputFiles import ReadWriteFile, getFilePath
 from PyFoam.Basics.DataStructures import Dimension, Vector
 from os.path import join
+import numpy as np
 
 """
   Convenience class to simply write DecomposeParDict
 """
 
+def optimalSplit(nProcs, bBox=None, cellCounts=None):
+    """Return subdivisions (nx, ny, nz) and order minimizing the interfaces between processors
+
+    Parameters
+    ----------
+    nProcs : int
+        Number of processors
+    bBox : list of float
+        Bounding box of the mesh, [xmin, xmax, ymin, ymax, zmin, zmax] or ((xmin, xmax), (ymin, ymax), (zmin, zmax))
+    cellCounts : list of int
+        Number of cells in each direction (for instance from blockMesh). If given, the number of interface faces
+        is minimized, otherwise the interface area is.
+
+    Returns
+    -------
+    ( (nx, ny, nz), order )
+    """
+    if cellCounts is not None:
+        size = np.array(cellCounts, dtype=float)
+    elif bBox is not None:
+        bBox = np.asarray(bBox, dtype=float).reshape(3,2)
+        size = bBox[:,1] - bBox[:,0]
+    else:
+        raise(ValueError("bBox or cellCounts should be given"))
+
+    best, bestCost = None, None
+    for nx in range(1, nProcs+1):
+        if nProcs % nx : continue
+        for ny in range(1, nProcs//nx + 1):
+            if (nProcs//nx) % ny : continue
+            n = np.array( [nx, ny, nProcs//nx//ny] )
+            if cellCounts is not None and any(n > size) : continue
+            #Each cut normal to axis i has the size of the other two dimensions
+            cost = sum( (n[i]-1) * np.prod(np.delete(size, i)) for i in range(3) )
+            if bestCost is None or cost < bestCost:
+                best, bestCost = n, cost
+    if best is None:
+        raise(ValueError("No decomposition of {} processors found for {} cells".format(nProcs, cellCounts)))
+
+    #Largest subdivisions first (then longest direction)
+    axes = sorted(range(3), key = lambda i : (-best[i], -size[i]))
+    return tuple(int(i) for i in best), "".join( "xyz"[i] for i in axes )
+
+
 class DecomposeParDict(ReadWriteFile) :
     """
         DecomposeParDict dictionnary
     """
-    
+
     @classmethod
-    def Build(cls, case, nProcs = 1, method = "scotch", application = "foamStar") :
-        
+    def Build(cls, case, nProcs = 1, method = "scotch", bBox = None, cellCounts = None, manualDecomposition = None, application = "foamStar") :
+        """Build decomposeParDict
+
+        Parameters
+        ----------
+        nProcs : int, default 1
+            Number of subdomains
+        method : str, default "scotch"
+            Decomposition method ("scotch", "simple", "hierarchical" or "manual")
+        bBox : list of float, default None
+            Bounding box of the mesh. With "simple" and "hierarchical", subdivisions are chosen to minimize the interface area.
+        cellCounts : list of int, default None
+            Number of cells in each direction. With "simple" and "hierarchical", subdivisions are chosen to minimize the
+            number of interface faces.
+        manualDecomposition : array-like, default None
+            Processor of each cell. If given, method "manual" is used and the array is written to constant/cellDecomposition.
+        """
+
         res = cls( name = join(case, getFilePath("decomposeParDict") ), read = False )
-        
+        res.case = case
+        res.manualDecomposition = None
+
+        if manualDecomposition is not None:
+            method = "manual"
+            res.manualDecomposition = np.asarray(manualDecomposition, dtype=int)
+            nProcs = int(res.manualDecomposition.max()) + 1
+
         res["numberOfSubdomains"] = nProcs
         res["method"] = method
-        
-        if method == "simple":
-            res["simpleCoeffs"] = {"n" : "( 1 3 1 )",
+
+        if method in ["simple", "hierarchical", "manual"]:
+            nSimple, nHierarchical, order = (1, 3, 1), (3, 2, 1), "xzy"
+            if bBox is not None or cellCounts is not None:
+                n, order = optimalSplit(nProcs, bBox = bBox, cellCounts = cellCounts)
+                nSimple, nHierarchical = n, n
+                print("Decomposition : n = ({} {} {}), order = {}".format(n[0], n[1], n[2], order))
+            res["simpleCoeffs"] = {"n" : "( {} {} {} )".format(*nSimple),
                                     "delta" : 0.001 }
-            res["hierarchicalCoeffs"] = {"n" : "( 3 2 1 )",
+            res["hierarchicalCoeffs"] = {"n" : "( {} {} {} )".format(*nHierarchical),
                                           "delta" : 0.001,
-                                          "order" : "xzy" }
+                                          "order" : order }
             res["manualCoeffs"] = {"dataFile" : '"cellDecomposition"'}
-            
+
         elif method == "scotch":
             res["distributed"] = "no"
             res["roots"] = '()'
-            
-        return res
 
-if __name__ == "__main__" : 
-   print(DecomposeParDict.Build("test"))
+        return res
 
+    def writeFile(self, *args, **kwargs):
+        ReadWriteFile.writeFile(self, *args, **kwargs)
+        if getattr(self, "manualDecomposition", None) is not None:
+            self.writeManualDecomposition()
 
+    def writeManualDecomposition(self):
+        """Write constant/cellDecomposition (labelList) used by the "manual" method
+        """
+        fname = join(self.case, "constant", "cellDecomposition")
+        with open(fname, "w") as f:
+            f.write('FoamFile\n{\n    version     2.0;\n    format      ascii;\n    class       labelList;\n    object      cellDecomposition;\n}\n\n')
+            f.write('{}\n(\n'.format(self.manualDecomposition.size))
+            f.write('\n'.join(str(i) for i in self.manualDecomposition))
+            f.write('\n)\n')
 
+if __name__ == "__main__" :
+   print(DecomposeParDict.Build("test"))
+   print(DecomposeParDict.Build("test", nProcs = 24, method = "hierarchical", bBox = [-300., 250., 0., 200., -150., 50.]))
@@ -17,7 +17,8 @@ class SetSelection() :
             stlFile = './constant/triSurface/'+stlFile
             if not stlFile.endswith('.stl'): stlFile += '.stl'
             if outsidePoints==None:
-                tmp = findBoundingBox(stlFile, False)
+                #setSet runs in the case folder, the stl is read here from the case path
+                tmp = findBoundingBox(stlFile if case is None else join(case, stlFile), False)
                 tmp = [0.5*(tmp[0]+tmp[3]), 0.5*(tmp[1]+tmp[4])+mt.fabs(tmp[1]-tmp[4]), 0.5*(tmp[2]+tmp[5])]
                 outsidePoints = tmp
             includeCutCells=' yes'
@@ -28,12 +29,34 @@ class SetSelection() :
             if BB is not None:
                 self.cmd += '\n cellSet {} subset boxToCell ({} {} {}) ({} {} {})'.format(selName,*BB)
         
+        self.selName = selName
+
         #set command file name
         if case==None: self.path = '.'
         else: self.path = join(case,'system')
         self.name = 'setSet'
         if name is not None: self.name += '.'+name
 
+    @classmethod
+    def merge(cls, selections, name, selName='c0'):
+        """Union of several selections, in a single setSet batch file
+
+        Each selection should have been built with its own temporary selName (e.g. 'c0_0', 'c0_1', ...), removed
+        once merged
+        """
+        res = cls.__new__(cls)
+        res.path = selections[0].path
+        res.name = 'setSet.'+name
+        cmds = [ sel.cmd for sel in selections ]
+        for i, sel in enumerate(selections):
+            cmds.append('cellSet {} {} cellToCell {}'.format(selName, 'new' if i==0 else 'add', sel.selName))
+        #temporary sets are not written to polyMesh/sets
+        for sel in selections:
+            cmds.append('cellSet {} remove'.format(sel.selName))
+        res.cmd = '\n'.join(cmds)
+        res.selName = selName
+        return res
+
     def writeFile(self):
         fname = join(self.path,self.name)
         with open(fname,'w') as f:
@@ -0,0 +1,178 @@
+#!/usr/bin/env python
+import itertools
+import numpy as np
+
+"""
+  Estimate the number of cells of a mesh (background blockMesh, refineMesh stages and snappyHexMesh) without running
+  any OpenFOAM utility.
+
+  The background grid is described by its grid lines. Each background cell holds its number of subdivisions in x, y
+  and z, which refinements increase in proportion of the volume of the cell within the refined region. Proximity
+  selections (surfaceToCell) are approximated by the bounding box of the surface, extended by the selection distance.
+"""
+
+#Approximate memory needed per cell (bytes)
+memoryPerCell = { "snappyHexMesh" : 2.0e3,
+                  "foamStar"      : 1.5e3,
+                }
+
+
+def _overlap(edges, xmin, xmax):
+    """Fraction of each interval [edges[i], edges[i+1]] within [xmin, xmax]
+    """
+    lo = np.maximum(edges[:-1], xmin)
+    hi = np.minimum(edges[1:], xmax)
+    return np.clip(hi - lo, 0., None) / (edges[1:] - edges[:-1])
+
+
+def expandBox(BB, distance, clip=None):
+    """Return bounding box BB [xmin, ymin, zmin, xmax, ymax, zmax] extended by distance, and intersected with clip
+    """
+    res = [ BB[i] - distance for i in range(3) ] + [ BB[i] + distance for i in range(3, 6) ]
+    if clip is not None:
+        res = [ max(res[i], clip[i]) for i in range(3) ] + [ min(res[i], clip[i]) for i in range(3, 6) ]
+    return res
+
+
+class CellCountEstimator(object):
+    """Number of cells of a refined hexahedral background grid
+
+    Parameters
+    ----------
+    xGrid, yGrid, zGrid : array-like
+        Position of the background grid lines in each direction
+    """
+
+    def __init__(self, xGrid, yGrid, zGrid):
+        self.edges = [ np.asarray(g, dtype=float) for g in (xGrid, yGrid, zGrid) ]
+        shape = tuple( e.size - 1 for e in self.edges )
+        self.subdivisions = [ np.ones(shape) for i in range(3) ]
+        self.nBackground = int(np.prod(shape))
+
+    @property
+    def nCells(self):
+        return float(np.sum(self.subdivisions[0] * self.subdivisions[1] * self.subdivisions[2]))
+
+    def fraction(self, BB):
+        """Volume fraction of each background cell within BB [xmin, ymin, zmin, xmax, ymax, zmax]
+        """
+        f = [ _overlap(self.edges[i], BB[i], BB[i+3]) for i in range(3) ]
+        return f[0][:,None,None] * f[1][None,:,None] * f[2][None,None,:]
+
+    def refine(self, BB, directions="tan1 tan2 normal", maxLevel=None):
+        """Split cells within BB in two, in the given directions (refineMesh with global coordinate system)
+
+        maxLevel : int, default None
+            If given, cells already split 2**maxLevel times in a direction are not refined further in that direction
+        """
+        frac = self.fraction(BB)
+        for d in directions.split():
+            s = self.subdivisions[["tan1", "tan2", "normal"].index(d)]
+            if maxLevel is None:
+                s *= 1. + frac
+            else:
+                s += frac * np.clip(2.**maxLevel - s, 0., s)
+
+    def refineToLevel(self, BB, level, axes=(0, 1, 2)):
+        """Refine cells within BB up to level (size of background cell / 2**level), as snappyHexMesh refinement regions
+        """
+        frac = self.fraction(BB)
+        for i in axes:
+            s = self.subdivisions[i]
+            s += frac * (np.maximum(s, 2.**level) - s)
+
+    def cellsIn(self, BB, fillRatio=1.):
+        """Number of cells within BB (multiplied by fillRatio)
+        """
+        frac = self.fraction(BB)
+        return fillRatio * float(np.sum(frac * self.subdivisions[0] * self.subdivisions[1] * self.subdivisions[2]))
+
+    def cellSize(self, BB):
+        """Average cell size (dx, dy, dz) within BB
+        """
+        frac = self.fraction(BB)
+        if frac.sum() == 0.:
+            raise(ValueError("Box {} is outside of the background grid".format(BB)))
+        widths = [ np.diff(e) for e in self.edges ]
+        widths = [ widths[0][:,None,None], widths[1][None,:,None], widths[2][None,None,:] ]
+        return [ float(np.sum(frac * widths[i] / self.subdivisions[i]) / frac.sum()) for i in range(3) ]
+
+    def snap(self, BB, fillRatio=0.7, area=None, nLayers=0, axes=(0, 1, 2)):
+        """Remove cells inside the body and add boundary layers (snappyHexMesh)
+
+        Parameters
+        ----------
+        BB : list of float
+            Bounding box of the body, clipped to the domain
+        fillRatio : float, default 0.7
+            Ratio between the volume of the body and the volume of its bounding box
+        area : float, default None
+            Area of the body surface. Default to the area of the faces of BB that are not on the domain boundary.
+        nLayers : int, default 0
+            Number of boundary layers
+        axes : tuple, default (0, 1, 2)
+            Directions of the mesh (cell faces of a 2D mesh are the product of the cell sizes in the two directions)
+
+        Return (number of removed cells, number of added cells)
+        """
+        removed = self.cellsIn(BB, fillRatio)
+        if nLayers == 0:
+            return removed, 0.
+        if area is None:
+            size = [ BB[i+3] - BB[i] for i in range(3) ]
+            area = 0.
+            for i in axes:
+                others = np.prod([ size[j] for j in axes if j != i ])
+                area += others * sum( BB[k] != e for k, e in [(i, self.edges[i][0]), (i+3, self.edges[i][-1])] )
+        size = self.cellSize(BB)
+        faceArea = np.prod([size[i] for i in axes]) ** ((len(axes)-1.) / len(axes))
+        return removed, nLayers * area / faceArea
+
+
+def memoryEstimate(nCells, application="foamStar"):
+    """Approximate memory (GB) needed to handle nCells cells with application
+    """
+    return nCells * memoryPerCell.get(application, memoryPerCell["foamStar"]) / 1024.**3
+
+
+def sweep(estimate, target, key="final", **paramLists):
+    """Estimate cell counts for all combinations of parameters, and sort them by distance to a target cell count
+
+    Parameters
+    ----------
+    estimate : callable
+        Function called with each combination of parameters as keywords, returning a dictionary (for instance
+        SeakeepingMesher.estimate, with fixed arguments bound with functools.partial)
+    target : float
+        Target number of cells
+    key : str, default "final"
+        Cell count compared to target
+    **paramLists : list
+        Values of each parameter to sweep
+
+    Example
+    -------
+    >>> sweep( partial(SeakeepingMesher.estimate, shipBB = bb), 5e6,
+    >>>        fsCellHeight = [0.05, 0.1, 0.2], refBoxRatio = [2, 3] )
+
+    Returns
+    -------
+    List of (parameters, estimate), closest to target first
+    """
+    names = sorted(paramLists.keys())
+    res = []
+    for values in itertools.product(*[ paramLists[n] for n in names ]):
+        params = dict(zip(names, values))
+        res.append( (params, estimate(**params)) )
+    res.sort(key = lambda r : abs(r[1][key] - target))
+    return res
+
+
+def printSweep(results, keys=["background", "refined", "final", "memory"]):
+    """Print sweep results as a table
+    """
+    if len(results) == 0 : return
+    names = sorted(results[0][0].keys())
+    print(" ".join("{:>14s}".format(n) for n in names + keys))
+    for params, est in results:
+        print(" ".join("{:>14}".format(params[n]) for n in names) + " " + " ".join("{:14.4g}".format(est[k]) for k in keys))
@@ -1,12 +1,84 @@
 
 import os
+import math
 from os.path import join, abspath, exists
 import shutil
 import subprocess
+from concurrent.futures import ThreadPoolExecutor
 
 from ideFoam.inputFiles import getFileClass, getFilePath
 from pythonScripts.fsTools import getFoamTimeFolders
 
+#Mesh files or folders that may be rewritten in the case (setBoundaries, transformPoints, setSet...), never linked
+mutableMeshFiles = ["boundary", "points", "cellZones", "faceZones", "pointZones", "sets"]
+
+
+def _copyFile(src, dst):
+    shutil.copy2(src, dst)
+
+def _hardlinkFile(src, dst):
+    os.link(src, dst)
+
+def _reflinkFile(src, dst):
+    subprocess.check_call(["cp", "--reflink=always", "--preserve=timestamps", src, dst], stderr=subprocess.DEVNULL)
+
+_linkFunctions = { "copy"     : [_copyFile],
+                   "hardlink" : [_hardlinkFile, _copyFile],
+                   "reflink"  : [_reflinkFile, _copyFile],
+                   "auto"     : [_reflinkFile, _copyFile],
+                 }
+
+
+def linkTree(src, dst, linkMode="copy", nWorkers=4, mutable=[]):
+    """Copy directory tree, files being hard-linked or reflinked when possible
+
+    Parameters
+    ----------
+    linkMode : str, default "copy"
+        "copy", "hardlink", "reflink" or "auto" (reflink, then copy).
+        If links are not supported (other file system...), files are copied.
+        Reflinks are copy-on-write, while a file written in place through a hard link changes all the trees sharing it.
+    nWorkers : int, default 4
+        Number of threads used to copy/link files
+    mutable : list of str
+        Names of files or folders whose content is always copied
+
+    Returns
+    -------
+    Method actually used for shared files ("copy", "hardlink" or "reflink")
+    """
+    files = []
+    for root, dirs, fnames in os.walk(src):
+        rel = os.path.relpath(root, src)
+        os.makedirs(join(dst, rel))
+        files += [ join(rel, f) for f in fnames ]
+
+    isMutable = lambda f : any( part in mutable for part in f.split(os.sep) )
+    shared = [ f for f in files if not isMutable(f) ]
+    copied = [ f for f in files if isMutable(f) ]
+
+    #Find first working method on first shared file
+    for func in _linkFunctions[linkMode]:
+        if len(shared) == 0 : break
+        try:
+            func( join(src, shared[0]), join(dst, shared[0]) )
+            break
+        except (OSError, subprocess.CalledProcessError):
+            if os.path.exists(join(dst, shared[0])) : os.remove(join(dst, shared[0]))
+    tasks = [ (func, f) for f in shared[1:] ] + [ (_copyFile, f) for f in copied ]
+    with ThreadPoolExecutor(max_workers=nWorkers) as pool:
+        list(pool.map( lambda t : t[0]( join(src, t[1]), join(dst, t[1]) ), tasks ))
+    return { _copyFile : "copy", _hardlinkFile : "hardlink", _reflinkFile : "reflink" }[func]
+
+
+def unlinkFile(filename):
+    """Replace a file shared with other cases (hard link) by its own copy, before modifying it
+    """
+    if os.path.isfile(filename) and os.stat(filename).st_nlink > 1:
+        tmp = filename + ".tmp"
+        shutil.copy2(filename, tmp)
+        os.replace(tmp, filename)
+
 
 def cleanCase(case, clean):
     """Clean case directory
@@ -62,13 +134,15 @@ class OfCase(object):
                                        executable       = None,   # => default to application name
                                        isMesher         = False,
                                        clean            = "i"  ,  #True => Remove case folder and go on. #False: ask user interactively
-                                       meshFolder       = None
+                                       meshFolder       = None,
+                                       coresPerNode     = None    #Cores per cluster node, used for sbatch
                                        ) :
 
 
         self.case = abspath(case)  # path to case
         self.clean(clean)
         self.nProcs = nProcs
+        self.coresPerNode = coresPerNode
 
         #system
         self.controlDict = controlDict
@@ -153,8 +227,8 @@ class OfCase(object):
                 file_.writeFile()
 
         #write Allinit and Allclean scripts
-        if not exists( "Allclean" ): self.writeAllclean()
-        if not exists( "Allinit" ): self.writeAllinit()
+        if not exists( join(self.case, "Allclean") ): self.writeAllclean()
+        if not exists( join(self.case, "Allinit") ): self.writeAllinit()
 
     def runInit(self) :
 
@@ -168,13 +242,13 @@ class OfCase(object):
 
         #os.chmod(os.path.join(self.case, "Allinit"), 0o777)
         p = subprocess.Popen(['./Allinit'], cwd=self.case)
-        p.wait()
+        return p.wait()
 
     def run(self) :
         #run Allrun script
-        if not exists( "Allrun" ): self.writeAllrun()
+        if not exists( join(self.case, "Allrun") ): self.writeAllrun()
         p = subprocess.Popen(['./Allrun'], cwd=self.case)
-        p.wait()
+        return p.wait()
 
     def writeAllinit(self):
         """To be implemented in subclass"""
@@ -192,7 +266,22 @@ class OfCase(object):
             else:
                 f.write("{} > log.run 2>&1".format(self.executable))
 
-    def copyMesh(self, meshDir, meshTime, overwrite=False):
+    def reconstructPar(self, fields=None, times=None, nWorkers=4, **kwargs):
+        """Reconstruct time folders with several concurrent reconstructPar (see pythonScripts.parallelReconstruct)
+        """
+        from pythonScripts.parallelReconstruct import reconstructPar
+        return reconstructPar(self.case, fields=fields, times=times, nWorkers=nWorkers, **kwargs)
+
+    def copyMesh(self, meshDir, meshTime, overwrite=False, linkMode="copy", nWorkers=4):
+        """Copy polyMesh (and triSurface) from meshDir
+
+        linkMode : str, default "copy"
+            "copy", "hardlink", "reflink" or "auto" (reflink if available, otherwise copy). With links, the mesh is shared
+            between cases, except files listed in mutableMeshFiles (boundary, points, sets...) which are always copied.
+            "hardlink" is only safe if the case does not rewrite other polyMesh files (OpenFOAM utilities write in place).
+        nWorkers : int, default 4
+            Number of threads used to copy/link files
+        """
         meshTime = str(meshTime)
         if meshTime == 'latestTime':
             timeFolders = getFoamTimeFolders(meshDir)
@@ -203,12 +292,20 @@ class OfCase(object):
             meshTimeFolder = meshTime
 
         print('Copy mesh from folder ' + meshTimeFolder)
-        shutil.copytree( join( meshDir , meshTimeFolder ,'polyMesh') , join( self.case , "constant/polyMesh"))
+        mode = linkTree( join( meshDir , meshTimeFolder ,'polyMesh') , join( self.case , "constant/polyMesh"),
+                         linkMode = linkMode, nWorkers = nWorkers, mutable = mutableMeshFiles )
+        if mode != linkMode and linkMode != "auto" : print('Warning : {} not available, mesh copied'.format(linkMode))
 
         if os.path.exists(join( meshDir , "constant" ,'triSurface')):
-            shutil.copytree( join( meshDir , "constant" ,'triSurface') , join( self.case  , "constant/triSurface"))
+            linkTree( join( meshDir , "constant" ,'triSurface') , join( self.case  , "constant/triSurface"),
+                      linkMode = linkMode, nWorkers = nWorkers )
 
-    def writeSbatch(self, batchName='None'):
+    def writeSbatch(self, batchName='None', commands=None):
+        """Write run.sh batch file
+
+        commands : list of str, default None
+            Commands to run before the application (in parallel)
+        """
         #run.sh
        	print('Write run.sh batch file')
         run = os.path.join(self.case,'run.sh')
@@ -224,6 +321,8 @@ class OfCase(object):
                 f.write('#SBATCH -t 0-02:00:00\n')
             else:
                 f.write('#SBATCH -t 3-00:00:00\n')
+            if self.coresPerNode is not None:
+                f.write('#SBATCH -N {:d}\n'.format(int(math.ceil(self.nProcs / float(self.coresPerNode)))))
             f.write('#SBATCH -n {:d}\n'.format(self.nProcs))
             f.write('#SBATCH -o log.run-%j\n\n')
             f.write('module load gcc/4.9.3 openmpi/1.8.4-gcc lapack/3.6.1/gcc/4.9.3 cmake/3.7.1/gcc/4.9.3 hdf5/1.8.15/gcc-4.9.3\n')
@@ -232,6 +331,8 @@ class OfCase(object):
             elif self.OFversion == 3 : f.write('source /data/I1608251/OpenFOAM/OpenFOAM-3.0.x/etc/bashrc;\n')
             elif self.OFversion == 5 : f.write('source /data/I1608251/OpenFOAM/OpenFOAM-5.x/etc/bashrc;\n')
             f.write('export LC_ALL=C\n\n')
+            if commands is not None:
+                for cmd in commands : f.write(cmd+'\n')
             f.write('mpirun {} -parallel\n'.format(self.executable))
 
     def runSbatch(self):
@@ -1,5 +1,6 @@
 import os
 from ideFoam.ofRun import OfRun
+from ideFoam.ofCase import unlinkFile
 from ideFoam.inputFiles import FvSchemes, FvSolution, ControlDict, DecomposeParDict, TransportProperties, SetSelection
 from ideFoam.inputFiles import BoundaryPressure, BoundaryVelocity, BoundaryPointDisplacement, BoundaryAlpha
 from ideFoam.inputFiles import RelaxZone, noWaves, WaveCondition, WaveProperties, DynamicMeshDict
@@ -7,8 +8,9 @@ from ideFoam.inputFiles import SixDofDomainBody, InitFlexDict, FlexFile
 from ideFoam.inputFiles import createLinearWaveProbesList
 
 from PyFoam.RunDictionary.ParsedParameterFile import ParsedParameterFile
-from pythonScripts.meshTools import getBounds
-from pythonScripts.fsTools import findBoundingBox
+from pythonScripts.meshTools import getBounds, getNCells, getNProcs
+from pythonScripts.fsTools import findBoundingBox, getFoamTimeFolders
+from pythonScripts.decompositionCache import allinitCommands
 
 class SeakeepingCase(OfRun):
     """Class used to generate a CFD seakeeping case.
@@ -149,10 +151,15 @@ class SeakeepingCase(OfRun):
                              nInnerCorrectors   = 4,
                              rhoWater           = 1025.,
                              nProcs             = 1,
+                             cellsPerCore       = 50000,
+                             coresPerNode       = None,
+                             decompMethod       = "scotch",
                              OFversion          = 5,
                              application        = 'foamStar',
                              clean              = False,
                              stlFile            = None,    # Require only for EulerCell and addDamping
+                             meshLinkMode       = "copy",
+                             decompositionCache = None,
                              ):
         """Build mesh for CFD seakeeping case from a few parameters.
 
@@ -165,7 +172,7 @@ class SeakeepingCase(OfRun):
         meshDir : str, default 'mesh'
             Path to mesh directory
         meshTime : int or str, default'constant'
-            Name of folder containing mesh in meshDir
+            Name of folder containing mesh in meshDir ('latestTime' for the last time folder)
         startTime : str, default 'latestTime'
             String defining simulation startTime parameter
         endTime : float, default 1000
@@ -284,8 +291,14 @@ class SeakeepingCase(OfRun):
         nInnerCorrectors: float, default 4        
         rhoWater : float, default 1025.
             Water density
-        nProcs : int, default 1
-            Number of processors
+        nProcs : int or 'auto', default 1
+            Number of processors. With 'auto', it is derived from the number of cells of the mesh (see cellsPerCore)
+        cellsPerCore : int, default 50000
+            Target number of cells per core, used when nProcs is 'auto'
+        coresPerNode : int, default None
+            Number of cores per cluster node. If given, 'auto' nProcs is rounded up to full nodes.
+        decompMethod : str, default "scotch"
+            Decomposition method. With "simple" and "hierarchical", subdivisions are chosen from the mesh bounding box.
         OFversion : int or str, default 5
             OpenFOAM version number
         application : str, default 'foamStar'
@@ -298,6 +311,12 @@ class SeakeepingCase(OfRun):
             OpenFOAM version
         clean : boolean, default False
             Logical to force case overwrite
+        meshLinkMode : str, default "copy"
+            How the mesh is copied from meshDir : "copy", "hardlink", "reflink" or "auto" (see OfCase.copyMesh).
+            Links allow several cases to share the same mesh files.
+        decompositionCache : str, default None
+            Directory of the decomposed mesh cache (see pythonScripts.decompositionCache). If given, the mesh
+            decomposition is reused from cases with the same mesh and decomposition settings.
 
         """
 
@@ -393,8 +412,16 @@ class SeakeepingCase(OfRun):
                                       application   = application )
 
         #decomposeParDict
+        if str(meshTime) == 'latestTime': meshTime = getFoamTimeFolders(meshDir)[-1]
+        if nProcs == 'auto':
+            nCells = getNCells(os.path.join(meshDir,str(meshTime),'polyMesh'))
+            nProcs = getNProcs(nCells, cellsPerCore=cellsPerCore, coresPerNode=coresPerNode)
+            print('Mesh with {} cells, run on {} processors'.format(nCells, nProcs))
+        bBox = getBounds(os.path.join(meshDir,str(meshTime),'polyMesh'))
         decomposeParDict = DecomposeParDict.Build(case    = case,
-                                                  nProcs  = nProcs )
+                                                  nProcs  = nProcs,
+                                                  method  = decompMethod,
+                                                  bBox    = bBox )
 
         #waveProperties
         if wave is not None:
@@ -413,7 +440,6 @@ class SeakeepingCase(OfRun):
             raise(Exception('No or incomplete wave properties provided. Please provide "wave" or all the following parameters ("waveType","waveH","waveT").'))
 
         relaxZones = []
-        bBox = getBounds(os.path.join(meshDir,str(meshTime),'polyMesh'))
         if sideRelaxZone is not None:
             relaxSide   = RelaxZone( "side"  , relax=True, waveCondition=waveCond, origin=[0., bBox[1][1], 0.], orientation = [  0. , -1. , 0.], length=sideRelaxZone)
             relaxZones += [relaxSide]
@@ -559,6 +585,7 @@ class SeakeepingCase(OfRun):
                           boundaryPointDisplacement = boundaryPointDisplacement,
                           setSelections             = setSelections,
                           clean                     = clean,
+                          coresPerNode              = coresPerNode,
                           application               = application )
 
         res.meshMotion = meshMotion
@@ -570,8 +597,9 @@ class SeakeepingCase(OfRun):
         res.EulerCellsDist = EulerCellsDist
         res.nRelaxZones = len(relaxZones)
         res.nModesToUse = nModesToUse
+        res.decompositionCache = decompositionCache
 
-        res.copyMesh(meshDir,meshTime)
+        res.copyMesh(meshDir,meshTime, linkMode=meshLinkMode)
         res.setBoundaries()
 
         res.writeFiles()
@@ -584,6 +612,7 @@ class SeakeepingCase(OfRun):
 
     def setBoundaries(self):
         boundfile = os.path.join(self.constfolder_,"polyMesh","boundary")
+        unlinkFile(boundfile)
         boundDict = ParsedParameterFile(boundfile,boundaryDict=True)
         nbound = int(len(boundDict)/2)
         idMerge = []
@@ -629,8 +658,8 @@ class SeakeepingCase(OfRun):
                 #copy STL
                 f.write('function copySTL()\n')
                 f.write('{\n')
-                fin  = os.path.join(os.getcwd(),self.meshDir,'constant','triSurface',self.stlFile)
-                fout = os.path.join(os.getcwd(),self.case,'constant','triSurface')
+                fin  = os.path.join(os.path.abspath(self.meshDir),'constant','triSurface',self.stlFile)
+                fout = os.path.join(self.case,'constant','triSurface')
                 f.write('    mkdir constant/triSurface \n'.format(fin,fout))
                 f.write('    cp -r {:s} {:s}\n'.format(fin,fout))
                 f.write('}\n\n')
@@ -658,7 +687,10 @@ class SeakeepingCase(OfRun):
             f.write('    cp -rf ./0/org/* ./0/\n')
             if self.nModesToUse > 0: f.write('    initFlx initFlexDict\n')
             if self.nProcs > 1:
-                f.write('    decomposePar -cellDist\n')
+                if getattr(self, "decompositionCache", None) is not None:
+                    for line in allinitCommands(os.path.abspath(self.decompositionCache)) : f.write(line)
+                else:
+                    f.write('    decomposePar -cellDist\n')
                 f.write('    mpirun -np {} initWaveField -parallel\n'.format(self.nProcs))
             else:
                 f.write('    initWaveField\n')
@@ -692,13 +724,9 @@ class SeakeepingCase(OfRun):
     def runInit(self):
         import subprocess
         print("Run initialization")
-        os.chdir(self.case)
-        subprocess.call(["/bin/bash", "Allinit"], shell=False)
-        os.chdir("..")
+        return subprocess.call(["/bin/bash", "Allinit"], shell=False, cwd=self.case)
 
     def run(self):
         import subprocess
         print("Run")
-        os.chdir(self.case)
-        subprocess.call(["/bin/bash", "Allrun"], shell=False)
-        os.chdir("..")
\ No newline at end of file
+        return subprocess.call(["/bin/bash", "Allrun"], shell=False, cwd=self.case)
\ No newline at end of file
@@ -15,12 +15,428 @@
 import os
 import shutil
 import math as mt
-from pythonScripts.fsTools import findBoundingBox, findSTLPatches, translateStl, rotateStl, simpleGrading, simpleGradingN
+import numpy as np
+from pythonScripts.grading import gradingN, gradingNodes, gradedGrid
+from pythonScripts.stlTools import Stl, mergeStlFiles
+from pythonScripts.meshTools import getNProcs
+from ideFoam.meshEstimator import CellCountEstimator, expandBox, memoryEstimate
 
 from ideFoam.ofMesher import OfMesher
 from ideFoam.inputFiles import ControlDict, FvSchemes, FvSolution, DecomposeParDict,ExtrudeMeshDict
 from ideFoam.inputFiles import BlockMeshDict, SetSelection, RefineMeshDict, SurfaceFeatureExtractDict, SnappyHexMeshDict
 
+def seakeepingGeometry(shipBBRot,
+                       LOA,
+                       domain         = [-3.0,2.5, -2.0,2.0, -1.5,0.5],
+                       side           = 'port',
+                       fsZone         = None,
+                       fsCellHeight   = None,
+                       fsCellRatio    = 4,
+                       refBow         = False,
+                       refBowLength   = None,
+                       refStern       = False,
+                       refSternLength = None,
+                       refFS          = True,
+                       refBoxType     = 'wave',
+                       refBoxData     = [3],
+                       refBoxRatio    = 3,
+                       refCellBuffer  = 4,
+                       refSurfExtra   = None,
+                       stlName        = 'ship'):
+    """Compute background grid and refinement regions of a seakeeping mesh, without writing anything.
+
+    Parameters
+    ----------
+    shipBBRot : list of float
+        Bounding box of the ship, in mesh position [xmin, ymin, zmin, xmax, ymax, zmax]
+    LOA : float
+        Characteristic length
+
+    Other parameters are the ones of SeakeepingMesher.BuildFromParams
+
+    Returns
+    -------
+    dict with keys "domain", "fsZone", "fsCellHeight", "cellWidth", "Xcells", "Ycells", "zCellSize", "zAllCut",
+    "zAllCutNCells", "zAllCutRatio", "zGrid", "refBoxBB", "nxy", "locationInMesh", "outsidePoints" and "refinements"
+    (list of dict with "name", "selType", "BB", "stlFile", "distance" and "directions", in the order they are applied)
+    """
+
+    #Input lists are modified below, work on copies
+    domain = list(domain)
+    refBoxData = list(refBoxData)
+    fsZone = [0.02*LOA, 0.01*LOA] if fsZone is None else list(fsZone)
+    fsCellHeight = fsZone[1] / 3 if fsCellHeight is None else fsCellHeight
+
+    #set default refinement values
+    if (refBow and refBowLength is None): refBowLength = 0.20 * LOA
+    if (refStern and refSternLength is None): refSternLength = 0.20 * LOA
+
+    if side == 'port': domain[2] = 0
+    elif side == 'starboard': domain[3] = 0
+    domain = [ round(LOA*val, 3) for val in domain ]
+
+    locationInMesh = [0.5*(domain[1]+shipBBRot[3]), 0.5*(domain[3]+domain[2]), 0.5*(domain[5]+domain[4])]
+
+    ###FORMER ROUTINE : createBlockMeshDict
+    nRefBox = int(refBoxData[0])    # how many refinement box? minimum is 1
+
+    # The inner cell size is defined by fsCellHeight
+    dZ = [ 0 for i in range(nRefBox+2)]
+    dZ[nRefBox+1] = round(fsCellHeight, 5)
+    for i in range(nRefBox, -1, -1):
+        dZ[i] = dZ[i+1]*2
+
+    # keep is in a reverse order: i.e. level [n+1, n, n-1, n-2,..., 0]
+    dZ = dZ[::-1]
+    zCellSize = list(dZ)
+
+    # horizontal cells for the whole domain
+    cellWidth = dZ[-2]*fsCellRatio
+    Xcells = int((domain[1]-domain[0])/cellWidth)
+    Ycells = int((domain[3]-domain[2])/cellWidth)
+
+    # update domain data
+    domain[0] = round(domain[1] - cellWidth*Xcells, 3)
+    if side == 'port':
+        domain[3] = round(domain[2] + cellWidth*Ycells, 3)
+    elif side == 'starboard':
+        domain[2] = round(domain[3] - cellWidth*Ycells, 3)
+    elif side == 'both':
+        if (Ycells % 2 != 0):
+            Ycells += 1 # we need this to be even
+        domain[2] = -round(cellWidth*Ycells/2, 3)
+        domain[3] = round(cellWidth*Ycells/2, 3)
+    else:
+        print("\nUnknown parameters, side=",side)
+        raise SystemExit('abort ...')
+
+    # compute vertical thickness of each box
+    # All boxes must be larger than the ship's bounding box
+    fsCellTop = int(mt.ceil(round(abs(fsZone[1])/(fsCellHeight),1)))
+    fsCellBottom = int(mt.ceil(round(abs(fsZone[0])/(fsCellHeight),1)))
+    fsZmax = fsCellTop*fsCellHeight
+    fsZmin = -fsCellBottom*fsCellHeight
+    fsZone[1] = fsZmax
+    fsZone[0] = fsZmin
+
+    # z-cuts in lower block
+    lowerCutNCells = refCellBuffer
+    lowerCut = fsZone[0] - dZ[1] * lowerCutNCells;
+    while (lowerCut > (shipBBRot[2]-refCellBuffer*dZ[1])) | (lowerCutNCells < refCellBuffer):
+        lowerCut -= dZ[1]
+        lowerCutNCells += 1
+    lowerCutNCells = [lowerCutNCells]
+    lowerCut = [lowerCut]
+
+    #for i in range(1, nRefBox):
+    #    lowerCutNCells.append(refCellBuffer)
+    #    lowerCut.append(lowerCut[i-1] - refCellBuffer*dZ[i+1])
+
+    # z-cuts in upper block
+    upperCutNCells = refCellBuffer
+    upperCut = fsZone[1] + dZ[1] * upperCutNCells
+    while (upperCut < (shipBBRot[5] + refCellBuffer*dZ[1])) | (upperCutNCells < refCellBuffer):
+        upperCut += dZ[1]
+        upperCutNCells += 1
+    upperCutNCells = [upperCutNCells]
+    upperCut = [upperCut]
+
+    #for i in range(1, nRefBox):
+    #    upperCutNCells.append(refCellBuffer)
+    #    upperCut.append(upperCut[i-1] + refCellBuffer*dZ[i+1])
+
+    # compute grading at the top/bottom block(s)
+    ZratioTop = cellWidth/dZ[-nRefBox-1]
+    dx1 = dZ[-nRefBox-1]/abs(domain[5]-upperCut[-1])
+    ZcellsTop = gradingN(dx1, ZratioTop)
+    ZratioBottom = cellWidth/dZ[-nRefBox-1]
+    dx1 = dZ[-nRefBox-1]/abs(domain[4]-lowerCut[-1])
+    ZcellsBottom = gradingN(dx1, ZratioBottom)
+    ZratioBottom = 1.0/ZratioBottom
+
+    # collect all z-cut
+    zAllCut = lowerCut[::-1] + [fsZone[0], 0, fsZone[1]] + upperCut + [domain[5]]
+    zAllCutNCells = [ZcellsBottom] + lowerCutNCells[::-1] + [fsCellBottom, fsCellTop] + upperCutNCells + [ZcellsTop]
+    zAllCutRatio = [ZratioBottom] + list(1 for i in range(len(lowerCut)*2+2)) + [ZratioTop]
+
+    # compute vertical position of all grid points
+    zGrid = gradedGrid(domain[4], zAllCut, zAllCutNCells, zAllCutRatio)
+    zGridDelta = np.diff(zGrid)
+
+    # compute vertical extension for all refBox (first cell small enough, below and above the free surface zone)
+    dx = cellWidth/2.0
+    refBoxZdata = [float(zGrid[0])]*nRefBox + [float(zGrid[-1])]*nRefBox
+    for i in range(nRefBox):
+        below = np.nonzero( (zGrid[:-1] < fsZone[0]) & (zGridDelta < dx*1.25) )[0]
+        if len(below) > 0:
+            refBoxZdata[i] = float(zGrid[below[0]])
+        above = np.nonzero( (zGrid[1:] > fsZone[1]) & (zGridDelta < dx*1.25) )[0]
+        if len(above) > 0:
+            refBoxZdata[-i-1] = float(zGrid[above[-1]+1])
+        dx /= 2.0
+
+    # compute x,y data for refBox
+    if (len(refBoxData) == 1):
+        grad = gradingNodes(nRefBox+1, refBoxRatio)
+        xGradMin = [abs(val-1.0) for val in grad[::-1]]
+        xGradMax = grad
+        yGradMin = [abs(val-1.0) for val in grad[::-1]]
+        yGradMax = grad
+        #
+        xCutMin = [(shipBBRot[0]-domain[0])*val for val in xGradMin]
+        del xCutMin[0], xCutMin[-1]
+        for i in range(len(xCutMin)):
+            xCutMin[i] = cellWidth*int(round(xCutMin[i]/cellWidth))
+        xCutMin = [domain[0] + val for val in xCutMin]
+        #
+        if side=='port':
+            yCutMin = [-1e-3 for val in xCutMin]
+        else:
+            yCutMin = [(shipBBRot[1]-domain[2])*val for val in yGradMin]
+            del yCutMin[0], yCutMin[-1]
+            for i in range(len(yCutMin)):
+                yCutMin[i] = cellWidth*int(round(yCutMin[i]/cellWidth))
+            yCutMin = [domain[2] + val for val in yCutMin]
+        #
+        if refBoxType=='wave':
+            xCutMax = [domain[1]+1e-3 for val in xCutMin]
+        elif refBoxType=='kelvin':
+            print("not yet implemented")
+        else:
+            xCutMax = [(domain[1]-shipBBRot[3])*val for val in xGradMax]
+            del xCutMax[0], xCutMax[-1]
+            for i in range(len(xCutMax)):
+                xCutMax[i] = cellWidth*int(round(xCutMax[i]/cellWidth))
+            xCutMax = [shipBBRot[3] + val for val in xCutMax]
+        #
+        if side=='starboard':
+            yCutMax = [1e-3 for val in xCutMin]
+        else:
+            yCutMax = [(domain[3]-shipBBRot[4])*val for val in yGradMax]
+            del yCutMax[0], yCutMax[-1]
+            for i in range(len(yCutMax)):
+                yCutMax[i] = cellWidth*int(round(yCutMax[i]/cellWidth))
+            yCutMax = [shipBBRot[4] + val for val in yCutMax]
+            yCutMax = yCutMax[::-1]
+        #
+        # update refBoxData
+        for i in range(len(xCutMin)):
+            refBoxData.append(xCutMin[i])
+            refBoxData.append(xCutMax[i])
+            refBoxData.append(yCutMin[i])
+            refBoxData.append(yCutMax[i])
+
+
+    ###FORMER ROUTINE : createBackGroundMesh
+    # how many refinement boxes ? minimum is 1
+    refBoxBB = []
+    if len(refBoxData)>1:
+        if nRefBox != (len(refBoxData)-1)/4.:
+            raise SystemExit('Error: invalid data for refinement boxes, ', refBoxData)
+        for i in range(nRefBox):
+            refBoxBB.append([refBoxData[i*4+1], refBoxData[i*4+3], refBoxZdata[i], refBoxData[i*4+2], refBoxData[i*4+4], refBoxZdata[-i-1]])
+    else:
+        raise SystemExit('\nData for refinement box is missing.\nrefBoxData=[#n, #xmin,#xmax,#ymax,#ymax, #xmin,#xmax,#ymin,#ymax, ..., repeat n times]\nabort ...')
+
+    # number of level(s) for uniform 'xy'-refinement
+    nxy = int(mt.log(abs(float(fsCellRatio)), float(2))) - 1
+
+    # refine free surface (using proximity method)
+    distance = fsCellHeight*refCellBuffer*2.0*(nxy-1.0 + nRefBox-1.0 + float(refBow | refStern | refFS))
+
+    lastInnerBox = refBoxBB[-1]
+    if lastInnerBox[0] > (shipBBRot[0] - distance - cellWidth*refCellBuffer/mt.pow(2.0, float(nRefBox))):
+        diff = lastInnerBox[0] - (shipBBRot[0] - distance - cellWidth*refCellBuffer/mt.pow(2.0, float(nRefBox)))
+        for i in range(len(refBoxBB)):
+            refBoxBB[i][0] -= diff
+    if lastInnerBox[1] > (shipBBRot[1] - distance - cellWidth*refCellBuffer/mt.pow(2.0, float(nRefBox))):
+        diff = lastInnerBox[1] - (shipBBRot[1] - distance - cellWidth*refCellBuffer/mt.pow(2.0, float(nRefBox)))
+        for i in range(len(refBoxBB)):
+            refBoxBB[i][1] -= diff
+    if lastInnerBox[2] > (shipBBRot[2] - distance - zCellSize[1]*refCellBuffer):
+        diff = lastInnerBox[2] - (shipBBRot[2] - distance - zCellSize[1]*refCellBuffer)
+        for i in range(len(refBoxBB)):
+            refBoxBB[i][2] -= diff
+    if lastInnerBox[3] < (shipBBRot[3] + distance + cellWidth*refCellBuffer/mt.pow(2.0, float(nRefBox))):
+        diff = -lastInnerBox[3] + shipBBRot[3] + distance + cellWidth*refCellBuffer/mt.pow(2.0, float(nRefBox))
+        for i in range(len(refBoxBB)):
+            refBoxBB[i][3] += diff
+    if lastInnerBox[4] < (shipBBRot[4] + distance + cellWidth*refCellBuffer/mt.pow(2.0, float(nRefBox))):
+        diff = -lastInnerBox[4] + shipBBRot[4] + distance + cellWidth*refCellBuffer/mt.pow(2.0, float(nRefBox))
+        for i in range(len(refBoxBB)):
+            refBoxBB[i][4] += diff
+    if lastInnerBox[5] < (shipBBRot[5] + distance + zCellSize[1]*refCellBuffer):
+        diff = -lastInnerBox[5] + shipBBRot[5] + distance + zCellSize[1]*refCellBuffer
+        for i in range(len(refBoxBB)):
+            refBoxBB[i][5] += diff
+
+    # this is a point outside ship.stl
+    outsidePoints = [0.5*(shipBBRot[0]+shipBBRot[3]), 0.5*(shipBBRot[1]+shipBBRot[4])+abs(shipBBRot[1]-shipBBRot[4]), 0.5*(shipBBRot[2]+shipBBRot[5])]
+
+    refinements = []
+    def addRefinement(name, BB, directions, selType='proximity', stlFile=stlName, distance=None):
+        refinements.append( { "name" : name, "selType" : selType, "BB" : None if BB is None else list(BB),
+                              "stlFile" : stlFile, "distance" : distance, "directions" : directions } )
+
+    for i, BB in enumerate(refBoxBB):
+        addRefinement('x_'+str(i), BB[:4] + [domain[3]] + BB[5:], 'tan1', selType='box')   # YmaxDomain
+    for i, BB in enumerate(refBoxBB):
+        addRefinement('y_'+str(i), BB, 'tan2', selType='box')
+
+    for i in range(nxy):
+        addRefinement('xy_'+str(i), None, 'tan1 tan2', distance=distance)
+        distance *= 0.5
+
+    addRefinement('xy', [-1e6,-1e6,fsZmin,1e6,1e6,fsZmax], 'tan1 tan2', distance=distance)
+    addRefinement('xyz1', [-1e6,-1e6,-1e6,1e6,1e6,fsZmin], 'tan1 tan2 normal', distance=distance)
+    addRefinement('xyz2', [-1e6,-1e6,fsZmax,1e6,1e6,1e6], 'tan1 tan2 normal', distance=distance)
+
+    # align cutting locations
+    if not refBow: refBowLength = 0.2*(shipBBRot[3]-shipBBRot[0])
+    refBowLength = shipBBRot[3]-refBowLength
+    refBowLength = domain[1]-mt.ceil((domain[1]-refBowLength)/fsCellHeight)*fsCellHeight
+    if refBow:
+        distance *= 0.5
+        addRefinement('xyz3', [refBowLength,-1e6,-1e6,1e6,1e6,shipBBRot[5]-fsCellHeight*refCellBuffer], 'tan1 tan2 normal', distance=distance)
+
+    if refSurfExtra is not None:
+        nameOnly = os.path.basename(refSurfExtra)
+        BB = [refBow+0.5*fsCellHeight*refCellBuffer,-1e6,-1e6,1e6,1e6,shipBBRot[5]-1.5*fsCellHeight*refCellBuffer]
+        addRefinement('xyz4', BB, 'tan1 tan2 normal', stlFile=nameOnly, distance=0.5*distance)
+
+    # align cutting locations
+    if not refStern: refSternLength = 0.2*(shipBBRot[3]-shipBBRot[0])
+    refSternLength = shipBBRot[0]+refSternLength
+    refSternLength = domain[1]-mt.floor((domain[1]-refSternLength)/fsCellHeight)*fsCellHeight
+    if refStern:
+        if not refBow: distance *= 0.5
+        addRefinement('xyz5', [-1e6,-1e6,-1e6,refSternLength,1e6,shipBBRot[5]-fsCellHeight*refCellBuffer], 'tan1 tan2 normal', distance=distance)
+
+    if refSurfExtra is not None:
+        nameOnly = os.path.basename(refSurfExtra)
+        BB = [-1e6,-1e6,-1e6,refSternLength-0.5*fsCellHeight*refCellBuffer,1e6,shipBBRot[5]-1.5*fsCellHeight*refCellBuffer]
+        addRefinement('xyz6', BB, 'tan1 tan2 normal', stlFile=nameOnly, distance=0.5*distance)
+
+    if refFS & (refBow | refStern):
+        addRefinement('z', [refSternLength,-1e6,fsZmin,refBowLength,1e6,fsZmax], 'normal', distance=distance)
+
+    return { "domain"         : domain,
+             "fsZone"         : fsZone,
+             "fsCellHeight"   : fsCellHeight,
+             "cellWidth"      : cellWidth,
+             "Xcells"         : Xcells,
+             "Ycells"         : Ycells,
+             "zCellSize"      : zCellSize,
+             "zAllCut"        : zAllCut,
+             "zAllCutNCells"  : zAllCutNCells,
+             "zAllCutRatio"   : zAllCutRatio,
+             "zGrid"          : zGrid,
+             "refBoxBB"       : refBoxBB,
+             "nxy"            : nxy,
+             "locationInMesh" : locationInMesh,
+             "outsidePoints"  : outsidePoints,
+             "refinements"    : refinements,
+           }
+
+
+def refinementRegion(refinement, shipBB, stlName='ship'):
+    """Box [xmin, ymin, zmin, xmax, ymax, zmax] containing all cells selected by a refinement of seakeepingGeometry
+    """
+    BB = [-np.inf]*3 + [np.inf]*3 if refinement["BB"] is None else refinement["BB"]
+    if refinement["selType"] == "box" or refinement["stlFile"] != stlName:
+        return list(BB)
+    return expandBox(shipBB, refinement["distance"], BB)
+
+
+def _disjoint(BB1, BB2):
+    return any( BB1[i+3] <= BB2[i] or BB2[i+3] <= BB1[i] for i in range(3) )
+
+
+def planRefinements(refinements, shipBB, stlName='ship', cellSize=None):
+    """Group refinements (see seakeepingGeometry) in a minimal sequence of refineMesh passes
+
+    A refinement joins an earlier pass with the same directions if its selection, padded by cellSize, does not overlap
+    any refinement of that pass, nor of the passes after it. As refined cells are smaller than the background cells,
+    a cell split by one of these refinements can then neither be nor contain a cell selected by the moved one, so that
+    moving it earlier does not change the result.
+
+    Parameters
+    ----------
+    cellSize : list of float, default None
+        Background cell size in x, y and z (largest one). If None, regions are not padded and cells straddling the
+        boundary of a region may be selected differently.
+
+    Returns
+    -------
+    List of passes, each being a list of refinements
+    """
+    pad = [0., 0., 0.] if cellSize is None else cellSize
+    passes = []
+    for ref in refinements:
+        region = refinementRegion(ref, shipBB, stlName)
+        region = [ region[i] - pad[i] for i in range(3) ] + [ region[i+3] + pad[i] for i in range(3) ]
+        target = None
+        for p in reversed(passes):
+            if not all( _disjoint(region, refinementRegion(r, shipBB, stlName)) for r in p ):
+                break
+            if p[0]["directions"] == ref["directions"]:
+                target = p
+        if target is None:
+            passes.append([ref])
+        else:
+            target.append(ref)
+    return passes
+
+
+def estimateCells(geometry, shipBBRot, nLayers=3, fillRatio=0.7, hullArea=None, application="foamStar"):
+    """Estimate number of cells and memory of a seakeeping mesh from its geometry (see seakeepingGeometry)
+
+    Parameters
+    ----------
+    geometry : dict
+        Output of seakeepingGeometry
+    shipBBRot : list of float
+        Bounding box of the ship, in mesh position [xmin, ymin, zmin, xmax, ymax, zmax]
+    nLayers : int, default 3
+        Number of boundary layers
+    fillRatio : float, default 0.7
+        Ratio between ship volume and bounding box volume
+    hullArea : float, default None
+        Area of the meshed ship surface (default from bounding box)
+    application : str, default "foamStar"
+        Application used for the memory estimate
+
+    Returns
+    -------
+    dict with "background", "refined" and "final" cell counts, "removed" and "layers" (cells removed by and added
+    by snappyHexMesh), "stages" (list of (refinement name, number of cells)) and "memory" (GB)
+    """
+    domain = geometry["domain"]
+    est = CellCountEstimator( np.linspace(domain[0], domain[1], geometry["Xcells"]+1),
+                              np.linspace(domain[2], domain[3], geometry["Ycells"]+1),
+                              geometry["zGrid"] )
+    domainBB = [domain[0], domain[2], domain[4], domain[1], domain[3], domain[5]]
+    stages = []
+    for ref in geometry["refinements"]:
+        clip = domainBB if ref["BB"] is None else [ max(a, b) for a, b in zip(ref["BB"][:3], domainBB[:3]) ] + [ min(a, b) for a, b in zip(ref["BB"][3:], domainBB[3:]) ]
+        BB = clip if ref["selType"] == "box" else expandBox(shipBBRot, ref["distance"], clip)
+        est.refine(BB, ref["directions"])
+        stages.append( (ref["name"], est.nCells) )
+
+    refined = est.nCells
+    hullBB = expandBox(shipBBRot, 0., domainBB)
+    removed, layers = est.snap(hullBB, fillRatio = fillRatio, area = hullArea, nLayers = nLayers)
+    final = refined - removed + layers
+    return { "background" : est.nBackground,
+             "refined"    : refined,
+             "removed"    : removed,
+             "layers"     : layers,
+             "final"      : final,
+             "stages"     : stages,
+             "memory"     : memoryEstimate(final, application),
+           }
+
+
 class SeakeepingMesher( OfMesher ):
     """Class used to generate a CFD mesh for seakeeping cases.
     It should be called by a python script as presented in the following example
@@ -55,6 +471,9 @@ class SeakeepingMesher( OfMesher ):
     @classmethod
     def BuildFromParams(cls,    case,
                                 nProcs           = 4,
+                                cellsPerCore     = 50000,
+                                coresPerNode     = None,
+                                decompMethod     = "scotch",
                                 stlFiles         = None,
                                 stlName          = 'ship',
                                 refCellBuffer       = 4,
@@ -80,6 +499,7 @@ class SeakeepingMesher( OfMesher ):
                                 application      = "snappyHexMesh",
                                 OFversion        = 5,
                                 onLiger          = False,
+                                parallelRefine   = False,
                                 clean            = "i"
                                 ):
         """Build mesh for CFD seakeeping mesh form a few parameters.
@@ -88,8 +508,14 @@ class SeakeepingMesher( OfMesher ):
         ----------
         case : str
             Name of case to create
-        nProcs : int, default 4
-            Number of processors used to build the mesh
+        nProcs : int or 'auto', default 4
+            Number of processors used to build the mesh. With 'auto', it is derived from the number of cells (see cellsPerCore)
+        cellsPerCore : int, default 50000
+            Target number of cells per core, used when nProcs is 'auto'
+        coresPerNode : int, default None
+            Number of cores per cluster node. If given, 'auto' nProcs is rounded up to full nodes.
+        decompMethod : str, default "scotch"
+            Decomposition method. With "simple" or "hierarchical", subdivisions are chosen from the background mesh.
         stlFiles : list of stings
             List of STl files names to be used for snapping
         stlName : str, default 'ship'
@@ -140,6 +566,7 @@ class SeakeepingMesher( OfMesher ):
             Number of cells between each refinement level
         refSurfExtra : str
             STL file of regions where extra refinement in bow/stern areas with strong curvatures will be applied.
+            As stlFiles, a relative path is relative to the current folder (not to the case folder).
 
         shipBL : list of float, default [3, 1.3, 0.7, 0.7]
              Dimension for boundary layers (relative to cell size)
@@ -153,6 +580,8 @@ class SeakeepingMesher( OfMesher ):
             OpenFOAM version
         onLiger : boolean, default False
             Logical defining if case is run on Liger cluster
+        parallelRefine : boolean, default False
+            Decompose the background mesh right after blockMesh and run the refinement stages in parallel (if nProcs > 1)
         clean : boolean, default False
             Logical to force case overwrite
 
@@ -162,62 +591,79 @@ class SeakeepingMesher( OfMesher ):
         # create ship.stl and compute bounding box(es)
         if not isinstance(stlFiles, list): stlFiles = [stlFiles]
         stlFiles = [os.path.abspath( f ) for f in stlFiles]
+        if refSurfExtra is not None: refSurfExtra = os.path.abspath( refSurfExtra )
 
-        cwd_save = os.getcwd()
-
-        #Work in the case directory, to get temporary file there.
+        #Temporary files are written in the case directory (no change of working directory)
         SeakeepingMesher.makeCaseFolder(case, clean)
-        os.chdir(case)
 
         filename = os.path.join(case, stlName+'_tmp.stl')
         if os.path.isfile(filename): os.remove(filename)
 
-        with open(filename, 'w') as outfile:
-            for fstl in stlFiles:
-                if not fstl.endswith('.stl'): fstl += '.stl'
-                if not os.path.isfile(fstl): raise SystemExit('File not found : {}'.format(fstl))
-                with open(fstl) as infile:
-                    for line in infile:
-                        outfile.write(line)
+        stlFiles = [ fstl if fstl.endswith('.stl') else fstl+'.stl' for fstl in stlFiles ]
+        for fstl in stlFiles:
+            if not os.path.isfile(fstl): raise SystemExit('File not found : {}'.format(fstl))
+        yaw = heading-180.0
 
-        shipPatches = findSTLPatches(filename)
+        if draft is None and yaw == 0.0:
+            #No transformation, files are only concatenated
+            ship = None
+            shipPatches, shipBB = mergeStlFiles(stlFiles, filename, boundingBox=True)
+        else:
+            ship = Stl.merge([Stl.read(fstl) for fstl in stlFiles])
+            shipPatches, shipBB = ship.solidNames, ship.boundingBox
         print("Found patches in stl: ", shipPatches)
-        shipBB = findBoundingBox(filename)
+        print("STL bounding box: ", shipBB)
 
         if draft is not None:
             draft = abs(float(draft))
             print("Set draft:",draft)
             move = -shipBB[2] - draft
-            translateStl(filename, [0.0,0.0,move], filename)
+            ship.translate([0.0,0.0,move])
             shipBB[2] += move
             shipBB[5] += move
 
         if refSurfExtra is not None:
             nameOnly = os.path.basename(refSurfExtra)
-            surfFile = "./constant/triSurface/"+nameOnly
+            surfFile = os.path.join(case, "constant", "triSurface", nameOnly)
+            if not os.path.exists(os.path.dirname(surfFile)): os.makedirs(os.path.dirname(surfFile))
             print("Create stl: "+surfFile)
-            shutil.copyfile(refSurfExtra,surfFile)
             if draft is not None:
-                translateStl(surfFile, [0.0,0.0,move], surfFile)
+                Stl.read(refSurfExtra).translate([0.0,0.0,move]).write(surfFile)
+            else:
+                shutil.copyfile(refSurfExtra,surfFile)
 
-        if rotateStl(filename, heading, filename):
-            shipBBRot = findBoundingBox(filename)
+        if yaw != 0.0:
+            print("Rotate stl (0 0 {})".format(yaw))
+            ship.rotate([0.0,0.0,yaw])
+            shipBBRot = ship.boundingBox
         else:
             shipBBRot = shipBB
+        if ship is not None:
+            ship.write(filename)
 
         LOA = shipBB[3] - shipBB[0] if LOA is None else LOA
-        fsZone = [0.02*LOA, 0.01*LOA] if fsZone is None else fsZone
-        fsCellHeight = fsZone[1] / 3 if fsCellHeight is None else fsCellHeight
-
-        #set default refinement values
-        if (refBow and refBowLength is None): refBowLength = 0.20 * LOA
-        if (refStern and refSternLength is None): refSternLength = 0.20 * LOA
-
-        if side == 'port': domain[2] = 0
-        elif side == 'starboard': domain[3] = 0
-        domain = [ round(LOA*val, 3) for val in domain ]
-
-        locationInMesh = [0.5*(domain[1]+shipBBRot[3]), 0.5*(domain[3]+domain[2]), 0.5*(domain[5]+domain[4])]
+        geometry = seakeepingGeometry(shipBBRot, LOA,
+                                      domain         = domain,
+                                      side           = side,
+                                      fsZone         = fsZone,
+                                      fsCellHeight   = fsCellHeight,
+                                      fsCellRatio    = fsCellRatio,
+                                      refBow         = refBow,
+                                      refBowLength   = refBowLength,
+                                      refStern       = refStern,
+                                      refSternLength = refSternLength,
+                                      refFS          = refFS,
+                                      refBoxType     = refBoxType,
+                                      refBoxData     = refBoxData,
+                                      refBoxRatio    = refBoxRatio,
+                                      refCellBuffer  = refCellBuffer,
+                                      refSurfExtra   = refSurfExtra,
+                                      stlName        = stlName)
+        domain = geometry["domain"]
+        zAllCut = geometry["zAllCut"]
+        Xcells, Ycells = geometry["Xcells"], geometry["Ycells"]
+        refBoxBB = geometry["refBoxBB"]
+        nxy = geometry["nxy"]
 
         ###FORMER ROUTINE : foamCase_template
         print('Create system folder input files')
@@ -241,117 +687,16 @@ class SeakeepingMesher( OfMesher ):
         fvSolution = FvSolution.Build(case = case )
 
         #decomposeParDict
-        decomposeParDict = DecomposeParDict.Build(case   = case,
-                                                  nProcs = nProcs)
-
-        ###FORMER ROUTINE : createBlockMeshDict
-        nRefBox = int(refBoxData[0])    # how many refinement box? minimum is 1
-
-        # The inner cell size is defined by fsCellHeight
-        dZ = [ 0 for i in range(nRefBox+2)]
-        dZ[nRefBox+1] = round(fsCellHeight, 5)
-        for i in range(nRefBox, -1, -1):
-            dZ[i] = dZ[i+1]*2
-
-        # keep is in a reverse order: i.e. level [n+1, n, n-1, n-2,..., 0]
-        dZ = dZ[::-1]
-        zCellSize = list(dZ)
-
-        # horizontal cells for the whole domain
-        cellWidth = dZ[-2]*fsCellRatio
-        Xcells = int((domain[1]-domain[0])/cellWidth)
-        Ycells = int((domain[3]-domain[2])/cellWidth)
-
-        # update domain data
-        domain[0] = round(domain[1] - cellWidth*Xcells, 3)
-        if side == 'port':
-            domain[3] = round(domain[2] + cellWidth*Ycells, 3)
-        elif side == 'starboard':
-            domain[2] = round(domain[3] - cellWidth*Ycells, 3)
-        elif side == 'both':
-            if (Ycells % 2 != 0):
-                Ycells += 1 # we need this to be even
-            domain[2] = -round(cellWidth*Ycells/2, 3)
-            domain[3] = round(cellWidth*Ycells/2, 3)
-        else:
-            print("\nUnknown parameters, side=",side)
-            raise SystemExit('abort ...')
-
-        # compute vertical thickness of each box
-        # All boxes must be larger than the ship's bounding box
-        fsCellTop = int(mt.ceil(round(abs(fsZone[1])/(fsCellHeight),1)))
-        fsCellBottom = int(mt.ceil(round(abs(fsZone[0])/(fsCellHeight),1)))
-        fsZmax = fsCellTop*fsCellHeight
-        fsZmin = -fsCellBottom*fsCellHeight
-        fsZone[1] = fsZmax
-        fsZone[0] = fsZmin
-
-        # z-cuts in lower block
-        lowerCutNCells = refCellBuffer
-        lowerCut = fsZone[0] - dZ[1] * lowerCutNCells;
-        while (lowerCut > (shipBBRot[2]-refCellBuffer*dZ[1])) | (lowerCutNCells < refCellBuffer):
-            lowerCut -= dZ[1]
-            lowerCutNCells += 1
-        lowerCutNCells = [lowerCutNCells]
-        lowerCut = [lowerCut]
-
-        #for i in range(1, nRefBox):
-        #    lowerCutNCells.append(refCellBuffer)
-        #    lowerCut.append(lowerCut[i-1] - refCellBuffer*dZ[i+1])
-
-        # z-cuts in upper block
-        upperCutNCells = refCellBuffer
-        upperCut = fsZone[1] + dZ[1] * upperCutNCells
-        while (upperCut < (shipBBRot[5] + refCellBuffer*dZ[1])) | (upperCutNCells < refCellBuffer):
-            upperCut += dZ[1]
-            upperCutNCells += 1
-        upperCutNCells = [upperCutNCells]
-        upperCut = [upperCut]
-
-        #for i in range(1, nRefBox):
-        #    upperCutNCells.append(refCellBuffer)
-        #    upperCut.append(upperCut[i-1] + refCellBuffer*dZ[i+1])
-
-        # compute grading at the top/bottom block(s)
-        ZratioTop = cellWidth/dZ[-nRefBox-1]
-        dx1 = dZ[-nRefBox-1]/abs(domain[5]-upperCut[-1])
-        ZcellsTop = simpleGradingN(dx1, ZratioTop)
-        ZratioBottom = cellWidth/dZ[-nRefBox-1]
-        dx1 = dZ[-nRefBox-1]/abs(domain[4]-lowerCut[-1])
-        ZcellsBottom = simpleGradingN(dx1, ZratioBottom)
-        ZratioBottom = 1.0/ZratioBottom
-
-        # collect all z-cut
-        zAllCut = lowerCut[::-1] + [fsZone[0], 0, fsZone[1]] + upperCut + [domain[5]]
-        zAllCutNCells = [ZcellsBottom] + lowerCutNCells[::-1] + [fsCellBottom, fsCellTop] + upperCutNCells + [ZcellsTop]
-        zAllCutRatio = [ZratioBottom] + list(1 for i in range(len(lowerCut)*2+2)) + [ZratioTop]
-
-        # compute vertical position of all grid points
-        zGrid = [domain[4]]
-        for i in range(len(zAllCut)):
-            grad = simpleGrading(zAllCutNCells[i], zAllCutRatio[i])
-            L = zAllCut[i] - zGrid[-1]
-            zGrid = zGrid + [zGrid[-1]+L*grad[val] for val in range(1,len(grad)-1)]
-            zGrid.append(zAllCut[i])
-        zGridDelta = [zGrid[i+1]-zGrid[i] for i in range(0,len(zGrid)-1)]
-
-        # compute vertical extension for all refBox
-        dx = cellWidth/2.0
-        refBoxZdata = [zGrid[0]]*nRefBox + [zGrid[-1]]*nRefBox
-        for i in range(nRefBox):
-            for j in range(len(zGridDelta)):
-                if zGrid[j] >= fsZone[0]:
-                    break
-                if zGridDelta[j] < dx*1.25:
-                    refBoxZdata[i] = zGrid[j]
-                    break
-            for j in range(len(zGridDelta)):
-                if zGrid[-j-1] <= fsZone[1]:
-                    break
-                if zGridDelta[-j-1] < dx*1.25:
-                    refBoxZdata[-i-1] = zGrid[-j-1]
-                    break
-            dx /= 2.0
+        if nProcs == 'auto':
+            #Based on estimated number of cells after refinement
+            est = estimateCells(geometry, shipBBRot, nLayers = shipBL[0], application = "snappyHexMesh")
+            nCells = int(max(est["refined"], est["final"]))
+            nProcs = getNProcs(nCells, cellsPerCore=cellsPerCore, coresPerNode=coresPerNode)
+            print('Estimated mesh size {} cells, mesh on {} processors'.format(nCells, nProcs))
+        decomposeParDict = DecomposeParDict.Build(case       = case,
+                                                  nProcs     = nProcs,
+                                                  method     = decompMethod,
+                                                  cellCounts = [Xcells, Ycells, int(sum(geometry["zAllCutNCells"]))])
 
         print('Domain bounding box:')
         print("   ", [domain[0], domain[2], domain[4], domain[1], domain[3], domain[5]])
@@ -389,302 +734,38 @@ class SeakeepingMesher( OfMesher ):
                                             zmax        = zAllCut,
                                             Xcells      = Xcells,
                                             Ycells      = Ycells,
-                                            Zcells      = zAllCutNCells,
-                                            Zgrading    = zAllCutRatio,
+                                            Zcells      = geometry["zAllCutNCells"],
+                                            Zgrading    = geometry["zAllCutRatio"],
                                             createPatch = True,
                                             patches     = patches,
                                             OFversion   = OFversion)
 
-        # compute x,y data for refBox
-        if (len(refBoxData) == 1):
-            grad = simpleGrading(nRefBox+1, refBoxRatio)
-            xGradMin = [abs(val-1.0) for val in grad[::-1]]
-            xGradMax = grad
-            yGradMin = [abs(val-1.0) for val in grad[::-1]]
-            yGradMax = grad
-            #
-            xCutMin = [(shipBBRot[0]-domain[0])*val for val in xGradMin]
-            del xCutMin[0], xCutMin[-1]
-            for i in range(len(xCutMin)):
-                xCutMin[i] = cellWidth*int(round(xCutMin[i]/cellWidth))
-            xCutMin = [domain[0] + val for val in xCutMin]
-            #
-            if side=='port':
-                yCutMin = [-1e-3 for val in xCutMin]
-            else:
-                yCutMin = [(shipBBRot[1]-domain[2])*val for val in yGradMin]
-                del yCutMin[0], yCutMin[-1]
-                for i in range(len(yCutMin)):
-                    yCutMin[i] = cellWidth*int(round(yCutMin[i]/cellWidth))
-                yCutMin = [domain[2] + val for val in yCutMin]
-            #
-            if refBoxType=='wave':
-                xCutMax = [domain[1]+1e-3 for val in xCutMin]
-            elif refBoxType=='kelvin':
-                print("not yet implemented")
-            else:
-                xCutMax = [(domain[1]-shipBBRot[3])*val for val in xGradMax]
-                del xCutMax[0], xCutMax[-1]
-                for i in range(len(xCutMax)):
-                    xCutMax[i] = cellWidth*int(round(xCutMax[i]/cellWidth))
-                xCutMax = [shipBBRot[3] + val for val in xCutMax]
-            #
-            if side=='starboard':
-                yCutMax = [1e-3 for val in xCutMin]
-            else:
-                yCutMax = [(domain[3]-shipBBRot[4])*val for val in yGradMax]
-                del yCutMax[0], yCutMax[-1]
-                for i in range(len(yCutMax)):
-                    yCutMax[i] = cellWidth*int(round(yCutMax[i]/cellWidth))
-                yCutMax = [shipBBRot[4] + val for val in yCutMax]
-                yCutMax = yCutMax[::-1]
-            #
-            # update refBoxData
-            for i in range(len(xCutMin)):
-                refBoxData.append(xCutMin[i])
-                refBoxData.append(xCutMax[i])
-                refBoxData.append(yCutMin[i])
-                refBoxData.append(yCutMax[i])
-
-
         ###FORMER ROUTINE : createBackGroundMesh
-        # how many refinement boxes ? minimum is 1
-        refBoxBB = []
-        if len(refBoxData)>1:
-            if nRefBox != (len(refBoxData)-1)/4.:
-                raise SystemExit('Error: invalid data for refinement boxes, ', refBoxData)
-            for i in range(nRefBox):
-                refBoxBB.append([refBoxData[i*4+1], refBoxData[i*4+3], refBoxZdata[i], refBoxData[i*4+2], refBoxData[i*4+4], refBoxZdata[-i-1]])
-        else:
-            raise SystemExit('\nData for refinement box is missing.\nrefBoxData=[#n, #xmin,#xmax,#ymax,#ymax, #xmin,#xmax,#ymin,#ymax, ..., repeat n times]\nabort ...')
-
-        # number of level(s) for uniform 'xy'-refinement
-        nxy = int(mt.log(abs(float(fsCellRatio)), float(2))) - 1
-
-        # refine free surface (using proximity method)
-        distance = fsCellHeight*refCellBuffer*2.0*(nxy-1.0 + nRefBox-1.0 + float(refBow | refStern | refFS))
-
-        lastInnerBox = refBoxBB[-1]
-        if lastInnerBox[0] > (shipBBRot[0] - distance - cellWidth*refCellBuffer/mt.pow(2.0, float(nRefBox))):
-            diff = lastInnerBox[0] - (shipBBRot[0] - distance - cellWidth*refCellBuffer/mt.pow(2.0, float(nRefBox)))
-            for i in range(len(refBoxBB)):
-                refBoxBB[i][0] -= diff
-        if lastInnerBox[1] > (shipBBRot[1] - distance - cellWidth*refCellBuffer/mt.pow(2.0, float(nRefBox))):
-            diff = lastInnerBox[1] - (shipBBRot[1] - distance - cellWidth*refCellBuffer/mt.pow(2.0, float(nRefBox)))
-            for i in range(len(refBoxBB)):
-                refBoxBB[i][1] -= diff
-        if lastInnerBox[2] > (shipBBRot[2] - distance - zCellSize[1]*refCellBuffer):
-            diff = lastInnerBox[2] - (shipBBRot[2] - distance - zCellSize[1]*refCellBuffer)
-            for i in range(len(refBoxBB)):
-                refBoxBB[i][2] -= diff
-        if lastInnerBox[3] < (shipBBRot[3] + distance + cellWidth*refCellBuffer/mt.pow(2.0, float(nRefBox))):
-            diff = -lastInnerBox[3] + shipBBRot[3] + distance + cellWidth*refCellBuffer/mt.pow(2.0, float(nRefBox))
-            for i in range(len(refBoxBB)):
-                refBoxBB[i][3] += diff
-        if lastInnerBox[4] < (shipBBRot[4] + distance + cellWidth*refCellBuffer/mt.pow(2.0, float(nRefBox))):
-            diff = -lastInnerBox[4] + shipBBRot[4] + distance + cellWidth*refCellBuffer/mt.pow(2.0, float(nRefBox))
-            for i in range(len(refBoxBB)):
-                refBoxBB[i][4] += diff
-        if lastInnerBox[5] < (shipBBRot[5] + distance + zCellSize[1]*refCellBuffer):
-            diff = -lastInnerBox[5] + shipBBRot[5] + distance + zCellSize[1]*refCellBuffer
-            for i in range(len(refBoxBB)):
-                refBoxBB[i][5] += diff
-
         refineMeshDicts = []
         setSelections = []
-
-        for i, BB in enumerate(refBoxBB):
-            tmp = BB[4]
-            BB[4]=domain[3] # YmaxDomain
-            setSelections.append(SetSelection(case    = case,
-                                              selType = 'box',
-                                              BB      = BB,
-                                              name    = 'x_'+str(i)))
+        refinementNames = []
+        cellSize = [geometry["cellWidth"], geometry["cellWidth"], float(np.max(np.diff(geometry["zGrid"])))]
+        passes = planRefinements(geometry["refinements"], shipBBRot, stlName, cellSize=cellSize)
+        print('{} refinements in {} refineMesh passes'.format(len(geometry["refinements"]), len(passes)))
+        for refs in passes:
+            name = '+'.join(ref["name"] for ref in refs)
+            sels = [ SetSelection(case          = case,
+                                  selType       = ref["selType"],
+                                  BB            = ref["BB"],
+                                  stlFile       = ref["stlFile"],
+                                  opts          = 'new',
+                                  distance      = ref["distance"],
+                                  outsidePoints = geometry["outsidePoints"],
+                                  name          = ref["name"],
+                                  selName       = 'c0' if len(refs)==1 else 'c0_{}'.format(i)) for i, ref in enumerate(refs) ]
+            setSelections.append(sels[0] if len(refs)==1 else SetSelection.merge(sels, name))
             refineMeshDicts.append(RefineMeshDict.Build(case           = case,
                                                         set            = 'c0',
-                                                        name           = 'x_'+str(i),
-                                                        directions     = 'tan1',
-                                                        useHexTopology = True,
-                                                        geometricCut   = False))
-            BB[4] = tmp
-            pass
-
-        for i, BB in enumerate(refBoxBB):
-            setSelections.append(SetSelection(case    = case,
-                                              selType = 'box',
-                                              BB      = BB,
-                                              name    = 'y_'+str(i)))
-            refineMeshDicts.append(RefineMeshDict.Build(case           = case,
-                                                        set            = 'c0',
-                                                        name           = 'y_'+str(i),
-                                                        directions     = 'tan2',
-                                                        useHexTopology = True,
-                                                        geometricCut   = False))
-            pass
-
-        # this is a point outside ship.stl
-        outsidePoints = [0.5*(shipBBRot[0]+shipBBRot[3]), 0.5*(shipBBRot[1]+shipBBRot[4])+abs(shipBBRot[1]-shipBBRot[4]), 0.5*(shipBBRot[2]+shipBBRot[5])]
-
-        for i in range(nxy):
-            setSelections.append(SetSelection(case          = case,
-                                              selType       = 'proximity',
-                                              stlFile       = stlName,
-                                              opts          = 'new',
-                                              distance      = distance,
-                                              outsidePoints = outsidePoints,
-                                              name          = 'xy_'+str(i)))
-            refineMeshDicts.append(RefineMeshDict.Build(case           = case,
-                                                        set            = 'c0',
-                                                        name           = 'xy_'+str(i),
-                                                        directions     = 'tan1 tan2',
-                                                        useHexTopology = True,
-                                                        geometricCut   = False))
-            distance *= 0.5
-
-        BB = [-1e6,-1e6,fsZmin,1e6,1e6,fsZmax]
-        setSelections.append(SetSelection(case          = case,
-                                          selType       = 'proximity',
-                                          BB            = BB,
-                                          stlFile       = stlName,
-                                          opts          = 'new',
-                                          distance      = distance,
-                                          outsidePoints = outsidePoints,
-                                          name          = 'xy'))
-        refineMeshDicts.append(RefineMeshDict.Build(case           = case,
-                                                    set            = 'c0',
-                                                    name           = 'xy',
-                                                    directions     = 'tan1 tan2',
-                                                    useHexTopology = True,
-                                                    geometricCut   = False))
-
-        BB = [-1e6,-1e6,-1e6,1e6,1e6,fsZmin]
-        setSelections.append(SetSelection(case          = case,
-                                          selType       = 'proximity',
-                                          BB            = BB,
-                                          stlFile       = stlName,
-                                          opts          = 'new',
-                                          distance      = distance,
-                                          outsidePoints = outsidePoints,
-                                          name          = 'xyz1'))
-        refineMeshDicts.append(RefineMeshDict.Build(case           = case,
-                                                    set            = 'c0',
-                                                    name           = 'xyz1',
-                                                    directions     = 'tan1 tan2 normal',
-                                                    useHexTopology = True,
-                                                    geometricCut   = False))
-
-        BB = [-1e6,-1e6,fsZmax,1e6,1e6,1e6]
-        setSelections.append(SetSelection(case          = case,
-                                          selType       = 'proximity',
-                                          BB            = BB,
-                                          stlFile       = stlName,
-                                          opts          = 'new',
-                                          distance      = distance,
-                                          outsidePoints = outsidePoints,
-                                          name          = 'xyz2'))
-        refineMeshDicts.append(RefineMeshDict.Build(case           = case,
-                                                    set            = 'c0',
-                                                    name           = 'xyz2',
-                                                    directions     = 'tan1 tan2 normal',
-                                                    useHexTopology = True,
-                                                    geometricCut   = False))
-
-        # align cutting locations
-        if not refBow: refBowLength = 0.2*(shipBBRot[3]-shipBBRot[0])
-        refBowLength = shipBBRot[3]-refBowLength
-        refBowLength = domain[1]-mt.ceil((domain[1]-refBowLength)/fsCellHeight)*fsCellHeight
-        if refBow:
-            distance *= 0.5
-            BB = [refBowLength,-1e6,-1e6,1e6,1e6,shipBBRot[5]-fsCellHeight*refCellBuffer]
-            setSelections.append(SetSelection(case          = case,
-                                              selType       = 'proximity',
-                                              BB            = BB,
-                                              stlFile       = stlName,
-                                              opts          = 'new',
-                                              distance      = distance,
-                                              outsidePoints = outsidePoints,
-                                              name          = 'xyz3'))
-            refineMeshDicts.append(RefineMeshDict.Build(case           = case,
-                                                        set            = 'c0',
-                                                        name           = 'xyz3',
-                                                        directions     = 'tan1 tan2 normal',
-                                                        useHexTopology = True,
-                                                        geometricCut   = False))
-
-        if refSurfExtra is not None:
-            nameOnly = os.path.basename(refSurfExtra)
-            BB = [refBow+0.5*fsCellHeight*refCellBuffer,-1e6,-1e6,1e6,1e6,shipBBRot[5]-1.5*fsCellHeight*refCellBuffer]
-            setSelections.append(SetSelection(case          = case,
-                                              selType       = 'proximity',
-                                              BB            = BB,
-                                              stlFile       = nameOnly,
-                                              opts          = 'new',
-                                              distance      = 0.5*distance,
-                                              outsidePoints = outsidePoints,
-                                              name          = 'xyz4'))
-            refineMeshDicts.append(RefineMeshDict.Build(case           = case,
-                                                        set            = 'c0',
-                                                        name           = 'xyz4',
-                                                        directions     = 'tan1 tan2 normal',
-                                                        useHexTopology = True,
-                                                        geometricCut   = False))
-
-        # align cutting locations
-        if not refStern: refSternLength = 0.2*(shipBBRot[3]-shipBBRot[0])
-        refSternLength = shipBBRot[0]+refSternLength
-        refSternLength = domain[1]-mt.floor((domain[1]-refSternLength)/fsCellHeight)*fsCellHeight
-        if refStern:
-            if not refBow: distance *= 0.5
-            BB = [-1e6,-1e6,-1e6,refSternLength,1e6,shipBBRot[5]-fsCellHeight*refCellBuffer]
-            setSelections.append(SetSelection(case          = case,
-                                              selType       = 'proximity',
-                                              BB            = BB,
-                                              stlFile       = stlName,
-                                              opts          = 'new',
-                                              distance      = distance,
-                                              outsidePoints = outsidePoints,
-                                              name          = 'xyz5'))
-            refineMeshDicts.append(RefineMeshDict.Build(case           = case,
-                                                        set            = 'c0',
-                                                        name           = 'xyz5',
-                                                        directions     = 'tan1 tan2 normal',
-                                                        useHexTopology = True,
-                                                        geometricCut   = False))
-
-        if refSurfExtra is not None:
-            nameOnly = os.path.basename(refSurfExtra)
-            BB = [-1e6,-1e6,-1e6,refSternLength-0.5*fsCellHeight*refCellBuffer,1e6,shipBBRot[5]-1.5*fsCellHeight*refCellBuffer]
-            setSelections.append(SetSelection(case          = case,
-                                              selType       = 'proximity',
-                                              BB            = BB,
-                                              stlFile       = nameOnly,
-                                              opts          = 'new',
-                                              distance      = 0.5*distance,
-                                              outsidePoints = outsidePoints,
-                                              name          = 'xyz6'))
-            refineMeshDicts.append(RefineMeshDict.Build(case           = case,
-                                                        set            = 'c0',
-                                                        name           = 'xyz6',
-                                                        directions     = 'tan1 tan2 normal',
-                                                        useHexTopology = True,
-                                                        geometricCut   = False))
-
-        if refFS & (refBow | refStern):
-            BB = [refSternLength,-1e6,fsZmin,refBowLength,1e6,fsZmax]
-            setSelections.append(SetSelection(case          = case,
-                                              selType       = 'proximity',
-                                              BB            = BB,
-                                              stlFile       = stlName,
-                                              opts          = 'new',
-                                              distance      = distance,
-                                              outsidePoints = outsidePoints,
-                                              name          = 'z'))
-            refineMeshDicts.append(RefineMeshDict.Build(case           = case,
-                                                        set            = 'c0',
-                                                        name           = 'z',
-                                                        directions     = 'normal',
+                                                        name           = name,
+                                                        directions     = refs[0]["directions"],
                                                         useHexTopology = True,
                                                         geometricCut   = False))
+            refinementNames.append(name)
 
         ###FORMER ROUTINE : createSnappyMesh
         #surfaceFeatureExtract
@@ -699,7 +780,7 @@ class SeakeepingMesher( OfMesher ):
                                                     snap                       = True,
                                                     addLayers                  = True,
                                                     relativeSizes              = True,
-                                                    locationInMesh             = locationInMesh,
+                                                    locationInMesh             = geometry["locationInMesh"],
                                                     nCellsBetweenLevels        = 1,
                                                     edgeLvl                    = 0,
                                                     hullLvl                    = [0,0],
@@ -732,10 +813,12 @@ class SeakeepingMesher( OfMesher ):
                           setSelections=setSelections,
                           application = application,
                           isMesher = True,
-                          clean = False
+                          clean = False,
+                          coresPerNode = coresPerNode
                           )
 
         res.stlName = stlName
+        res.refinementNames = refinementNames
         res.nxy = nxy
         res.refBoxBB = refBoxBB
         res.refFS = refFS
@@ -744,11 +827,54 @@ class SeakeepingMesher( OfMesher ):
         res.refSurfExtra = refSurfExtra
         res.OFversion = OFversion
         res.onLiger = onLiger
+        res.parallelRefine = parallelRefine
 
         res.writeFiles()
 
-        os.chdir(cwd_save)
+        return res
+
+    @classmethod
+    def estimate(cls, shipBB, LOA=None, shipBL=[3, 1.3, 0.7, 0.7], fillRatio=0.7, hullArea=None, application="foamStar", verbose=False, **kwargs):
+        """Estimate number of cells and memory of the mesh built by BuildFromParams, without writing nor running anything
 
+        Parameters
+        ----------
+        shipBB : list of float
+            Bounding box of the ship, in mesh position (after draft and heading) [xmin, ymin, zmin, xmax, ymax, zmax]
+        LOA : float, default value computed from shipBB
+            Characteristic length
+        shipBL : list of float, default [3, 1.3, 0.7, 0.7]
+            Boundary layers parameters, as in BuildFromParams
+        fillRatio : float, default 0.7
+            Ratio between ship volume and bounding box volume
+        hullArea : float, default None
+            Area of the meshed ship surface (default from bounding box)
+        application : str, default "foamStar"
+            Application used for the memory estimate
+        verbose : bool, default False
+            Print number of cells after each refinement
+        **kwargs :
+            Geometry parameters of BuildFromParams (domain, side, fsZone, fsCellHeight, fsCellRatio, refBoxData...)
+
+        Example
+        -------
+        >>> from functools import partial
+        >>> from ideFoam.meshEstimator import sweep, printSweep
+        >>> printSweep( sweep( partial(SeakeepingMesher.estimate, shipBB = [-5, -16, -12, 230, 16, 20]), 5e6,
+        >>>                    fsCellHeight = [0.1, 0.15, 0.2], refBoxRatio = [2, 3, 4] )[:5] )
+
+        Returns
+        -------
+        dict, see estimateCells
+        """
+        LOA = shipBB[3] - shipBB[0] if LOA is None else LOA
+        geometry = seakeepingGeometry(shipBB, LOA, **kwargs)
+        res = estimateCells(geometry, shipBB, nLayers=shipBL[0], fillRatio=fillRatio, hullArea=hullArea, application=application)
+        if verbose:
+            print("Background mesh : {} cells".format(res["background"]))
+            for name, n in res["stages"]:
+                print("    after {:6s} : {:.0f} cells".format(name, n))
+            print("Final mesh : {:.0f} cells ({:.0f} removed, {:.0f} in layers), {:.1f} GB".format(res["final"], res["removed"], res["layers"], res["memory"]))
         return res
 
 
@@ -760,6 +886,17 @@ class SeakeepingMesher( OfMesher ):
         #Copy mesh in
         return ExtrudeMeshWave2D.BuildWave2D(case = case2D, sourceCase= self.case, step = step)
 
+    def refineCommands(self, parallel=False):
+        """Return setSet / refineMesh command lines of all refinement passes (run on the decomposed case if parallel)
+        """
+        prefix = 'mpirun -np {} '.format(self.nProcs) if parallel else ''
+        opt = ' -parallel' if parallel else ''
+        res = []
+        for name in self.refinementNames:
+            res.append('{}setSet{} -latestTime -batch "system/setSet.{}"'.format(prefix, opt, name))
+            res.append('{}refineMesh{} -dict "system/refineMeshDict.{}"'.format(prefix, opt, name))
+        return res
+
     def writeAllinit(self):
         """Write bash script 'Allinit' to create mesh
         """
@@ -767,7 +904,9 @@ class SeakeepingMesher( OfMesher ):
         ainit = os.path.join(self.case,'Allinit')
         with open(ainit,'w') as f:
             f.write('#! /bin/bash\n')
-            f.write('set -x\n\n')
+            f.write('set -x\n')
+            #stop at the first failing step (also within "| tee"), so that the exit status reports a failed mesh
+            f.write('set -eo pipefail\n\n')
 
             #moveSTL
             f.write('function moveSTL()\n')
@@ -777,46 +916,27 @@ class SeakeepingMesher( OfMesher ):
             f.write('    mv {:s} {:s}\n'.format(fstlin,fstlout))
             f.write('}\n\n')
 
+            parallel = self.parallelRefine and self.nProcs>1
+
             #refineBox
             f.write('function refineBox()\n')
             f.write('{\n')
-            for dir in ['x','y']:
-                for i in range(len(self.refBoxBB)):
-                    f.write('setSet -latestTime -batch "system/setSet.{}_{}"\n'.format(dir,i))
-                    f.write('refineMesh -dict "system/refineMeshDict.{}_{}"\n'.format(dir,i))
-            for i in range(self.nxy):
-                f.write('setSet -latestTime -batch "system/setSet.xy_{}"\n'.format(i))
-                f.write('refineMesh -dict "system/refineMeshDict.xy_{}"\n'.format(i))
-            f.write('setSet -latestTime -batch "system/setSet.xy"\n')
-            f.write('refineMesh -dict "system/refineMeshDict.xy"\n')
-            f.write('setSet -latestTime -batch "system/setSet.xyz1"\n')
-            f.write('refineMesh -dict "system/refineMeshDict.xyz1"\n')
-            f.write('setSet -latestTime -batch "system/setSet.xyz2"\n')
-            f.write('refineMesh -dict "system/refineMeshDict.xyz2"\n')
-            if self.refBow:
-                f.write('setSet -latestTime -batch "system/setSet.xyz3"\n')
-                f.write('refineMesh -dict "system/refineMeshDict.xyz3"\n')
-            if self.refSurfExtra is not None:
-                f.write('setSet -latestTime -batch "system/setSet.xyz4"\n')
-                f.write('refineMesh -dict "system/refineMeshDict.xyz4"\n')
-            if self.refStern:
-                f.write('setSet -latestTime -batch "system/setSet.xyz5"\n')
-                f.write('refineMesh -dict "system/refineMeshDict.xyz5"\n')
-            if self.refSurfExtra is not None:
-                f.write('setSet -latestTime -batch "system/setSet.xyz6"\n')
-                f.write('refineMesh -dict "system/refineMeshDict.xyz6"\n')
-            if self.refFS & (self.refBow | self.refStern):
-                f.write('setSet -latestTime -batch "system/setSet.z"\n')
-                f.write('refineMesh -dict "system/refineMeshDict.z"\n')
+            if parallel and self.onLiger:
+                f.write('    : # run in batch job, see run.sh\n')
+            else:
+                for line in self.refineCommands(parallel):
+                    f.write(line+'\n')
             f.write('}\n\n')
 
             #snap
             f.write('function snap()\n')
             f.write('{\n')
             if self.nProcs>1:
-                f.write('    decomposePar -force -latestTime\n')
+                if not parallel:
+                    f.write('    decomposePar -force -latestTime\n')
                 if self.onLiger:
-                    self.writeSbatch()
+                    #Refinement and snapping in the same job
+                    self.writeSbatch(commands = self.refineCommands(parallel) if parallel else None)
                     f.write('    sbatch run.sh\n')
                 else:
                     f.write('    mpirun -np {} snappyHexMesh -parallel\n'.format(self.nProcs))
@@ -829,6 +949,8 @@ class SeakeepingMesher( OfMesher ):
             f.write('(\n')
             f.write('    moveSTL\n')
             f.write('    blockMesh\n')
+            if parallel:
+                f.write('    decomposePar -force\n')
             f.write('    refineBox\n')
             f.write('    surfaceFeatureExtract\n')
             f.write('    snap\n')
@@ -151,9 +151,7 @@ class simpleSeakeepingMesher( OfMesher ):
         if not isinstance(stlFiles, list): stlFiles = [stlFiles]
         stlFiles = [os.path.abspath( f ) for f in stlFiles]
 
-        cwd_save = os.getcwd()
-
-        #Work in the case directory, to get temporary file there.
+        #Temporary files are written in the case directory (no change of working directory)
         simpleSeakeepingMesher.makeCaseFolder(case, clean)
 
         filename = os.path.join(case, stlName+'_tmp.stl')
@@ -460,8 +458,6 @@ class simpleSeakeepingMesher( OfMesher ):
 
         res.writeFiles()
 
-        os.chdir(cwd_save)
-
         return res
 
 
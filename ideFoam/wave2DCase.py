@@ -436,11 +436,9 @@ class Wave2DCase(OfRun):
     def runInit(self):
         import subprocess
         print("Run initialization")
-        os.chdir(self.case)
-        subprocess.call(["/bin/bash", "Allinit"], shell=False)
+        return subprocess.call(["/bin/bash", "Allinit"], shell=False, cwd=self.case)
 
     def run(self):
         import subprocess
         print("Run initialization")
-        os.chdir(self.case)
-        subprocess.call(["/bin/bash", "Allrun"], shell=False)
+        return subprocess.call(["/bin/bash", "Allrun"], shell=False, cwd=self.case)
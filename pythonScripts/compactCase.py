@@ -0,0 +1,188 @@
+#!/usr/bin/env python
+import os
+import re
+import shutil
+from os.path import join
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+from pythonScripts.foamFile import readFoamBytes, readHeader, readFieldData, toBinaryData, writeFoamBytes, foamFileName
+from pythonScripts.timeIndex import listTimes
+
+
+def sameContent(a, b, rtol=0.):
+    """Compare two parsed field contents (see foamFile.readFieldData)
+    """
+    if isinstance(a, dict):
+        return isinstance(b, dict) and a.keys() == b.keys() and all(sameContent(a[k], b[k], rtol) for k in a)
+    if isinstance(a, np.ndarray):
+        if not isinstance(b, np.ndarray) or a.shape != b.shape:
+            return False
+        if rtol == 0.:
+            return np.array_equal(a, b)
+        return np.allclose(a, b, rtol=rtol, atol=0.)
+    return a == b
+
+
+def compactFile(filename, output=None, compress=False, float32=False, verify=True):
+    """Convert a field file to binary
+
+    Parameters
+    ----------
+    filename : str
+        Field file (with or without ".gz")
+    output : str, default None
+        Output file. If None the file is converted in place.
+    compress : bool, default False
+        Gzip the output file
+    float32 : bool, default False
+        Downcast scalars to float32 (only allowed with output, for visualization copies)
+    verify : bool, default True
+        Read back the converted content and check that values are unchanged
+
+    Returns
+    -------
+    (size before, size after) in bytes. (size before, size before) if the file is not a field or is collated.
+    """
+    fname = foamFileName(filename)
+    sizeBefore = os.path.getsize(fname)
+    data = readFoamBytes(filename)
+    header, pos = readHeader(data)
+    cls = header.get("class", "")
+    if "Field" not in cls:
+        return sizeBefore, sizeBefore
+
+    if header.get("format") == "binary" and not float32 and (output is None and (compress == fname.endswith(".gz"))):
+        return sizeBefore, sizeBefore
+
+    newData = toBinaryData(data, scalarType=np.float32 if float32 else np.float64)
+    if verify:
+        if not sameContent(readFieldData(data)[1], readFieldData(newData)[1], rtol=1e-6 if float32 else 0.):
+            raise(ValueError("Round-trip check failed for {}".format(filename)))
+
+    newName = writeFoamBytes(filename if output is None else output, newData, compress=compress)
+    return sizeBefore, os.path.getsize(newName)
+
+
+def _compactTimeFolder(args):
+    timeDir, outDir, fields, compress, float32, verify = args
+    before, after, nFiles, errors = 0, 0, 0, []
+    for f in sorted(os.listdir(timeDir)):
+        if not os.path.isfile(join(timeDir, f)) or f.endswith(".tmp"):
+            continue
+        name = f[:-3] if f.endswith(".gz") else f
+        if fields is not None and name not in fields:
+            continue
+        try:
+            b, a = compactFile(join(timeDir, name), None if outDir is None else join(outDir, name),
+                               compress=compress, float32=float32, verify=verify)
+        except Exception as e:
+            errors.append("{} : {}".format(join(timeDir, name), e))
+            continue
+        before += b
+        after += a
+        nFiles += 1 if a != b or outDir is not None else 0
+    return before, after, nFiles, errors
+
+
+def compactCase(case, times=None, fields=None, output=None, compress=False, float32=False, verify=True, nWorkers=4):
+    """Convert time folders of a case (serial, decomposed or collated) to binary format
+
+    Parameters
+    ----------
+    case : str
+        Case directory
+    times : list of str, default None
+        Time folders to convert (all except the first one if None)
+    fields : list of str, default None
+        Fields to convert (all fields if None)
+    output : str, default None
+        Output case for a converted copy (system and constant folders are copied as is). In place conversion if None.
+    compress : bool, default False
+        Gzip the converted files
+    float32 : bool, default False
+        Downcast scalars to float32, only allowed with output (visualization copies)
+    verify : bool, default True
+        Check round-trip equality of the converted files
+    nWorkers : int, default 4
+        Number of processes
+
+    Returns
+    -------
+    (size before, size after) in bytes
+    """
+    if float32 and output is None:
+        raise(ValueError("float32 downcast is only allowed for copies (output should be given)"))
+    case = os.path.abspath(case)
+
+    procDirs = sorted([ p for p in os.listdir(case) if re.match(r"processor\d+$", p) ])
+    if len(procDirs) == 0:
+        procDirs = [ "" ]
+        if any(re.match(r"processors\d+$", p) for p in os.listdir(case)):
+            print("Collated files are not handled, only the case directory is converted")
+
+    if times is None:
+        times = listTimes(join(case, procDirs[0]))[1:]
+    times = [ str(t) for t in times ]
+
+    if output is not None:
+        output = os.path.abspath(output)
+        for d in ["system", "constant"] + [ join(p, "constant") for p in procDirs if p != "" ]:
+            if os.path.isdir(join(case, d)) and not os.path.exists(join(output, d)):
+                shutil.copytree(join(case, d), join(output, d))
+
+    tasks = []
+    for p in procDirs:
+        available = set(listTimes(join(case, p)))
+        for t in times:
+            if t not in available:
+                continue
+            outDir = None
+            if output is not None:
+                outDir = join(output, p, t)
+                if not os.path.exists(outDir):
+                    os.makedirs(outDir)
+                if os.path.isdir(join(case, p, t, "uniform")) and not os.path.exists(join(outDir, "uniform")):
+                    shutil.copytree(join(case, p, t, "uniform"), join(outDir, "uniform"))
+            tasks.append( (join(case, p, t), outDir, fields, compress, float32, verify) )
+
+    before, after, nFiles = 0, 0, 0
+    with ProcessPoolExecutor(max_workers=nWorkers) as pool:
+        for b, a, n, errors in pool.map(_compactTimeFolder, tasks, chunksize=max(1, len(tasks)//(8*nWorkers))):
+            before += b
+            after += a
+            nFiles += n
+            for e in errors:
+                print(e)
+
+    print("{} : {} files converted in {} time folders, {:.3f} GB => {:.3f} GB ({:.3f} GB saved)".format(
+          case, nFiles, len(tasks), before / 1024.**3, after / 1024.**3, (before - after) / 1024.**3))
+    return before, after
+
+
+if __name__ == "__main__" :
+
+    import argparse
+    parser = argparse.ArgumentParser(description='Convert ascii results to binary (optionally compressed)')
+    parser.add_argument( 'cases', nargs='+', help='Case directories' , type = str)
+    parser.add_argument( '-times' , help='Time folders (use "," as separator), all but the first one by default' , type = str,  default = None)
+    parser.add_argument( '-fields' , help='Fields to convert (use "," as separator)' , type = str,  default = None)
+    parser.add_argument( '-output', '-o', help='Output case (for a single case), the case is converted in place otherwise' , type = str,  default = None)
+    parser.add_argument( '-gzip' , help='Compress converted files' , action="store_true")
+    parser.add_argument( '-float32' , help='Downcast to single precision (with -output only)' , action="store_true")
+    parser.add_argument( '-noVerify' , help='Do not check round-trip equality' , action="store_true")
+    parser.add_argument( '-nWorkers', '-n', help='Number of processes' , type = int,  default = 4)
+
+    args = parser.parse_args()
+    times = args.times.split(",") if args.times is not None else None
+    fields = args.fields.split(",") if args.fields is not None else None
+    if args.output is not None and len(args.cases) > 1:
+        raise(ValueError("-output can only be used with a single case"))
+
+    total = 0
+    for case in args.cases:
+        before, after = compactCase( case, times = times, fields = fields, output = args.output, compress = args.gzip,
+                                     float32 = args.float32, verify = not args.noVerify, nWorkers = args.nWorkers )
+        total += before - after
+    if len(args.cases) > 1:
+        print("Total saved : {:.3f} GB".format( total / 1024.**3 ))
@@ -0,0 +1,186 @@
+#!/usr/bin/env python
+import os
+import re
+from os.path import join
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+from pythonScripts.foamFile import readFoamBytes, readListData, readFieldData, readBoundaryData, readBoundary, splitCollated, fieldValues, nComponents
+from pythonScripts.timeIndex import listTimes
+
+
+class DecomposedCase(object):
+    """Access to fields of a decomposed case, without running reconstructPar.
+
+    Processor addressing (cellProcAddressing / faceProcAddressing) is read once, when first needed,
+    and kept as int32 arrays. Fields are then assembled on demand from the processor directories.
+
+    Both the uncollated ("processor0", "processor1", ...) and the collated ("processors12") layouts are handled.
+
+    Example
+    -------
+    >>> from pythonScripts.decomposedCase import DecomposedCase
+    >>> run = DecomposedCase("run", nWorkers = 8)
+    >>> alpha = run.readField("alpha.water", run.getTimes()[-1])
+    >>> p_hull = run.readPatchField("p_rgh", "12.5", "ship")
+    """
+
+    def __init__(self, case, nWorkers = 1):
+        """
+        case : str
+            Path to the case directory
+        nWorkers : int, default 1
+            Number of threads used to read the processor files
+        """
+        self.case = os.path.abspath(case)
+        self.nWorkers = nWorkers
+
+        procs = [ d for d in os.listdir(self.case) if d.startswith("processor") ]
+        collated = [ d for d in procs if re.match(r"processors\d+$", d) ]
+        if len(collated) > 0:
+            self.collated = True
+            self.procDirs = [ join(self.case, collated[0]) ]
+            self.nProcs = int(collated[0][10:])
+        elif len(procs) > 0:
+            self.collated = False
+            self.nProcs = len([ d for d in procs if re.match(r"processor\d+$", d) ])
+            self.procDirs = [ join(self.case, "processor{}".format(i)) for i in range(self.nProcs) ]
+        else:
+            raise(FileNotFoundError(1, "No processor directory found in {}".format(self.case)))
+
+        self._cellAddr = None
+        self._faceAddr = None
+        self._procBoundary = None
+        self._boundary = None
+        self._nCells = None
+
+    def __str__(self):
+        return "DecomposedCase : {} ({} processors, {})".format(self.case, self.nProcs, "collated" if self.collated else "uncollated")
+
+    def _map(self, func, items):
+        if self.nWorkers > 1 and len(items) > 1:
+            with ThreadPoolExecutor(max_workers = self.nWorkers) as pool:
+                return list(pool.map(func, items))
+        return [ func(i) for i in items ]
+
+    def procFileData(self, relPath):
+        """Return raw content of "relPath" for each processor (list of bytes)
+        """
+        if self.collated:
+            return splitCollated(readFoamBytes(join(self.procDirs[0], relPath)))
+        return self._map(lambda d : readFoamBytes(join(d, relPath)), self.procDirs)
+
+    def getTimes(self):
+        """Return list of available time folders (str), sorted
+        """
+        return listTimes(self.procDirs[0])
+
+    @property
+    def cellProcAddressing(self):
+        """List of int32 arrays : global cell index of each local cell
+        """
+        if self._cellAddr is None:
+            data = self.procFileData(join("constant", "polyMesh", "cellProcAddressing"))
+            self._cellAddr = self._map(lambda d : readListData(d).astype(np.int32), data)
+        return self._cellAddr
+
+    @property
+    def faceProcAddressing(self):
+        """List of int32 arrays : global face index of each local face (flip information removed)
+        """
+        if self._faceAddr is None:
+            data = self.procFileData(join("constant", "polyMesh", "faceProcAddressing"))
+            self._faceAddr = self._map(lambda d : (np.abs(readListData(d)) - 1).astype(np.int32), data)
+        return self._faceAddr
+
+    @property
+    def procBoundary(self):
+        """Boundary definition of each processor
+        """
+        if self._procBoundary is None:
+            data = self.procFileData(join("constant", "polyMesh", "boundary"))
+            self._procBoundary = [ dict(readBoundaryData(d)) for d in data ]
+        return self._procBoundary
+
+    @property
+    def boundary(self):
+        """Boundary definition of the reconstructed mesh
+        """
+        if self._boundary is None:
+            self._boundary = dict(readBoundary(join(self.case, "constant", "polyMesh")))
+        return self._boundary
+
+    @property
+    def nCells(self):
+        if self._nCells is None:
+            self._nCells = int(max( a.max() for a in self.cellProcAddressing if a.size > 0 )) + 1
+        return self._nCells
+
+    def _fieldData(self, field, time):
+        time = str(time)
+        if self.collated:
+            return [ readFieldData(d) for d in self.procFileData(join(time, field)) ]
+        return self._map(lambda d : readFieldData(readFoamBytes(join(d, time, field))), self.procDirs)
+
+    @staticmethod
+    def _nComp(header):
+        cls = header.get("class", "").lower()
+        for valueType in sorted(nComponents, key=len, reverse=True):
+            if valueType.lower() in cls:
+                return nComponents[valueType]
+        return 1
+
+    def readField(self, field, time):
+        """Assemble internal field values of "field" at "time"
+
+        Return np.ndarray of size nCells (scalar fields) or (nCells, nComp)
+        """
+        fieldData = self._fieldData(field, time)
+        nComp = self._nComp(fieldData[0][0])
+        res = np.empty( (self.nCells, nComp) if nComp > 1 else self.nCells )
+        for (header, content), addr in zip(fieldData, self.cellProcAddressing):
+            res[addr] = fieldValues(content["internalField"], addr.size, nComp)
+        return res
+
+    def readPatchField(self, field, time, patch):
+        """Assemble values of "field" on patch "patch" at "time"
+
+        Values are ordered as in the reconstructed mesh
+        """
+        globalPatch = self.boundary[patch]
+        fieldData = self._fieldData(field, time)
+        nComp = self._nComp(fieldData[0][0])
+        res = np.empty( (globalPatch["nFaces"], nComp) if nComp > 1 else globalPatch["nFaces"] )
+        for (header, content), addr, bound in zip(fieldData, self.faceProcAddressing, self.procBoundary):
+            if patch not in bound or bound[patch]["nFaces"] == 0:
+                continue
+            local = bound[patch]
+            faces = addr[ local["startFace"] : local["startFace"]+local["nFaces"] ] - globalPatch["startFace"]
+            entry = content["boundaryField"][patch]
+            if "value" not in entry:
+                raise(ValueError('No "value" entry for patch {} in {}'.format(patch, field)))
+            res[faces] = fieldValues(entry["value"], faces.size, nComp)
+        return res
+
+
+if __name__ == "__main__" :
+
+    import argparse
+    parser = argparse.ArgumentParser(description='Assemble field from decomposed case and save it as numpy array (*.npy)')
+    parser.add_argument( '-case' ,  help='Case directory' , type = str,  default = ".")
+    parser.add_argument( '-field' , help='Field name' , type = str )
+    parser.add_argument( '-time' ,  help='Time folder (default latest)' , type = str,  default = None)
+    parser.add_argument( '-patch' , help='Patch name, internal field if not given' , type = str,  default = None)
+    parser.add_argument( '-nWorkers', '-n', help='Number of parallel reads' , type = int,  default = 4)
+    parser.add_argument( '-output', '-o', help='Output file' , type = str,  default = None)
+
+    args = parser.parse_args()
+    run = DecomposedCase( args.case, nWorkers = args.nWorkers )
+    time = args.time if args.time is not None else run.getTimes()[-1]
+    if args.patch is None:
+        res = run.readField(args.field, time)
+    else:
+        res = run.readPatchField(args.field, time, args.patch)
+    output = args.output if args.output is not None else "{}_{}.npy".format(args.field, time)
+    print ("Writting :", output, res.shape)
+    np.save(output, res)
@@ -0,0 +1,209 @@
+#!/usr/bin/env python
+import itertools
+from os.path import join
+import numpy as np
+
+from pythonScripts.foamFile import readList, readFaces, foamFileName
+
+"""
+  Quality of a mesh decomposition : cells per processor, imbalance, processor boundary faces and neighbours.
+
+  The decomposition can be read from "constant/cellDecomposition" (decomposePar -cellDist), or emulated for
+  simple and hierarchical methods from approximate cell centres, to compare candidates before running.
+"""
+
+
+class MeshConnectivity(object):
+    """Owner / neighbour of a polyMesh, and approximate cell centres (read only when needed)
+    """
+
+    def __init__(self, polyMeshDir):
+        self.polyMeshDir = polyMeshDir
+        self.owner = readList(join(polyMeshDir, "owner")).astype(np.int64)
+        self.neighbour = readList(join(polyMeshDir, "neighbour")).astype(np.int64)
+        self.nInternalFaces = self.neighbour.size
+        self.nCells = int(max(self.owner.max(), self.neighbour.max())) + 1
+        self._cellCentres = None
+
+    @property
+    def cellCentres(self):
+        """Cell centres, approximated by the average of face centres (face centre = average of points)
+        """
+        if self._cellCentres is None:
+            points = readList(join(self.polyMeshDir, "points"))
+            offsets, labels = readFaces(self.polyMeshDir)
+            sizes = np.diff(offsets)
+            faceCentres = np.add.reduceat(points[labels], offsets[:-1], axis=0) / sizes[:,None]
+            nFacesPerCell = np.bincount(self.owner, minlength=self.nCells) + np.bincount(self.neighbour, minlength=self.nCells)
+            centres = np.empty((self.nCells, 3))
+            for i in range(3):
+                centres[:,i] = np.bincount(self.owner, faceCentres[:,i], minlength=self.nCells) \
+                             + np.bincount(self.neighbour, faceCentres[:self.nInternalFaces,i], minlength=self.nCells)
+            self._cellCentres = centres / nFacesPerCell[:,None]
+        return self._cellCentres
+
+
+def analyze(decomposition, mesh, nProcs=None):
+    """Compute quality indicators of a decomposition
+
+    Parameters
+    ----------
+    decomposition : np.ndarray
+        Processor of each cell
+    mesh : MeshConnectivity
+    nProcs : int, default None
+        Number of processors (max(decomposition)+1 by default)
+
+    Returns
+    -------
+    dict with "nCells" (per processor), "imbalance" (max/mean - 1), "nProcFaces" (processor boundary faces
+    per processor), "nCutFaces" (total), "nNeighbours" (per processor)
+    """
+    decomposition = np.asarray(decomposition)
+    if nProcs is None:
+        nProcs = int(decomposition.max()) + 1
+    nCells = np.bincount(decomposition, minlength=nProcs)
+
+    pOwner = decomposition[mesh.owner[:mesh.nInternalFaces]]
+    pNeighbour = decomposition[mesh.neighbour]
+    cut = pOwner != pNeighbour
+    pOwner, pNeighbour = pOwner[cut], pNeighbour[cut]
+    nProcFaces = np.bincount(pOwner, minlength=nProcs) + np.bincount(pNeighbour, minlength=nProcs)
+
+    pairs = np.unique(np.minimum(pOwner, pNeighbour) * nProcs + np.maximum(pOwner, pNeighbour))
+    nNeighbours = np.bincount(pairs // nProcs, minlength=nProcs) + np.bincount(pairs % nProcs, minlength=nProcs)
+
+    return { "nProcs"      : nProcs,
+             "nCells"      : nCells,
+             "imbalance"   : nCells.max() / nCells.mean() - 1.,
+             "nProcFaces"  : nProcFaces,
+             "nCutFaces"   : int(cut.sum()),
+             "nNeighbours" : nNeighbours,
+           }
+
+
+def _equalSplit(values, n, weights=None):
+    """Split values in n groups of equal size (or equal weight), by increasing value. Return group index of each value
+    """
+    order = np.argsort(values, kind="stable")
+    res = np.empty(values.size, dtype=np.int64)
+    if weights is None:
+        res[order] = (np.arange(values.size) * n) // max(values.size, 1)
+    else:
+        w = weights[order]
+        before = np.cumsum(w) - w
+        res[order] = np.minimum( (before * n / max(w.sum(), 1e-300)).astype(np.int64), n-1 )
+    return res
+
+
+def simpleDecomposition(centres, n):
+    """Emulate "simple" method : independent equal-count splits in x, y and z
+    """
+    groups = [ _equalSplit(centres[:,i], n[i]) for i in range(3) ]
+    return groups[0] + n[0]*groups[1] + n[0]*n[1]*groups[2]
+
+
+def hierarchicalDecomposition(centres, n, order="xyz", weights=None):
+    """Emulate "hierarchical" method : nested equal-count splits, in the given order
+
+    weights : np.ndarray, default None
+        Cost of each cell. If given, splits have equal weight instead of equal count (to be used with the "manual" method,
+        see DecomposeParDict.Build(manualDecomposition = ...))
+    """
+    axes = [ "xyz".index(c) for c in order ]
+    groups = np.zeros((3, centres.shape[0]), dtype=np.int64)
+    bins = [ np.arange(centres.shape[0]) ]
+    for axis in axes:
+        newBins = []
+        for b in bins:
+            g = _equalSplit(centres[b,axis], n[axis], None if weights is None else weights[b])
+            groups[axis, b] = g
+            newBins += [ b[g == i] for i in range(n[axis]) ]
+        bins = newBins
+    return groups[0] + n[0]*groups[1] + n[0]*n[1]*groups[2]
+
+
+def factorizations(nProcs):
+    """All (nx, ny, nz) with nx*ny*nz = nProcs
+    """
+    res = []
+    for nx in range(1, nProcs+1):
+        if nProcs % nx : continue
+        for ny in range(1, nProcs//nx + 1):
+            if (nProcs//nx) % ny : continue
+            res.append( (nx, ny, nProcs//nx//ny) )
+    return res
+
+
+def compareCandidates(mesh, nProcs, methods=["simple", "hierarchical"], candidates=None, current=None):
+    """Emulate and analyze candidate decompositions
+
+    candidates : list of (method, n, order)
+        Candidates to compare. Default : all factorizations of nProcs for the given methods (and all orders for hierarchical)
+    current : np.ndarray
+        Existing decomposition (cellDecomposition), added to results as "current"
+
+    Return list of (label, analyze result), sorted by number of processor boundary faces
+    """
+    if candidates is None:
+        candidates = []
+        for n in factorizations(nProcs):
+            if "simple" in methods:
+                candidates.append( ("simple", n, None) )
+            if "hierarchical" in methods:
+                #Order of axes with a single subdivision does not matter
+                orders = {}
+                for o in itertools.permutations("xyz"):
+                    orders.setdefault( "".join(c for c in o if n["xyz".index(c)] > 1), "".join(o) )
+                candidates += [ ("hierarchical", n, o) for o in sorted(orders.values()) ]
+
+    res = []
+    if current is not None:
+        res.append( ("current", analyze(current, mesh)) )
+    done = set()
+    for method, n, order in candidates:
+        if method == "simple":
+            decomp = simpleDecomposition(mesh.cellCentres, n)
+            label = "simple ({} {} {})".format(*n)
+        else:
+            decomp = hierarchicalDecomposition(mesh.cellCentres, n, order)
+            label = "hierarchical ({} {} {}) {}".format(n[0], n[1], n[2], order)
+        key = decomp.tobytes()
+        if key in done : continue
+        done.add(key)
+        res.append( (label, analyze(decomp, mesh, nProcs)) )
+    res.sort(key = lambda r : (r[1]["nCutFaces"], r[1]["imbalance"]))
+    return res
+
+
+def printResults(results):
+    print("{:40s} {:>10s} {:>10s} {:>12s} {:>12s}".format("Decomposition", "imbalance", "cutFaces", "maxProcFaces", "maxNeighbours"))
+    for label, r in results:
+        print("{:40s} {:10.3f} {:10d} {:12d} {:12d}".format(label, r["imbalance"], r["nCutFaces"], int(r["nProcFaces"].max()), int(r["nNeighbours"].max())))
+
+
+if __name__ == "__main__" :
+
+    import argparse
+    parser = argparse.ArgumentParser(description='Analyze mesh decomposition (cellDecomposition) and compare with simple/hierarchical candidates')
+    parser.add_argument( '-case' ,  help='Case directory' , type = str,  default = ".")
+    parser.add_argument( '-meshDir' , help='polyMesh directory (default constant/polyMesh)' , type = str,  default = None)
+    parser.add_argument( '-nProcs', '-n', help='Number of processors for candidates (default from cellDecomposition)' , type = int,  default = None)
+    parser.add_argument( '-compare' , help='Compare with simple and hierarchical candidates' , action="store_true")
+    parser.add_argument( '-top' , help='Number of candidates to print' , type = int,  default = 10)
+
+    args = parser.parse_args()
+    meshDir = args.meshDir if args.meshDir is not None else join(args.case, "constant", "polyMesh")
+    mesh = MeshConnectivity(meshDir)
+
+    current = None
+    if foamFileName(join(args.case, "constant", "cellDecomposition")) is not None:
+        current = readList(join(args.case, "constant", "cellDecomposition")).astype(np.int64)
+    nProcs = args.nProcs if args.nProcs is not None else (int(current.max())+1 if current is not None else None)
+    if nProcs is None:
+        raise(ValueError("No cellDecomposition found, nProcs should be given"))
+
+    if args.compare:
+        printResults( compareCandidates(mesh, nProcs, current=current)[:args.top] )
+    elif current is not None:
+        printResults( [("current", analyze(current, mesh, nProcs))] )
@@ -0,0 +1,155 @@
+#!/usr/bin/env python
+import os
+import re
+import sys
+import json
+import shutil
+import hashlib
+from os.path import join
+from concurrent.futures import ThreadPoolExecutor
+
+"""
+  Cache of decomposed meshes, shared between cases using the same mesh.
+
+  Entries are stored in "cacheDir/<key>", where key is a hash of the mesh (constant/polyMesh content) and of
+  system/decomposeParDict (number of subdomains, method and coefficients). An entry contains the processor
+  mesh directories (processor*/constant) and the decomposition data (constant/cellDecomposition, 0/cellDist).
+  Files are hard-linked when possible, so that the cache does not duplicate data.
+
+  This module only depends on the standard library, so that it can be called from Allinit scripts :
+
+      if python decompositionCache.py fetch -cache /scratch/decompCache ; then
+          decomposePar -fields
+      else
+          decomposePar -cellDist
+          python decompositionCache.py store -cache /scratch/decompCache
+      fi
+"""
+
+_procPattern = re.compile(r"processors?\d+$")
+decompositionFiles = [ join("constant", "cellDecomposition"), join("0", "cellDist") ]
+
+
+def _fileHash(filename):
+    h = hashlib.sha1()
+    with open(filename, "rb") as f:
+        for chunk in iter(lambda : f.read(1 << 22), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def meshKey(case, nWorkers=4):
+    """Return hash of mesh content and decomposition settings of case
+    """
+    meshDir = join(case, "constant", "polyMesh")
+    files = []
+    for root, dirs, fnames in os.walk(meshDir):
+        files += [ os.path.relpath(join(root, f), meshDir) for f in fnames ]
+    files.sort()
+    with ThreadPoolExecutor(max_workers=nWorkers) as pool:
+        digests = list(pool.map(lambda f : _fileHash(join(meshDir, f)), files))
+    h = hashlib.sha1()
+    for f, d in zip(files, digests):
+        h.update("{} {}\n".format(f, d).encode())
+    h.update(_fileHash(join(case, "system", "decomposeParDict")).encode())
+    return h.hexdigest()
+
+
+def _linkFile(src, dst):
+    if not os.path.exists(os.path.dirname(dst)):
+        os.makedirs(os.path.dirname(dst))
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+
+def _linkTree(src, dst):
+    for root, dirs, fnames in os.walk(src):
+        rel = os.path.relpath(root, src)
+        for f in fnames:
+            _linkFile(join(root, f), join(dst, rel, f))
+
+
+def _procDirs(case):
+    return sorted( d for d in os.listdir(case) if _procPattern.match(d) and os.path.isdir(join(case, d)) )
+
+
+def fetch(case, cacheDir, key=None):
+    """Populate processor directories of case from cache. Return True if the decomposition was found
+    """
+    key = meshKey(case) if key is None else key
+    entry = join(cacheDir, key)
+    if not os.path.isdir(entry):
+        print("Decomposition cache : no entry for {}".format(key))
+        return False
+    for d in _procDirs(entry):
+        if os.path.exists(join(case, d, "constant")):
+            shutil.rmtree(join(case, d, "constant"))
+        _linkTree(join(entry, d, "constant"), join(case, d, "constant"))
+    for f in decompositionFiles:
+        if os.path.exists(join(entry, f)):
+            if os.path.exists(join(case, f)) : os.remove(join(case, f))
+            _linkFile(join(entry, f), join(case, f))
+    print("Decomposition cache : {} processor meshes fetched from {}".format(len(_procDirs(entry)), entry))
+    return True
+
+
+def store(case, cacheDir, key=None):
+    """Store decomposition of case (after decomposePar) in cache
+    """
+    key = meshKey(case) if key is None else key
+    entry = join(cacheDir, key)
+    if os.path.isdir(entry):
+        return entry
+    procDirs = _procDirs(case)
+    if len(procDirs) == 0:
+        raise(FileNotFoundError(1, "No processor directory found in {}".format(case)))
+
+    #Written in a temporary directory first, several cases may store the same entry at the same time
+    tmp = "{}.tmp{}".format(entry, os.getpid())
+    for d in procDirs:
+        _linkTree(join(case, d, "constant"), join(tmp, d, "constant"))
+    for f in decompositionFiles:
+        if os.path.exists(join(case, f)):
+            _linkFile(join(case, f), join(tmp, f))
+    with open(join(tmp, "info.json"), "w") as f:
+        json.dump({"case" : os.path.abspath(case), "nProcs" : len(procDirs)}, f)
+    try:
+        os.rename(tmp, entry)
+        print("Decomposition cache : stored in {}".format(entry))
+    except OSError:
+        shutil.rmtree(tmp)
+    return entry
+
+
+def allinitCommands(cacheDir, indent="    "):
+    """Return bash lines (list of str) decomposing the case with the cache
+    """
+    script = os.path.abspath(__file__)
+    if script.endswith(".pyc") : script = script[:-1]
+    return [ "{}if python {} fetch -cache {} ; then\n".format(indent, script, cacheDir),
+             "{}    decomposePar -fields\n".format(indent),
+             "{}else\n".format(indent),
+             "{}    decomposePar -cellDist\n".format(indent),
+             "{}    python {} store -cache {}\n".format(indent, script, cacheDir),
+             "{}fi\n".format(indent) ]
+
+
+if __name__ == "__main__" :
+
+    import argparse
+    parser = argparse.ArgumentParser(description='Fetch or store decomposed mesh from/to cache')
+    parser.add_argument( 'action' , help='fetch, store or key' , choices = ["fetch", "store", "key"])
+    parser.add_argument( '-case' ,  help='Case directory' , type = str,  default = ".")
+    parser.add_argument( '-cache' , help='Cache directory' , type = str,  default = os.path.join(os.path.expanduser("~"), ".decompositionCache"))
+
+    args = parser.parse_args()
+    if not os.path.exists(args.cache):
+        os.makedirs(args.cache)
+    if args.action == "key":
+        print(meshKey(args.case))
+    elif args.action == "fetch":
+        sys.exit(0 if fetch(args.case, args.cache) else 1)
+    else:
+        store(args.case, args.cache)
@@ -0,0 +1,363 @@
+import os, re
+import gzip
+import numpy as np
+
+"""
+  Light-weight reader for OpenFOAM files (header, lists, fields, boundary), ascii or binary, plain or gzipped.
+  Collated files (class decomposedBlockData) are split into one block per processor.
+"""
+
+nComponents = { "label"           : 1,
+                "scalar"          : 1,
+                "vector"          : 3,
+                "sphericalTensor" : 1,
+                "symmTensor"      : 6,
+                "tensor"          : 9,
+              }
+
+_headerPattern = re.compile(br"FoamFile\s*\{(.*?)\}", re.DOTALL)
+_entryPattern = re.compile(br'(\w+)\s+("[^"]*"|[^;]*);')
+_listPattern = re.compile(br"(\d+)\s*([({])")
+_nonuniformPattern = re.compile(br"nonuniform\s+List<(\w+)>\s*")
+_blockPattern = re.compile(br"\s*(\d+)\s*\(")
+_asciiTable = bytes.maketrans(b"()", b"  ")
+
+
+def foamFileName(filename):
+    """Return existing file name, possibly with the ".gz" extension, None if the file does not exists
+    """
+    if os.path.isfile(filename) : return filename
+    if os.path.isfile(filename + ".gz") : return filename + ".gz"
+    return None
+
+
+def readFoamBytes(filename):
+    """Read raw content of an OpenFOAM file (compressed or not)
+    """
+    fname = foamFileName(filename)
+    if fname is None:
+        raise(FileNotFoundError( 1, "{} or {}.gz does not exists".format(filename,filename) ))
+    if fname.endswith(".gz"):
+        with gzip.open(fname, "rb") as f :
+            return f.read()
+    with open(fname, "rb") as f :
+        return f.read()
+
+
+def readHeader(data):
+    """Return FoamFile header as a dictionary (str => str) and position of the end of the header
+    """
+    m = _headerPattern.search(data)
+    if m is None:
+        return {}, 0
+    header = { k.decode() : v.strip().strip(b'"').decode() for k, v in _entryPattern.findall(m.group(1)) }
+    return header, m.end()
+
+
+def getDtypes(header):
+    """Return (label dtype, scalar dtype) from header "arch" entry
+    """
+    arch = header.get("arch", "")
+    label = re.search(r"label=(\d+)", arch)
+    scalar = re.search(r"scalar=(\d+)", arch)
+    labelType = np.int64 if (label and label.group(1) == "64") else np.int32
+    scalarType = np.float32 if (scalar and scalar.group(1) == "32") else np.float64
+    return np.dtype(labelType).newbyteorder("<"), np.dtype(scalarType).newbyteorder("<")
+
+
+def _skipComments(data, pos):
+    n = len(data)
+    while pos < n:
+        c = data[pos:pos+1]
+        if c.isspace():
+            pos += 1
+        elif data.startswith(b"//", pos):
+            pos = data.find(b"\n", pos)
+            if pos < 0 : return n
+        elif data.startswith(b"/*", pos):
+            pos = data.find(b"*/", pos)
+            if pos < 0 : return n
+            pos += 2
+        else:
+            return pos
+    return pos
+
+
+def parseList(data, pos, valueType, binary, header):
+    """Parse an OpenFOAM list starting at "pos" (the size of the list is expected first)
+
+    Return (np.ndarray, position after the list)
+    """
+    labelType, scalarType = getDtypes(header)
+    dtype = labelType if valueType == "label" else scalarType
+    nComp = nComponents[valueType]
+
+    m = _listPattern.match(data, _skipComments(data, pos))
+    if m is None:
+        raise(ValueError("List expected at position {}".format(pos)))
+    size = int(m.group(1))
+
+    #Uniform list : N{value}
+    if m.group(2) == b"{":
+        if binary:
+            end = m.end() + nComp*dtype.itemsize
+            val = np.frombuffer(data[m.end():end], dtype=dtype)
+        else:
+            end = data.find(b"}", m.end())
+            val = np.fromstring(data[m.end():end].translate(_asciiTable), dtype=dtype, sep=" ")
+        res = np.tile(val, (size,1)) if nComp > 1 else np.full(size, val[0], dtype=dtype)
+        return res, end+1
+
+    start = m.end()
+    if binary and size > 0:
+        end = start + size*nComp*dtype.itemsize
+        res = np.frombuffer(data[start:end], dtype=dtype)
+        if data[end:end+1] != b")":
+            raise(ValueError("Corrupted binary list at position {}".format(pos)))
+    else:
+        if nComp > 1 and size > 0:
+            end = re.compile(br"\)\s*\)").search(data, start).end() - 1
+        else:
+            end = data.find(b")", start)
+        res = np.fromstring(data[start:end].translate(_asciiTable), dtype=dtype, sep=" ")
+    if res.size != size*nComp:
+        raise(ValueError("Expected {} values, {} found".format(size*nComp, res.size)))
+    if nComp > 1:
+        res = res.reshape(-1,nComp)
+    return res, end+1
+
+
+def _readWord(data, pos):
+    if data[pos:pos+1] == b'"':
+        end = data.find(b'"', pos+1) + 1
+    else:
+        m = re.compile(br"[^\s{};]+").match(data, pos)
+        end = m.end()
+    return data[pos:end].decode(), end
+
+
+def parseDict(data, pos, binary, header):
+    """Parse dictionary entries from "pos" up to the closing brace (or end of file)
+
+    Sub-dictionaries are returned as dict, nonuniform lists as np.ndarray, other entries as str.
+    Return (dict, position after the dictionary)
+    """
+    res = {}
+    n = len(data)
+    while True:
+        pos = _skipComments(data, pos)
+        if pos >= n : return res, n
+        if data[pos:pos+1] in (b"}", b")") : return res, pos+1
+        if data[pos:pos+1] == b";" :
+            pos += 1
+            continue
+        key, pos = _readWord(data, pos)
+        if key.startswith("#"):
+            end = data.find(b"\n", pos)
+            res[key] = data[pos:end].strip().decode()
+            pos = end
+            continue
+        pos = _skipComments(data, pos)
+        if data[pos:pos+1] == b"{":
+            res[key], pos = parseDict(data, pos+1, binary, header)
+            continue
+        m = _nonuniformPattern.match(data, pos)
+        if m is not None:
+            res[key], pos = parseList(data, m.end(), m.group(1).decode(), binary, header)
+            continue
+        #Plain entry, read up to ";" (out of parenthesis)
+        depth, start = 0, pos
+        while pos < n:
+            c = data[pos:pos+1]
+            if c == b"(" : depth += 1
+            elif c == b")" : depth -= 1
+            elif c == b";" and depth == 0 : break
+            pos += 1
+        res[key] = data[start:pos].strip().decode()
+        pos += 1
+
+
+def splitCollated(data):
+    """Split a collated file (class decomposedBlockData) into a list of file contents (one for each processor)
+    """
+    header, pos = readHeader(data)
+    blocks = []
+    while True:
+        m = _blockPattern.match(data, _skipComments(data, pos))
+        if m is None : return blocks
+        size = int(m.group(1))
+        blocks.append(data[m.end():m.end()+size])
+        pos = m.end() + size + 1
+
+
+def readListData(data):
+    """Read content of a list file (labelIOList, labelList, pointField ...) from raw content
+    """
+    header, pos = readHeader(data)
+    cls = header.get("class", "labelList")
+    if "label" in cls.lower():
+        valueType = "label"
+    elif "vector" in cls.lower() or "point" in cls.lower():
+        valueType = "vector"
+    else:
+        valueType = "scalar"
+    return parseList(data, pos, valueType, header.get("format") == "binary", header)[0]
+
+
+def readList(filename):
+    """Read a list file (labelIOList, labelList, pointField ...)
+    """
+    return readListData(readFoamBytes(filename))
+
+
+def readFieldData(data):
+    """Read a field file from raw content
+
+    Return (header, dict) where dict contains "dimensions", "internalField" and "boundaryField" entries
+    """
+    header, pos = readHeader(data)
+    content, pos = parseDict(data, pos, header.get("format") == "binary", header)
+    return header, content
+
+
+def readField(filename):
+    """Read a field file (vol*Field, surface*Field, point*Field)
+    """
+    return readFieldData(readFoamBytes(filename))
+
+
+def fieldValues(entry, size, nComp=None):
+    """Return field values as array of length "size" from a parsed entry (either "uniform xxx" or an array)
+    """
+    if isinstance(entry, np.ndarray):
+        return entry
+    val = entry.split(None, 1)[-1] if entry.startswith("uniform") else entry
+    val = np.fromstring(val.translate(str.maketrans("()", "  ")), dtype=float, sep=" ")
+    if val.size == 1 and (nComp is None or nComp == 1):
+        return np.full(size, val[0])
+    return np.tile(val, (size,1))
+
+
+def readBoundaryData(data):
+    """Read polyMesh/boundary from raw content
+
+    Return list of (name, dict) with at least "type", "nFaces" and "startFace"
+    """
+    header, pos = readHeader(data)
+    m = _listPattern.match(data, _skipComments(data, pos))
+    content, pos = parseDict(data, m.end(), False, header)
+    res = []
+    for name, entries in content.items():
+        entries = dict(entries)
+        entries["nFaces"] = int(entries["nFaces"])
+        entries["startFace"] = int(entries["startFace"])
+        res.append( (name, entries) )
+    return res
+
+
+def readBoundary(polyMeshDir):
+    """Read polyMesh/boundary file
+    """
+    return readBoundaryData(readFoamBytes(os.path.join(polyMeshDir, "boundary")))
+
+
+def writeFoamBytes(filename, data, compress=False):
+    """Write raw content to an OpenFOAM file, gzipped (filename + ".gz") if compress is True
+
+    The file is written to a temporary file and then moved, an existing file (compressed or not) is replaced.
+    """
+    fname = filename + ".gz" if compress else filename
+    tmp = fname + ".tmp"
+    if compress:
+        with gzip.open(tmp, "wb") as f :
+            f.write(data)
+    else:
+        with open(tmp, "wb") as f :
+            f.write(data)
+    os.replace(tmp, fname)
+    other = filename if compress else filename + ".gz"
+    if os.path.isfile(other):
+        os.remove(other)
+    return fname
+
+
+def toBinaryData(data, scalarType=np.float64):
+    """Convert raw content of a field file (ascii or binary) to binary format
+
+    All "nonuniform List<type>" entries are written as binary lists, other entries are kept as is.
+    scalarType : np.float64 or np.float32
+        Type used for scalars in the new file (np.float32 files are only intended for visualization)
+    """
+    header, pos = readHeader(data)
+    binary = header.get("format") == "binary"
+    labelType = getDtypes(header)[0]
+    scalarType = np.dtype(scalarType).newbyteorder("<")
+
+    out = [ data[:pos] ]
+    prev = pos
+    while True:
+        m = _nonuniformPattern.search(data, prev)
+        if m is None : break
+        valueType = m.group(1).decode()
+        arr, end = parseList(data, m.end(), valueType, binary, header)
+        dtype = labelType if valueType == "label" else scalarType
+        if arr.shape[0] > 0:
+            arr = np.ascontiguousarray(arr, dtype=dtype)
+            out += [ data[prev:m.end()], b"%d\n(" % arr.shape[0], arr.tobytes(), b")" ]
+        else:
+            out += [ data[prev:m.end()], b"0()" ]
+        prev = end
+    out.append(data[prev:])
+
+    #Update header
+    m = _headerPattern.search(data)
+    if m is None:
+        raise(ValueError("No FoamFile header found"))
+    arch = 'arch        "LSB;label={};scalar={}";'.format(8*labelType.itemsize, 8*scalarType.itemsize).encode()
+    head = m.group(0)
+    if re.search(br"format\s+\w+\s*;", head):
+        head = re.sub(br"format\s+\w+\s*;", b"format      binary;", head)
+    else:
+        head = head.replace(b"{", b"{\n    format      binary;", 1)
+    if re.search(br'arch\s+("[^"]*"|[^;]*);', head):
+        head = re.sub(br'arch\s+("[^"]*"|[^;]*);', arch, head)
+    else:
+        head = re.sub(br"(format\s+binary;)", br"\1\n    " + arch, head)
+    out[0] = data[:m.start()] + head + data[m.end():pos]
+    return b"".join(out)
+
+
+def readFacesData(data):
+    """Read polyMesh/faces (faceList or faceCompactList) from raw content
+
+    Return (offsets, labels) : points of face i are labels[offsets[i]:offsets[i+1]]
+    """
+    header, pos = readHeader(data)
+    binary = header.get("format") == "binary"
+    if "Compact" in header.get("class", ""):
+        offsets, pos = parseList(data, pos, "label", binary, header)
+        labels, pos = parseList(data, pos, "label", binary, header)
+        return offsets, labels
+
+    #faceList : N( n(a b c ...) ...)
+    m = _listPattern.match(data, _skipComments(data, pos))
+    nFaces = int(m.group(1))
+    values = np.fromstring(data[m.end():data.rfind(b")")].translate(_asciiTable), dtype=np.int64, sep=" ")
+    #Face sizes are found sequentially (python integers are much faster than numpy scalars here)
+    vals = values.tolist()
+    sizes = [0] * nFaces
+    i = 0
+    for iface in range(nFaces):
+        sizes[iface] = vals[i]
+        i += vals[i] + 1
+    offsets = np.zeros(nFaces+1, dtype=np.int64)
+    offsets[1:] = np.cumsum(sizes)
+    mask = np.ones(values.size, dtype=bool)
+    mask[offsets[:-1] + np.arange(nFaces)] = False
+    return offsets, values[mask]
+
+
+def readFaces(polyMeshDir):
+    """Read polyMesh/faces file
+    """
+    return readFacesData(readFoamBytes(os.path.join(polyMeshDir, "faces")))
@@ -158,17 +158,11 @@ def postProcessingFolder(objName, root='./'):
     pass
 
 def timeFolder(root='./', sort=True):
-    namestr=[]
-    nameval=[]
-    for key in os.listdir(root):
-        try:
-            nameval.append(float(key))
-            namestr.append(key)
-        except:
-            pass
-    if (len(nameval) and sort==True):
-        idx = np.argsort(nameval)
-        namestr = [namestr[i] for i in idx]
+    from timeIndex import listTimes
+    namestr = listTimes(root)
+    if not sort:
+        order = dict( (name, i) for i, name in enumerate(os.listdir(root)) )
+        namestr.sort(key = lambda name : order[name])
     return namestr
 
 def postProcessingDatFile(fname, objName=None, root='./'):
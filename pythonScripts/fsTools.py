@@ -10,11 +10,14 @@
 #########################################################################
 
 import os, subprocess, re
-from io import StringIO
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
 import pandas as pd
 import math as mt
-import scipy.interpolate as interp
+from pythonScripts.timeIndex import listTimes, getTimes
+from pythonScripts.stlTools import Stl, isBinaryStl, stlSolids
+from pythonScripts.grading import gradingN, gradingNodes
 
 # abenhamou: 2017-july-27
 
@@ -38,14 +41,7 @@ def foamFileExist(filename):
 def findBoundingBox(stlFile, verbose=True):
     stlFile = stlFile.split('.stl')[0] #remove .stl extension
     if verbose: print( "Compute STL bounding box: "+stlFile+'.stl')
-    p = subprocess.Popen("surfaceCheck "+stlFile+'.stl'+" | grep '^Bounding Box :' | sed \"s/.*: (//;s/[(,)]//g\" ", stdout=subprocess.PIPE, stderr=subprocess.PIPE, shell=True)
-    boundingBox,error = p.communicate()
-    if error:
-        print( 'error: ', error.decode('ascii'))
-        print('abort ...')
-        os._exit(1)
-    boundingBox = boundingBox.decode('ascii').split(' ')
-    boundingBox = [float(i) for i in boundingBox]
+    boundingBox = Stl.read(stlFile+'.stl').boundingBox
     if verbose: print( "   ",boundingBox)
     return boundingBox
 
@@ -85,21 +81,10 @@ def runCommand(cmd,showlog):
     pass
     
 def getFoamTimeFolders(dir,constant=False,inprocs=False):
-    found = []
-    if inprocs: dir += '/processor0/'
-    for val in os.listdir(dir):
-        try:
-            float(val)
-            found.append(val)
-        except ValueError:
-            pass
-    found.sort(key=float)
+    found = getTimes(dir, parallel=True) if inprocs else listTimes(dir)
     timeFolders = [dir+'/constant/'] if constant else []
-    if len(found):
-        for val in found:
-            timeFolders.append(val)
+    timeFolders += found
     return timeFolders
-    pass
     
 def getBool(string):
     if string in ['True','true','T','t','1']:
@@ -119,135 +104,198 @@ def checkError(file):
     return error
     
 def findSTLPatches(stlFile):
-    res = []
-    with open(stlFile) as f: lines = f.readlines()
-    for item in lines:
-         if item.lstrip().startswith('solid'):
-            res.append(item.lstrip().split('solid')[-1].strip())
-    return res
+    return stlSolids(stlFile)
 
 def translateStl(inputStl, val, outputStl):
-    val = "("+str(val[0])+" "+str(val[1])+" "+str(val[2])+")"
-    print("Translate stl by "+val+": " + inputStl)
-    subprocess.call("surfaceTransformPoints -translate '"+val+"' " + inputStl + " " + outputStl + " > /dev/null", shell=True)
+    print("Translate stl by ("+str(val[0])+" "+str(val[1])+" "+str(val[2])+"): " + inputStl)
+    Stl.read(inputStl).translate(val).write(outputStl, binary=isBinaryStl(inputStl))
     return True
 
 def rotateStl(inputStl, heading, outputStl):
     yaw = heading-180.0
     if str(yaw) == '0.0': return False
     print("Rotate stl (0 0 " + str(yaw) + "): " + inputStl)
-    subprocess.call("surfaceTransformPoints -rollPitchYaw '(0 0 "+str(heading-180.0)+")' " + inputStl + " " + outputStl + " > /dev/null", shell=True)
+    Stl.read(inputStl).rotate([0., 0., yaw]).write(outputStl, binary=isBinaryStl(inputStl))
     return True
 
-def createBoxStl(BB,name):
+def createBoxStl(BB,name,root='.'):
     Xmin,Ymin,Zmin,Xmax,Ymax,Zmax=BB[0],BB[1],BB[2],BB[3],BB[4],BB[5]
     tol = (Xmax-Xmin)*1e-6
-    filename = "./constant/triSurface/" + name
+    filename = os.path.join(root, "constant", "triSurface", name)
     print("Creating stl: " + filename)
     print("   ",BB)
-    subprocess.call("surfaceTransformPoints -scale '("+str(Xmax-Xmin-tol)+" "+str(Ymax-Ymin-tol)+" "+str(Zmax-Zmin-tol)+")' fsMesher/fsMesher_box.stl "+filename+" > /dev/null", shell=True)
-    subprocess.call("surfaceTransformPoints -translate '("+str(Xmin+0.5*tol)+" "+str(Ymin+0.5*tol)+" "+str(Zmin+0.5*tol)+")' "+filename+" "+filename+" > /dev/null", shell=True)
-    
-def readSections(inputFile,sections=[],sym=False):
-    
-    sdict = {}
-    
+    Stl.box([Xmin+0.5*tol, Ymin+0.5*tol, Zmin+0.5*tol, Xmax-0.5*tol, Ymax-0.5*tol, Zmax-0.5*tol], name=os.path.splitext(name)[0]).write(filename)
+
+def iterSections(inputFile):
+    """Iterate over the sections of a sections file (from Homer), reading it in a single pass
+
+    Each section starts with a "#Section N" line, followed by lines of (y, z) coordinates.
+
+    Yield (section number, array of (y, z) points)
+    """
+    isect, values = None, []
     with open(inputFile) as f:
-        if len(sections)==0:
-            sect = re.findall(r'(#Section \d+)',f.read())
-            for s in sect:
-                sections += [int(i) for i in s.split() if i.isdigit()]
+        for line in f:
+            if line.startswith('#'):
+                if isect is not None:
+                    yield isect, np.array(values, dtype=float).reshape(-1,2)
+                m = re.match(r'#Section (\d+)\s*$', line)
+                isect, values = (int(m.group(1)) if m else None), []
+            elif isect is not None:
+                values += line.split()
+    if isect is not None:
+        yield isect, np.array(values, dtype=float).reshape(-1,2)
 
-    with open(inputFile,'r') as f:
-        lines = f.read()
-    
-    for isect in sections:
-        string = r'(#Section '+str(isect)+r'\n)+([^#]*)'
-        table = re.findall(string, lines)
-        table = list(table[0])
-        rows = StringIO(table[1])
-        data = pd.read_csv(rows,header=None,sep=r'\s+',names=['y','z'])
-        
-        sdict[isect] = data[data.y>=0]
-        sdict[isect] = sdict[isect].assign(x= sdict[isect]['y'].values * 0.0)
-        sdict[isect] = sdict[isect].reindex(sorted(sdict[isect]),axis=1)
-        
+def readSectionArrays(inputFile,sections=None,sym=False):
+    """Read sections (from Homer) as arrays, in a single pass
+
+    Parameters
+    ----------
+    inputFile : str
+        Sections file
+    sections : list of int, default None
+        Sections to read, all sections if None (or empty)
+    sym : bool, default False
+        Add the symmetric part (y<0) of the sections
+
+    Returns
+    -------
+    dict {section number : array of (x, y, z) points}, with x=0 and y>=0 (y from -ymax to ymax if sym)
+    """
+    wanted = set(sections) if sections else None
+    sdict = {}
+    for isect, yz in iterSections(inputFile):
+        if (isect in sdict) or (wanted is not None and isect not in wanted): continue
+        yz = yz[yz[:,0]>=0]
+        sdict[isect] = np.column_stack((np.zeros(len(yz)), yz))
         if sym:
-            rsect = ((sdict[isect]*[1,-1,1]).iloc[1:,:]).iloc[::-1]
-            sdict[isect] = rsect.append(sdict[isect],ignore_index=True)
-            
+            sdict[isect] = np.concatenate((sdict[isect][:0:-1]*[1,-1,1], sdict[isect]))
+        if wanted is not None and len(sdict)==len(wanted): break
+
+    if wanted is not None:
+        missing = [i for i in sections if i not in sdict]
+        if len(missing)>0:
+            raise(ValueError("Sections {} not found in {}".format(missing, inputFile)))
+        sdict = {i : sdict[i] for i in sections}
     return sdict
 
-def createSectionStl(sdict,redistribute=False):
-    if not os.path.exists('geo'): os.makedirs('geo')
-    if not os.path.exists('stl'): os.makedirs('stl')
-    
+def readSections(inputFile,sections=None,sym=False):
+    """Read sections (from Homer), same as readSectionArrays with DataFrames (columns x, y, z)
+    """
+    return {isect : pd.DataFrame(xyz, columns=['x','y','z']) for isect, xyz in readSectionArrays(inputFile,sections,sym).items()}
+
+def sectionGeo(isect, section, redistribute=False, thk=10.0):
+    """Return the gmsh .geo script of a section (extruded spline, meshed with quads)
+
+    Parameters
+    ----------
+    isect : int
+        Section number
+    section : DataFrame (columns x, y, z) or array of (x, y, z) points
+        Half section (y>=0), see readSections
+    redistribute : bool, default False
+        Redistribute points uniformly along the section contour
+    thk : float, default 10.0
+        Extrusion thickness
+    """
+    xyz = np.asarray(section[['x','y','z']] if isinstance(section, pd.DataFrame) else section, dtype=float)
+
+    if redistribute:
+        #Redistribute points, interpolate according to curvilinear abscissa
+        ds = np.sqrt((np.diff(xyz, axis=0)**2).sum(axis=1))
+        s = np.concatenate(([0.], ds.cumsum()))
+        ss = np.linspace(s[0], s[-1], int(mt.ceil(s[-1]/(0.5*ds.mean()))))
+        xyz = np.column_stack([np.interp(ss, s, xyz[:,i]) for i in range(3)])
+
+    ns = mt.ceil(16*len(xyz))
+
+    #create symmetric
+    interpsect = np.concatenate((xyz[:0:-1]*[1,-1,1], xyz))
+
+    pSize = len(interpsect)
+    lSize=1.0
+    nx=1.0
+    ny=2.0*mt.ceil((interpsect[:,1].max()-interpsect[:,1].min())/(thk/nx))
+
+    points = np.column_stack((np.arange(pSize), interpsect[:,1:])).astype(object)
+    points[:,0] = points[:,0].astype(int)
+    return ( '// Section {:d}\n'.format(isect)
+           + 'thk={:.6e}; xmin=-0.5*thk;\n'.format(thk)
+           + 'p0=newp; pSize={:d};\n'.format(pSize)
+           + (pSize*'Point(p0+%d) = {xmin, %.6e, %.6e};\n') % tuple(points.ravel().tolist())
+           + 'l0=newl; lSize={:.2f};\n'.format(lSize)
+           + 'Spline(l0+0) = {{p0:p0+{:d}}};\n'.format(pSize - 1)
+           + 'Line(l0+lSize) = {p0+pSize-1,p0};\n'
+           + 'Extrude {thk, 0, 0} {\n'
+           + ' Line{l0:l0+lSize};\n'
+           + ' Recombine;\n'
+           + '}\n'
+           + 'Transfinite Line {{4, 5}} = {:.5f} Using Progression 1;\n'.format(nx)
+           + 'Transfinite Line {{2, 6}} = {:.5f} Using Progression 1;\n'.format(ny)
+           + 'Transfinite Line {{1, 3}} = {:.5f} Using Progression 1;'.format(ns)
+           + 'Transfinite Surface "*";\n'
+           + 'Recombine Surface "*";\n' )
+
+def _runGmsh(fgeo, fstl, key):
+    """Mesh fgeo with gmsh, and store the hash of the .geo script next to the STL if it succeeded
+    """
+    if os.path.exists(fstl): os.remove(fstl)
+    subprocess.call('gmsh -2 -format stl -o "'+fstl+'" "'+fgeo+'" > "'+fstl+'.log" 2>&1', shell=True)
+    if os.path.exists(fstl):
+        with open(fstl+'.sha1','w') as f: f.write(key)
+        return True
+    print('gmsh failed for {}, see {}.log'.format(fgeo, fstl))
+    return False
+
+def createSectionStl(sdict,redistribute=False,root='.',nWorkers=4,force=False):
+    """Create STL files of sections (root/stl/section_N.stl), meshing their .geo script (root/geo/section_N.geo) with gmsh
+
+    Parameters
+    ----------
+    sdict : dict
+        Sections (see readSections and readSectionArrays)
+    redistribute : bool, default False
+        Redistribute points uniformly along the section contour
+    root : str, default '.'
+        Directory containing geo and stl folders
+    nWorkers : int, default 4
+        Maximum number of concurrent gmsh
+    force : bool, default False
+        Mesh all sections. By default, a section is skipped if its STL exists and its .geo script is unchanged
+        (same hash as the one stored in section_N.stl.sha1)
+
+    Returns
+    -------
+    dict {section number : STL file}
+    """
+    for d in ['geo', 'stl']:
+        if not os.path.exists(os.path.join(root,d)): os.makedirs(os.path.join(root,d))
+
+    stlFiles, jobs = {}, []
     for isect in sdict.keys():
-        print('Section =',isect)
         name = 'section_'+str(isect)
-        mysect = sdict[isect]
-        
-        fgeo=os.path.join(r'geo/',name+'.geo');
-        fstl=os.path.join(r'stl/',name+'.stl');
-    
-        #Create .geo file
-        thk = 10.0
-        
-        if redistribute:
-            #Redistribute points
-            s = np.sqrt((mysect.diff()**2).sum(axis=1)).cumsum()
-            ds = 0.5 * np.sqrt((mysect.diff()*2).sum(axis=1)).mean()
-            ss = np.linspace(s.min(), s.max(), mt.ceil((s.max()-s.min())/ds))
-            
-            #interpolate according to curvilinear abscissa
-            fx = interp.interp1d(s,mysect.x); x = fx(ss)
-            fy = interp.interp1d(s,mysect.y); y = fy(ss)
-            fz = interp.interp1d(s,mysect.z); z = fz(ss)
-            
-            ns = mt.ceil(16*len(ss))
-        else:
-            x = mysect.x
-            y = mysect.y
-            z = mysect.z
-            
-            ns = mt.ceil(16*len(z))
-
-        #create symmetric
-        interpsect = pd.DataFrame({ 'x': np.concatenate((x,x[1:])),
-                                    'y': np.concatenate(( -1.0*y[:0:-1],y)),
-                                    'z': np.concatenate(( z[:0:-1],z)) })
-        
-
-        pSize = len(interpsect)
-        
-        lSize=1.0
-        nx=1.0
-        ny=2.0*mt.ceil((interpsect.max().y-interpsect.min().y)/(thk/nx))
+        fgeo = os.path.join(root,'geo',name+'.geo')
+        fstl = os.path.join(root,'stl',name+'.stl')
+        stlFiles[isect] = fstl
+
+        geo = sectionGeo(isect, sdict[isect], redistribute=redistribute)
+        key = hashlib.sha1(geo.encode()).hexdigest()
+        if not force and os.path.exists(fstl) and os.path.exists(fstl+'.sha1'):
+            with open(fstl+'.sha1') as f:
+                if f.read() == key:
+                    print('Section =',isect,'(unchanged, skipped)')
+                    continue
 
+        print('Section =',isect)
         print('writing to file: ', fgeo)
-        f = open(fgeo,'w')
-        f.write('// Section {:d}\n'.format(isect))
-        f.write('thk={:.6e}; xmin=-0.5*thk;\n'.format(thk))   
-        f.write('p0=newp; pSize={:d};\n'.format(pSize))
-        for i in range(pSize):
-            f.write('Point(p0+{:d}) = {{xmin, {:.6e}, {:.6e}}};\n'.format(i,interpsect.loc[i].y,interpsect.loc[i].z))
-        f.write('l0=newl; lSize={:.2f};\n'.format(lSize))
-        f.write('Spline(l0+0) = {{p0:p0+{:d}}};\n'.format(pSize - 1))
-        f.write('Line(l0+lSize) = {p0+pSize-1,p0};\n')
-        f.write('Extrude {thk, 0, 0} {\n')
-        f.write(' Line{l0:l0+lSize};\n')
-        f.write(' Recombine;\n')
-        f.write('}\n')
-        f.write('Transfinite Line {{4, 5}} = {:.5f} Using Progression 1;\n'.format(nx))
-        f.write('Transfinite Line {{2, 6}} = {:.5f} Using Progression 1;\n'.format(ny))
-        f.write('Transfinite Line {{1, 3}} = {:.5f} Using Progression 1;'.format(ns))
-        f.write('Transfinite Surface "*";\n')
-        f.write('Recombine Surface "*";\n')
-        f.close()
-
-        #Create STL
-        subprocess.call('gmsh -2 -format stl -o "'+fstl+'" "'+fgeo+'"', shell=True)
-        
+        with open(fgeo,'w') as f: f.write(geo)
+        jobs.append( (fgeo, fstl, key) )
+
+    #Create STL
+    with ThreadPoolExecutor(max_workers=nWorkers) as pool:
+        list(pool.map( lambda job : _runGmsh(*job), jobs ))
+    return stlFiles
+
 # return a list of numbers btw. 0 .. 1
 # dNd1_Ratio=dN/d1
 # x[0]=0, x[N]=1
@@ -255,32 +303,14 @@ def createSectionStl(sdict,redistribute=False):
 # x[n] = x1*sum(c^i)_(i=0..n-1) = x1*(1-c^n)/(1-c) (for all c != 1, n=1..N)
 # c = dNd1_Ratio^(1/(N-1))
 def simpleGrading(N, dNd1_Ratio):
-    x = [0,1]
-    if N <= 1:
-        return [0,1]
-    c = mt.pow(dNd1_Ratio, 1.0/(N-1))
-    if mt.fabs(c-1.0)<1e-6:
-        x = np.linspace(0,1,N+1)
-        return x.tolist()
-    x[1]=(1-c)/(1-mt.pow(c,float(N)))
-    for n in range(2,N):
-        x.append(x[1]*(1-mt.pow(c,float(n)))/(1.0-c))
-    x.append(1)
-    return x
-
-# given x1 compute N which produce the closest dNd1_Ratio 
+    """Relative position of the N+1 nodes of a block with end/start cell ratio dNd1_Ratio (see grading.gradingNodes)
+    """
+    return gradingNodes(N, dNd1_Ratio).tolist()
+
 def simpleGradingN(x1, dNd1_Ratio):
-    x1pre,N=1.0,0
-    while x1pre>x1:
-        N += 1
-        x = simpleGrading(N, float(dNd1_Ratio))
-        if x[1]<=x1:
-            if mt.fabs(x1pre-x1) < mt.fabs(x[1]-x1):
-                N -= 1
-            break
-        else:
-            x1pre=x[1]
-    return N
+    """Number of cells giving a first relative cell size closest to x1 (see grading.gradingN)
+    """
+    return gradingN(x1, float(dNd1_Ratio))
     
 def caseAlreadyDecomposed():
     isDecomposed = False
@@ -1,5 +1,6 @@
+from __future__ import print_function
+import numbers
 import numpy as np
-import copy
 from .misc import *
 from .point import Point
 from .line import Line
@@ -16,12 +17,43 @@ class extdb(dict):
     '''
     def __getattr__(self, attr):
         return self[attr]
-        
+
+class _store(object):
+    '''
+    Growable array of entities (one row per entity), with a map from gmsh id to row
+    '''
+    def __init__(self, width, dtype):
+        self.data = np.empty((64, width), dtype=dtype)
+        self.ids = np.empty(64, dtype=int)
+        self.size = 0
+        self.row = dict()
+
+    def append(self, ids, rows):
+        n = self.size + len(ids)
+        if n > len(self.data):
+            cap = max(n, 2*len(self.data))
+            self.data = np.concatenate([self.data[:self.size], np.empty((cap-self.size, self.data.shape[1]), dtype=self.data.dtype)])
+            self.ids = np.concatenate([self.ids[:self.size], np.empty(cap-self.size, dtype=int)])
+        self.data[self.size:n] = rows
+        self.ids[self.size:n] = ids
+        self.row.update(zip(ids, range(self.size, n)))
+        start, self.size = self.size, n
+        return start, n
+
+    def rows(self, ids):
+        return self.data[[self.row[abs(i)] for i in ids]]
+
 class geo(object):
+    _HEADER = [
+    '/* This script was generated using fsMesher.gmshScript */',
+    'Geometry.OldNewReg=0;'
+    ]
     def __init__(self):
         '''
         GMSH requires users to provide unique ID(s) for point(s), line(s), etc.
         and we need to keep track of these ID(s) manually
+        Points (x, y, z, lc) and lines (p0, p1) are stored in arrays, surfaces and volumes in dicts (id: list of ids).
+        The DB of each entity maps its hash key (see obj.hashKey()) to its id.
         '''
         self.__dict__[Point._ID_NAME] = 0
         self.__dict__[Line._ID_NAME] = 0
@@ -31,12 +63,13 @@ class geo(object):
         self.__dict__[Line._DB_NAME] = dict()
         self.__dict__[Surface._DB_NAME] = dict()
         self.__dict__[Volume._DB_NAME] = dict()
+        self._points = _store(4, float)
+        self._lines = _store(2, int)
+        self._surfaces = dict()
+        self._volumes = dict()
         self._EXTRUDE_ID = 0
         self._PHYS_IDS = []     # array of physical group id(s)
-        self._CODE = [
-        '/* This script was generated using fsMesher.gmshScript */',
-        'Geometry.OldNewReg=0;'
-        ]
+        self._BLOCKS = []       # (Point|Line, first row, last row) of the stores, or (None, code)
         return
 
     # for printing to terminal
@@ -50,83 +83,144 @@ class geo(object):
 
     def printDB(self):
         if not self.hasDB(Point):
-            print 'no data'
+            print('no data')
             return
         self._print_db(getDB(self,Point), prefix='p')
-        print 'next p:', getIDX(self,Point) + 1
+        print('next p:', getIDX(self,Point) + 1)
         self._print_db(getDB(self,Line), prefix='l')
-        print 'next l:', getIDX(self,Line) + 1
+        print('next l:', getIDX(self,Line) + 1)
         self._print_db(getDB(self,Surface), prefix='s')
-        print 'next s:', getIDX(self,Surface) + 1
+        print('next s:', getIDX(self,Surface) + 1)
         self._print_db(getDB(self,Volume), prefix='v')
-        print 'next v:', getIDX(self,Volume) + 1
-        print
+        print('next v:', getIDX(self,Volume) + 1)
+        print()
         self.printScript()
         return
 
     def _print_db(self, db, prefix=''):
         idx = sorted(db, key=db.get)
         for i in idx:
-            print prefix + str(db[i]), ':', i
+            print(prefix + str(db[i]), ':', i)
         return
 
+    def script(self):
+        '''
+        Return the geo-file content, the points and lines are formatted block by block
+        '''
+        out = list(geo._HEADER)
+        for obj, start, end in self._BLOCKS:
+            if obj is Point:
+                data = self._points.data[start:end]
+                ids = self._points.ids[start:end]
+                hasLc = ~np.isnan(data[:,3])
+                fmt = np.where(hasLc, 'Point(%d) = {' + ', '.join(4*[Point._FORMAT_FLOAT]) + '};',
+                                      'Point(%d) = {' + ', '.join(3*[Point._FORMAT_FLOAT]) + '};')
+                values = np.column_stack((ids, data)).astype(object)
+                values = [ v for row, lc in zip(values.tolist(), hasLc) for v in (row if lc else row[:4]) ]
+                out.append('\n'.join(fmt) % tuple(values))
+            elif obj is Line:
+                values = np.column_stack((self._lines.ids[start:end], self._lines.data[start:end]))
+                out.append('\n'.join((end-start) * ['Line(%d) = {%d,%d};']) % tuple(values.ravel().tolist()))
+            else:
+                out.append(start)
+        return '\n'.join(out)
+
     def printScript(self):
-        tmp = self._CODE
-        for i in tmp:
-            print i
+        print(self.script())
+        return
+
+    def write(self, filename):
+        with open(filename, 'w') as f:
+            f.write(self.script() + '\n')
+        return
+
+    def _code(self, code):
+        self._BLOCKS.append((None, code, None))
+        return
+
+    def _block(self, obj, start, end):
+        # points|lines written consecutively are formatted together
+        if end == start: return
+        if len(self._BLOCKS) and self._BLOCKS[-1][0] is obj and self._BLOCKS[-1][2] == start:
+            self._BLOCKS[-1] = (obj, self._BLOCKS[-1][1], end)
+        else:
+            self._BLOCKS.append((obj, start, end))
         return
 
     def add(self, obj):
         '''
-        Add a geometrical object to the code ... the actual code is generated in
-        obj.code(self) where the arg. self is needed for a proper check of id(s) 
+        Add a geometrical object to the code (only Point and Line are written explicitly, other entities are created
+        by extrusion)
         '''
-        obj_code = obj.code(self)
-        if obj_code:
-            self._CODE.append(obj_code)
-            self._db_insert(obj)
+        if isinstance(obj, Point):
+            self._insert_points(obj.pos, [np.nan if obj.lc is None else obj.lc], write=True)
+        elif isinstance(obj, Line):
+            self._insert_lines([obj.pid], write=True)
+        else:
+            raise RuntimeError('add: only Point and Line can be added')
         return
-        
+
     def addPoint(self, x, y, z, lc=None):
         p = Point(x,y,z,lc)
         self.add(p)
         return p
+    def addPoints(self, xyz, lc=None):
+        '''
+        Add an array of points (n,3), return their id(s) (existing id for duplicated points)
+        '''
+        xyz = np.asarray(xyz, dtype=float).reshape(-1,3)
+        lc = np.full(len(xyz), np.nan) if lc is None else np.broadcast_to(np.asarray(lc, dtype=float), (len(xyz),))
+        return self._insert_points(xyz, lc, write=True)[0]
     def addLine(self, p0, p1):
         l = Line(self,p0,p1)
         self.add(l)
         return l
+    def addLines(self, p0, p1):
+        '''
+        Add lines between arrays of point id(s), return their id(s)
+        '''
+        pid = np.column_stack((p0, p1))
+        for i in np.unique(np.abs(pid)):
+            if not self.has(Point, i): raise RuntimeError("addLines: Point {} does not exist in geo-file".format(i))
+        return self._insert_lines(pid, write=True)[0]
 
     def extrude(self, obj, dx, dy, dz, layers=1, opts=None):
         '''
         Extrude "point|line|surface" along translation axis
+        obj can also be an array of point id(s) (see addPoints), the new points and lines are then returned as id(s)
         '''
         # we need the object in a list format
-        objList = obj if isinstance(obj, list) else [obj]
-        if len(objList) == 0 or objList[0] is None: return
-        assert isinstance(dx, (int,long,float))
-        assert isinstance(dy, (int,long,float))
-        assert isinstance(dz, (int,long,float))
-        assert isinstance(layers, (str,int,list,np.ndarray))
+        if isinstance(obj, np.ndarray):
+            if len(obj) == 0: return
+            objList = None
+        else:
+            objList = obj if isinstance(obj, list) else [obj]
+            if len(objList) == 0 or objList[0] is None: return
+        assert isinstance(dx, numbers.Real)
+        assert isinstance(dy, numbers.Real)
+        assert isinstance(dz, numbers.Real)
+        assert isinstance(layers, (str,numbers.Integral,list,np.ndarray))
 
         #The layers are defined using two arrays i.e. Layers {{nElem[]},{nCut[]}}
         #The first array nElem[]={1,1,1,(n elements),1,1,1} defines the number of element created between each cut.
         #The second array nCut[]={0.1,0.2,(n cuts),...,1} defines the cut location (normalized) where the last cut must be at 100% i.e. 1
         layers_str='1'
-        if isinstance(layers, (int, long)):
+        if isinstance(layers, numbers.Integral):
             layers_str=str(layers)
         elif isinstance(layers, str):
             # user(s) need to provide a valid format here
             # e.g: '#n' or '{n,n,n,n}, {float,float,float,1}'
             layers_str=layers
         elif isinstance(layers, (np.ndarray,list)):
-            layerList = copy.deepcopy(layers)
-            layerList.sort()
-            maxVal = max(layerList) # for normalization
+            layerList = np.sort(np.asarray(layers, dtype=float))
+            maxVal = layerList.max() # for normalization
             # assume each cut has 1 element, and use only cut locations to control the extrude
-            nElem_str = ','.join(str(1) for i in layerList)
-            cut_str = ','.join(Point._FLOAT_TO_STR.format(float(i)/maxVal) for i in layerList)
+            nElem_str = ','.join(len(layerList) * ['1'])
+            cut_str = ','.join(len(layerList) * [Point._FORMAT_FLOAT]) % tuple(layerList / maxVal)
             layers_str = '{' + nElem_str + '},{' + cut_str + '}'
 
+        if objList is None:
+            return self._extrude_points(obj, [dx,dy,dz], layers_str, opts=opts)
         #
         # Scan the object list and determine the type
         # All element must be of the same type i.e. either Point|Line|Surface
@@ -142,9 +236,9 @@ class geo(object):
         elif isinstance(objList[0], Surface):
             return self._extrude_surfaces(objList, [dx,dy,dz], layers_str, opts=opts)
         else:
-            raise RuntimeError('The object to be extruded must be of type Point|Line|Surface')        
+            raise RuntimeError('The object to be extruded must be of type Point|Line|Surface')
         return
-    
+
     def hasDB(self,obj):
         return bool(getDB(self,obj))
 
@@ -152,56 +246,133 @@ class geo(object):
         self.__dict__[obj._ID_NAME] += n
         return
 
+    def has(self, obj, idx):
+        '''
+        Check if an entity of type obj (Point|Line|Surface|Volume) with id abs(idx) exists
+        '''
+        return abs(int(idx)) in self._entities(obj)
+
     def get(self, obj, idx):
-        db=getDB(self,obj)
-        allIdx=db.values()
-        if not abs(idx) in allIdx: return None
-        return obj.fromkey(db.keys()[allIdx.index(abs(idx))])
+        idx = abs(int(idx))
+        if not self.has(obj, idx): return None
+        if obj is Point:
+            row = self._points.data[self._points.row[idx]]
+            return Point(row[:3], lc=None if np.isnan(row[3]) else row[3])
+        elif obj is Line:
+            return Line(None, *self._lines.data[self._lines.row[idx]].tolist())
+        return obj(None, self._entities(obj)[idx])
 
-    def _create_idx_str(self, objList):
+    def _entities(self, obj):
+        if obj is Point: return self._points.row
+        if obj is Line: return self._lines.row
+        if obj is Surface: return self._surfaces
+        return self._volumes
+
+    def _ids(self, objList):
         idx = []
         for obj in objList:
-            if not obj.key() in getDB(self,obj):
+            found, i = exist(self, obj)
+            if not found:
                 raise RuntimeError('id not found: ' + str(obj))
-            idx.append(getDB(self,obj)[obj.key()])
-        return ','.join(str(i) for i in idx)
+            idx.append(i)
+        return idx
+
+    def _create_idx_str(self, objList):
+        return ','.join(str(i) for i in self._ids(objList))
+
+    def _insert_points(self, xyz, lc, write=False, extruded=False):
+        '''
+        Insert points (n,3) in the DB, return their id(s) and a mask of the new points
+        The id is incremented for each new point, or for each point if they are created by an extrusion (gmsh always
+        keeps incrementing the id by 1 !!!)
+        '''
+        xyz = np.asarray(xyz, dtype=float).reshape(-1,3)
+        db = getDB(self,Point)
+        idx = getIDX(self,Point)
+        ids = np.empty(len(xyz), dtype=int)
+        new = np.zeros(len(xyz), dtype=bool)
+        for i, key in enumerate(pointKeys(xyz)):
+            found = db.get(key)
+            if extruded or found is None: idx += 1
+            if found is None:
+                db[key] = idx
+                found = idx
+                new[i] = True
+            ids[i] = found
+        self.incIDX(Point, idx - getIDX(self,Point))
+        start, end = self._points.append(ids[new].tolist(), np.column_stack((xyz[new], np.asarray(lc, dtype=float)[new])))
+        if write: self._block(Point, start, end)
+        return ids, new
+
+    def _insert_lines(self, pid, write=False, extruded=False):
+        '''
+        Insert lines (n,2) in the DB, same as _insert_points
+        '''
+        pid = np.asarray(pid, dtype=int).reshape(-1,2)
+        if np.any(np.abs(pid[:,0]) == np.abs(pid[:,1])): raise RuntimeError("Line: Cannot construct lines of zero length")
+        db = getDB(self,Line)
+        idx = getIDX(self,Line)
+        ids = np.empty(len(pid), dtype=int)
+        new = np.zeros(len(pid), dtype=bool)
+        for i, (p0, p1) in enumerate(np.abs(pid).tolist()):
+            key = (p0, p1) if p0 < p1 else (p1, p0)
+            found = db.get(key)
+            if extruded or found is None: idx += 1
+            if found is None:
+                db[key] = idx
+                found = idx
+                new[i] = True
+            ids[i] = found
+        self.incIDX(Line, idx - getIDX(self,Line))
+        start, end = self._lines.append(ids[new].tolist(), pid[new])
+        if write: self._block(Line, start, end)
+        return ids, new
 
     def _db_insert(self, obj):
+        '''
+        Insert an entity created by an extrusion, return True if it is new
+        '''
+        if isinstance(obj, Point):
+            return bool(self._insert_points(obj.pos, [np.nan], extruded=True)[1][0])
+        if isinstance(obj, Line):
+            return bool(self._insert_lines([obj.pid], extruded=True)[1][0])
         found,idx = exist(self,obj)
         self.incIDX(obj,1)  # gmsh always keeps incrementing the id by 1 !!!
         if not found:
-            getDB(self,obj)[obj.key()] = getIDX(self,obj)
+            getDB(self,obj)[obj.hashKey()] = getIDX(self,obj)
+            self._entities(obj.__class__)[getIDX(self,obj)] = obj.lid if isinstance(obj, Surface) else obj.sid
             return True     # insert successful
         else:
             return False    # no need to insert, the obj already exists
-        
+
     def _extrude_points(self, pointList, axis, layers, opts=None):
         '''
         line[] = Extrude{dx, dy, dz} { Point{#ID}; Layers{{1,..(nElem)..,1},{0.1,..(nCut)..,1}}; };
         For each point extruded, 1 new point and 1 new line are created
-        '''        
-        out = extdb({
-        'newPoints': [],
-        'newLines': []
-        })
-        ok_to_extrude=False
-        for i in pointList:
-            newpoint = Point(np.asarray(axis) + i.pos)
-            if self._db_insert(newpoint): ok_to_extrude=True
-            newline = Line(self,i,newpoint)
-            if self._db_insert(newline): ok_to_extrude=True
-            out['newPoints'].append(newpoint)
-            out['newLines'].append(newline)
-        if ok_to_extrude:
-            idx_str = self._create_idx_str(pointList)
+        pointList is a list of Point, or an array of point id(s)
+        '''
+        asIds = isinstance(pointList, np.ndarray)
+        oldIds = np.asarray(pointList if asIds else self._ids(pointList), dtype=int)
+        xyz = self._points.rows(oldIds)[:,:3] + np.asarray(axis, dtype=float)
+        newIds, newPoints = self._insert_points(xyz, np.full(len(xyz), np.nan), extruded=True)
+        lineIds, newLines = self._insert_lines(np.column_stack((oldIds, newIds)), extruded=True)
+        if asIds:
+            out = extdb({ 'newPoints': newIds, 'newLines': lineIds })
+        else:
+            out = extdb({
+            'newPoints': [Point(p) for p in xyz],
+            'newLines': [Line(None, int(p0), int(p1)) for p0, p1 in zip(oldIds, newIds)]
+            })
+        if newPoints.any() or newLines.any():
+            idx_str = ','.join(str(i) for i in oldIds.tolist())
             axis_str = ','.join(Point._FLOAT_TO_STR.format(i) for i in axis)
             self._EXTRUDE_ID += 1
-            self._CODE.append(
+            self._code(
             'ex%d[] = Extrude {%s} { Point{%s}; Layers{%s}; };' %
             (self._EXTRUDE_ID, axis_str, idx_str, layers)
             )
         return out
-        
+
     def _extrude_lines(self, lineList, axis, layers, opts=None):
         '''
         surface[] = Extrude{dx, dy, dz} { Line{#ID}; Layers{{1,..(nElem)..,1},{0.1,..(nCut)..,1}}; };
@@ -248,7 +419,7 @@ class geo(object):
             axis_str = ','.join(Point._FLOAT_TO_STR.format(i) for i in axis)        
             opts_str = opts if opts is not None else 'Recombine;'
             self._EXTRUDE_ID += 1
-            self._CODE.append(
+            self._code(
             'ex%d[] = Extrude {%s} { Line{%s}; Layers{%s}; %s};' %
             (self._EXTRUDE_ID, axis_str, idx_str, layers, opts_str)
             )
@@ -344,7 +515,7 @@ class geo(object):
             axis_str = ','.join(Point._FLOAT_TO_STR.format(i) for i in axis)        
             opts_str = opts if opts is not None else 'Recombine;'
             self._EXTRUDE_ID += 1
-            self._CODE.append(
+            self._code(
             'ex%d[] = Extrude {%s} { Surface{%s}; Layers{%s}; %s};' %
             (self._EXTRUDE_ID, axis_str, idx_str, layers, opts_str)
             )
@@ -1,6 +1,6 @@
+from __future__ import print_function
+import numbers
 import numpy as np
-import math
-from scipy.optimize import fsolve
 
 
 def getIDX(geom, obj):
@@ -18,22 +18,33 @@ def remove_bracket(input_str):
     return input_str.replace('[','').replace(']','').replace(' ','')
     
 def exist(geom, obj):
-    db=getDB(geom,obj)
-    masterDBKeys=obj.masterDBKeys(geom)
-    masterKey=obj.key(master=True)
-    # we need the option to match only a substring of keys()
-    if masterKey in masterDBKeys: return True,db[db.keys()[masterDBKeys.index(masterKey)]]
+    '''
+    Return (True, id) if obj is already in geom, (False, next id) otherwise
+    '''
+    idx = getDB(geom,obj).get(obj.hashKey())
+    if idx is not None: return True, idx
     return False, getIDX(geom,obj) + 1
 
+def pointKeys(xyz, digits=7):
+    '''
+    Spatial hash of points: coordinates rounded to "digits" significant digits (the precision of the geo-file), as
+    tuples. Points written identically in the geo-file have the same key.
+    '''
+    xyz = np.asarray(xyz, dtype=float).reshape(-1,3)
+    mag = np.floor(np.log10(np.where(xyz==0., 1., np.abs(xyz))))
+    scale = np.power(10., digits - 1 - mag)
+    return [tuple(k) for k in (np.round(xyz*scale)/scale).tolist()]
+
 def stretch(method, n=None, r=None, opts=None):
     '''
-    Return stretched coordinate i.e. a list of numbers between 0 ... 1
+    Return stretched coordinate i.e. an array of numbers between 0 ... 1 (the
+    end of each element, the last one is 1)
     The supported stretched method(s) are as follows:
-    
+
         'ratio'     :   input n=(int, default:11), r=(float, default:2)
-                        Given the ratio between the first and the last element
+                        Given the ratio between the last and the first element
                         compute the position(s) for n element(s)
-        
+
         'rate'      :   input n=(int, default:11), r=(float, default:1.1)
                         r is the growth/shrink rate
                         E.g.: for r=1.1 the next cell is 1.1 larger
@@ -48,128 +59,112 @@ def stretch(method, n=None, r=None, opts=None):
 
         opts={'lastCell': (float)}
                         Same as firstCell, but instead the last cell is fixed.
-                        
-        Note: Avoid both 'firstCell' and 'lastCell' can be used simultaneously
+
+        Note: 'firstCell' and 'lastCell' cannot be used simultaneously
+
+    See stretchBatch to stretch several edges at once
     '''
     assert isinstance(method,str)
-    if n is not None: assert isinstance(n, (int,long))
-    if r is not None: assert isinstance(r, (int,long,float))
-    if opts is not None: assert isinstance(opts, dict)
-    if n<=0: n=None
-    if r<=0: r=None
-    if method.lower() not in {'ratio', 'rate'}:
+    if n is not None: assert isinstance(n, numbers.Integral)
+    if r is not None: assert isinstance(r, numbers.Real)
+    if opts is None: opts = {}
+    assert isinstance(opts, dict)
+    return stretchBatch(method, n, r, firstCell=opts.get('firstCell'), lastCell=opts.get('lastCell'))[0]
+
+def stretchBatch(method, n=None, r=None, firstCell=None, lastCell=None):
+    '''
+    Vectorized stretch, for several edges at once: n, r, firstCell and lastCell
+    can be arrays (broadcast together), "None" means free (or default value, see
+    stretch). The growth rates of all edges are solved together.
+    Return a list of arrays (stretched coordinate of each edge)
+    '''
+    method = method.lower()
+    if method not in {'ratio', 'rate'}:
         raise RuntimeError('stretch: unkown stretching method')
-    if method.lower() in {'ratio'}: return _stretch_ratio(n,r,opts)
-    if method.lower() in {'rate'}: return _stretch_rate(n,r,opts)   
-    return
+    if n is not None and np.all(np.asarray(n) <= 0): n=None
+    if r is not None and np.all(np.asarray(r) <= 0): r=None
+    if (firstCell is not None) and (lastCell is not None):
+        raise RuntimeError('stretch: firstCell and lastCell cannot be fixed simultaneously')
 
-def _stretch_ratio(n, r, opts):
-    print "DEBUG: Ratio-based stretching "
-    return
-    
-def _stretch_rate(n, r, opts):
-    #print "DEBUG: Rate-based stretching "
-    def stretch_func(h, n, r, inverse=False):
-        if inverse:
-            out=[1.0/h]
-            for i in range(1,n): out.append(out[-1]+pow(float(r),i)/h)
-            return out
-        else:
-            out=[h]
-            for i in range(1,n): out.append(out[-1]+h*pow(float(r),i))
-            return out
-        return
-    def check_limit(h):
-        if (h<=1e-10) or (h>1):
-            raise RuntimeError('_stretch_rate: firstCell must be a positive float less than 1')
-        else:
-            return h
-    if opts is None:
-        # n,r are fixed. Compute the first cell
-        if n is None: n=11
-        if r is None: r=1.1
-        oneOver_h=1.0;
-        for i in range(1,n): oneOver_h += pow(r,i)
-        return stretch_func(oneOver_h,n,r,inverse=True)
-    
-    #from this point on either 'n' or 'r' must be defined
+    # lastCell is fix.
+    # it is the firstCell of the reversed distribution, which has the inverse rate|ratio
+    if lastCell is not None:
+        out = stretchBatch(method, n, None if r is None else 1.0/np.asarray(r, dtype=float), firstCell=lastCell)
+        return [ np.append(1.0 - x[-2::-1], 1.0) for x in out ]
+
+    # n,r are fixed
+    if firstCell is None:
+        n, r = np.broadcast_arrays(np.asarray(11 if n is None else n, dtype=int),
+                                   np.asarray((1.1 if method=='rate' else 2.0) if r is None else r, dtype=float))
+        if method == 'ratio': r = np.power(r, 1.0/np.maximum(n-1, 1))
+        return _stretch_positions(n, r)
+
+    # firstCell is fix, from this point on either 'n' or 'r' must be defined
     if ((n is not None) and (r is not None)) or ((n is None) and (r is None)):
-        raise RuntimeError('_stretch_rate: when fixing the (first|last)Cell pls. define either "n" or "r" (not both)')
+        raise RuntimeError('stretch: when fixing the (first|last)Cell pls. define either "n" or "r" (not both)')
+    h = np.asarray(firstCell, dtype=float)
+    if np.any(h <= 1e-10) or np.any(h > 1):
+        raise RuntimeError('stretch: firstCell must be a positive float less than 1')
+    #
+    # define(firstCell, r), free(n)
+    # Note: we change r to preserve "h", by solving (firstCell, n) with free r
+    if n is None:
+        h, r = np.broadcast_arrays(h, np.asarray(r, dtype=float))
+        n = _stretch_n(method, h, r)
+    #
+    # define(firstCell, n), free(r)
+    # if h==1, the only solution is to have n=1, n==1 is only possible with h=1
+    h, n = np.broadcast_arrays(h, np.asarray(n, dtype=int))
+    n = np.where(np.abs(h-1.0) < 1e-10, 1, np.maximum(n, 2))
+    return _stretch_positions(n, _stretch_rate(h, n))
 
-    firstCell=None
-    lastCell=None
-    
-    # firstCell is fix.
-    if ('firstCell' in opts) and ('lastCell' not in opts):
-        h=check_limit(float(opts['firstCell']))
-        #
-        # if h==1, obviously the only solution is to have n=1, r=1
-        if math.fabs(h-1.0) < 1e-10:
-            return stretch_func(1.0, 1, 1.0)
-        #
-        # define(firstCell, n), free(r)
-        if r is None:
-            #print "DEBUG: n="+str(n), "r=free", "firstCell: ", h
-            # if n==1, the only solution is to have h=1 too, so we need to
-            # recompute "n" to preserve h
-            if n<=1:
-                return _stretch_rate(2, None, opts)
-            # check if r=1 is good enough
-            if math.fabs(1.0/n - h) < 1e-10:
-                return stretch_func(h, n, 1.0)
-            else:
-                # we need to solve a nonlinear equation, h*r^n - r - h + 1 = 0
-                # first we estimate the starting point
-                def f(x):
-                   return float(h) * x ** float(n) - x + 1.0 - h
-                def x0():
-                   x=math.exp(math.log(1.0/n/h)/(n - 1))
-                   if x > 1.0:
-                      return x + 0.5*(x-1.0)
-                   else:
-                      return 0.5 * x
-                r=fsolve(f, x0())[0]
-                #print "DEBUG: r: " + str(r)
-                return stretch_func(h, n, r)
-            pass
-        #
-        # define(firstCell, r), free(n)
-        # Note: we "may" need to change r to preserve "h", that's why we need to
-        # call _stretch_rate(...) with free r !!!
-        if n is None:
-            #print "DEBUG: n=free, r="+str(r), "firstCell: ", h
-            #
-            # check if r==1.0
-            if math.fabs(r-1.0) < 1e-10:
-                n=max(2,int(math.floor(1.0/h))) # the minimum n is 2
-                return _stretch_rate(n,None,opts)
-            #
-            # if r <= 1-h, we don't have a solution, so we are free to decide n,r
-            # here we take n closest to 1/h but smaller than 10
-            if math.fabs(r+h-1.0) < 1e-10:
-                n=min(10,max(2,int(math.floor(1.0/h)))) # min. 2, max. 10
-                return _stretch_rate(n,None,opts)
-            #
-            # we try the close-form expression for n
-            # FIXME: why r=0.95, h=0.02 failed?
-            
-            n=max(2,int(round(math.log((r+h-1.0)/h)/math.log(r))))
-            return _stretch_rate(n,None,opts)
-        pass
-        
-    # lastCell is fix.
-    if ('lastCell' in opts) and ('firstCell' not in opts):
-        # we compute it as it was the firstCell and then reverse it !!!
-        if r is None:
-            out=_stretch_rate(n,None,opts={'firstCell': float(opts['lastCell'])})
+def _stretch_positions(n, r):
+    '''
+    Normalized end position of the n cells of each edge, with growth rate r
+    '''
+    out = []
+    for ni, ri in zip(n.ravel().tolist(), r.ravel().tolist()):
+        x = np.cumsum(np.power(ri, np.arange(ni, dtype=float)))
+        out.append(x / x[-1])
+    return out
+
+def _stretch_n(method, h, r):
+    '''
+    Number of cells (closest integer) of edges with a first cell h and a growth
+    rate (or last/first ratio) r, minimum 2.
+    If there is no solution (e.g. the cells shrink too fast to fill the edge),
+    take n closest to 1/h but smaller than 10
+    '''
+    with np.errstate(divide='ignore', invalid='ignore'):
+        if method == 'rate':
+            # h*(r^n - 1)/(r - 1) = 1
+            n = np.log((r+h-1.0)/h)/np.log(r)
         else:
-            out=_stretch_rate(n,2.0-r,opts={'firstCell': float(opts['lastCell'])})
-        return np.asarray((1.0-np.array([0.0] + out))[::-1][1:])
-    
-    # firstCell and lastCell are defined simultaneously,
-    # for now, we don't support this
-    
-    return 
-   
-    
-    
+            # r = c^(n-1) and h*(c^n - 1)/(c - 1) = 1 give c = (1-h)/(1-r*h)
+            n = 1.0 + np.log(r)/np.log((1.0-h)/(1.0-r*h))
+        uniform = np.floor(1.0/h)
+        n = np.where(np.abs(r-1.0) < 1e-10, uniform,
+                     np.where(np.isfinite(n) & (n > 0), np.round(n), np.minimum(10, uniform)))
+    return np.maximum(2, n).astype(int)
+
+def _stretch_rate(h, n, tol=1e-14, maxIter=200):
+    '''
+    Growth rate of edges with n cells and a first cell h (vectorized Newton iteration)
+    r is the root (other than 1) of f(r) = h*r^n - r - h + 1, f is convex for r > 0:
+        - if h < 1/n, r > 1 and we start from the upper bound (1/h)^(1/(n-1))
+        - if h > 1/n, r < 1 and we start from 0
+    so that the iteration converges monotonically
+    '''
+    h = h.astype(float).ravel()
+    n = n.astype(float).ravel()
+    uniform = (n <= 1) | (np.abs(1.0/n - h) < 1e-10)
+    r = np.where(h*n < 1.0, np.power(1.0/h, 1.0/np.maximum(n-1.0, 1.0)), 0.0)
+    r[uniform] = 1.0
+    todo = ~uniform
+    for i in range(maxIter):
+        if not todo.any(): break
+        ht, nt, rt = h[todo], n[todo], r[todo]
+        dr = (ht*rt**nt - rt - ht + 1.0) / (ht*nt*rt**(nt-1.0) - 1.0)
+        r[todo] = rt - dr
+        todo[todo] = np.abs(dr) > tol*np.maximum(rt, 1.0)
+    return r
@@ -1,4 +1,4 @@
-import copy
+import numbers
 from .misc import *
 from .point import Point
 from .line import Line
@@ -17,11 +17,11 @@ class Surface(object):
                 found,pid = exist(geom,l)
                 if found: return pid
             else:
-                if geom.get(Line,l) is not None: return l
+                if geom.has(Line,l): return l
             raise RuntimeError("Surface: line not found: " + str(l))
             return None
-        for i in lineList: assert isinstance(i, (Line, int, long))
-        lid = unique_and_keep_order([check(i) for i in lineList])
+        for i in lineList: assert isinstance(i, (Line, numbers.Integral))
+        lid = unique_and_keep_order([int(check(i)) for i in lineList])
         if len(lid) < 3: return RuntimeError("Surface: need at least 3 lines")        
         # check all line id(s) and reverse it if needed due to the point connectivity
         self.lid = [lid.pop(0)]
@@ -51,28 +51,8 @@ class Surface(object):
 
     # for printing to terminal
     def __repr__(self):
-        return "s("+remove_bracket(str(self.dataFromKey(self.key())))+")"
+        return "s("+','.join(str(i) for i in self.lid)+")"
 
     # NOTE: for uniqueness the sorted idx is used as "key" in the database
-    def key(self, master=False):
-        keystr=remove_bracket(str(sorted(map(abs,self.lid)) + self.lid))
-        if master:
-            return remove_bracket(str(sorted(map(abs,self.lid))))
-        return keystr
-
-    # this is an alternative constructor which can be called directly as "Surface.fromkey(keystr)"
-    @classmethod
-    def fromkey(cls, keystr):
-        return Surface(None, cls.dataFromKey(keystr))
-    @classmethod
-    def masterDBKeys(cls, geom):
-        subkeys=copy.deepcopy(getDB(geom,cls).keys())
-        for i in range(0,len(subkeys)):
-            tmp=subkeys[i].split(',')
-            subkeys[i]=",".join(tmp[:len(tmp)/2])
-        return subkeys
-    @staticmethod
-    def dataFromKey(keystr):
-        lid=[int(i) for i in keystr.split(',')]
-        return lid[len(lid)/2:]
-
+    def hashKey(self):
+        return tuple(sorted(abs(i) for i in self.lid))
@@ -1,3 +1,4 @@
+import numbers
 from .misc import *
 from .point import Point
 from .line import Line
@@ -17,11 +18,11 @@ class Volume(object):
                 found,idx = exist(geom,s)
                 if found: return idx
             else:
-                if geom.get(Surface, s) is not None: return s
+                if geom.has(Surface, s): return s
             raise RuntimeError("Volume: Surface not found: " + str(s))
             return None
-        for s in surfList: assert isinstance(s, (Surface, int, long))
-        sid = unique_and_keep_order([check(s) for s in surfList])
+        for s in surfList: assert isinstance(s, (Surface, numbers.Integral))
+        sid = unique_and_keep_order([int(check(s)) for s in surfList])
         if len(sid) < 3: return RuntimeError("Volume: need at least 3 surfaces")
         # check all line id(s) and reverse it if needed due to the point connectivity
         self.sid = sid;        
@@ -29,24 +30,8 @@ class Volume(object):
 
     # for printing to terminal
     def __repr__(self):
-        return "v("+remove_bracket(str(self.dataFromKey(self.key())))+")"
+        return "v("+','.join(str(i) for i in self.sid)+")"
 
     # NOTE: for uniqueness the sorted idx is used as "key" in the database
-    def key(self, master=False):
-        keystr=remove_bracket(str(sorted(map(abs,self.sid)) + self.sid))
-        if master:
-            return remove_bracket(str(sorted(map(abs,self.sid))))
-        return keystr
-
-    # this is an alternative constructor which can be called directly as "Volume.fromkey(keystr)"
-    @classmethod
-    def fromkey(cls, keystr):
-        return Volume(None, cls.dataFromKey(keystr))
-    @classmethod
-    def masterDBKeys(cls, geom):
-        return getDB(geom,cls).keys()
-    @staticmethod
-    def dataFromKey(keystr):
-        sid=[int(i) for i in keystr.split(',')]
-        return sid[len(sid)/2:]
-
+    def hashKey(self):
+        return tuple(sorted(abs(i) for i in self.sid))
@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+import numpy as np
+
+"""
+  blockMesh simpleGrading in closed form.
+
+  A block of N cells with an end/start cell size ratio R has a constant expansion rate c = R**(1/(N-1)), so that the
+  nodes (relative to the block length) are x_n = (1 - c**n) / (1 - c**N), and the first cell size is
+  x_1 = (1 - c) / (1 - R*c).
+"""
+
+_tol = 1e-6
+
+
+def expansionRate(N, ratio):
+    """Expansion rate between two consecutive cells
+    """
+    N = np.asarray(N, dtype=float)
+    return np.power(float(ratio), 1.0 / np.maximum(N - 1., 1.))
+
+
+def firstCellSize(N, ratio):
+    """Relative size of the first cell of a block of N cells with end/start ratio (N can be an array)
+    """
+    N = np.asarray(N, dtype=float)
+    c = expansionRate(N, ratio)
+    uniform = np.abs(c - 1.0) < _tol
+    cs = np.where(uniform, 0., c)    #avoid division by zero, replaced below
+    res = np.where(uniform, 1. / np.maximum(N, 1.), (1. - cs) / (1. - float(ratio) * cs))
+    return np.where(N <= 1, 1., res)
+
+
+def gradingNodes(N, ratio):
+    """Relative position of the N+1 nodes of a graded block (0 to 1)
+    """
+    if N <= 1:
+        return np.array([0., 1.])
+    c = float(expansionRate(N, ratio))
+    if abs(c - 1.0) < _tol:
+        return np.linspace(0., 1., N+1)
+    x = (1. - np.power(c, np.arange(N+1, dtype=float))) / (1. - c**N)
+    x[0], x[-1] = 0., 1.
+    return x
+
+
+def gradingN(x1, ratio):
+    """Number of cells for which the first relative cell size is the closest to x1, for a given end/start ratio
+
+    The first cell size decreases with N, the smallest N with a first cell smaller than x1 is found by bisection,
+    and compared with N-1.
+    """
+    if x1 >= 1.:
+        return 0
+    hi = 2
+    while firstCellSize(hi, ratio) > x1:
+        hi *= 2
+    lo = hi // 2
+    while hi - lo > 1:
+        mid = (lo + hi) // 2
+        if firstCellSize(mid, ratio) > x1:
+            lo = mid
+        else:
+            hi = mid
+    N = hi
+    if abs(float(firstCellSize(N-1, ratio)) - x1) < abs(float(firstCellSize(N, ratio)) - x1):
+        N -= 1
+    return N
+
+
+def gradingRatio(x1, N, tol=1e-12):
+    """End/start ratio giving a first relative cell size x1 with N cells (bisection on the expansion rate)
+    """
+    if N <= 1:
+        return 1.
+    if abs(x1 * N - 1.) < _tol:
+        return 1.
+    f = lambda c : (1. - c) / (1. - c**N) - x1
+    #f decreases with c, c < 1 if the first cell is larger than the mean
+    lo, hi = (1e-6, 1. - 1e-12) if x1 > 1. / N else (1. + 1e-12, 2.)
+    while f(hi) > 0 and x1 < 1. / N:
+        hi *= 2
+    while hi - lo > tol * hi:
+        mid = 0.5 * (lo + hi)
+        if f(mid) > 0:
+            lo = mid
+        else:
+            hi = mid
+    return (0.5 * (lo + hi)) ** (N - 1)
+
+
+def gradedGrid(start, cuts, nCells, ratios):
+    """Node positions of consecutive graded blocks
+
+    Parameters
+    ----------
+    start : float
+        First node
+    cuts : list of float
+        End of each block
+    nCells : list of int
+        Number of cells of each block
+    ratios : list of float
+        End/start cell ratio of each block
+
+    Returns
+    -------
+    np.ndarray of nodes (sum(nCells)+1)
+    """
+    res = [ np.array([start], dtype=float) ]
+    for cut, N, ratio in zip(cuts, nCells, ratios):
+        x = gradingNodes(N, ratio)
+        nodes = res[-1][-1] + (cut - res[-1][-1]) * x[1:]
+        nodes[-1] = cut
+        res.append(nodes)
+    return np.concatenate(res)
@@ -24,116 +24,88 @@ import os
 from os.path import join
 from Pluto.Mesh.MeshHstar import Mesh
 
+from ideFoam.campaign import SeakeepingCampaign
+
+
+coreBudget = 72
+
+#Cases : all combinations of the grid. STL, meshes and cases already built with the same parameters are kept,
+#so that extending the grid only builds the new cases
+grid = { "ship"    : ['C01',
+#                     'C03', 'C05', 'C06', 'C07', 'C09', 'C10', 'C11', 'C12', 'C13', 'C14', 'C15', 'C17', 'C19', 'C26', 'C29',
+                     ],
+         "loading" : ['Full'],
+         "speed"   : [5.],
+         "heading" : [180.],
+         "waveT"   : [10.],
+         "waveH"   : [1.],
+       }
+
+#Ship dependent parameters { (code, loading) : {...} }
+shipParams = {
+#               ('C01', 'Full') : { "draft" : 11.2, "mass" : 1.2e8, "inertia" : [...], "COG" : [...] },
+             }
+
+meshParams = { "nProcs"     : 'auto',
+               "refBoxType" : 'wave',
+             }
+
+caseParams = { "nProcs"   : 'auto',
+               "waveType" : 'streamFunction',
+             }
+
+
+def setEnvironment(command):
+    """Update os.environ with the environment after command (module load...)
+    """
+    proc=subprocess.Popen([command + ' && env -0'], stdout = subprocess.PIPE, shell = True)
+    a = proc.stdout.read()
+    for b in a.split(b"\x00")[:-1]:
+        (key,  value) = b.decode().split('=',1)
+        os.environ[key] = value
+
+
+def createShipStl(code, loading, stlFile):
+    """Create ship STL (at exact trim) from the HydroStar database
+    """
+    reg = code_to_reg(code)
+    print (reg)
 
+    # load intel mpi libraries for HydroStar
+    setEnvironment('module load intel/2015.3.187 intelmpi/5.0.3.048')
 
+    createHST(reg, loading, database=env["database"] , withTrim = False )
 
-createSTL = False
-createMeshes = True
-createfoamCases = True
-createLaunchScript = True
-launchCFD = False
-
-
-speed = 5.
-
-lShips = [
-             ['C01', 'Full'],
-#              ['C03', 'Full'],
-#             ['C05', 'Full'],
-#             ['C06', 'Full'],
-#             ['C07', 'Full'],
-#             ['C09', 'Full'],
-#              ['C10', 'Full'],
-#             ['C11', 'Full'],
-#             ['C12', 'Full'],
-#             ['C13', 'Full'],
-#             ['C14', 'Full'],
-#             ['C15', 'Full'],
-#             ['C17', 'Full'],
-#             ['C19', 'Full'],
-#             ['C26', 'Full'],
-#             ['C29', 'Full'],
-         ]
-
-
-config = { "name" : "1" ,
-           "eqss" : 0.01,
-           "NB_HSTEP" : 8,
-           "dt" : 0.1 ,
-        
-   "nslam" : 15,
-           "SlammingAngle" : 45,
-           "GWMVELOCITY" : 2.0,
-           "SlammingPart" : 0.25,
-           "IDSS_DURATION" : 20.,
-           "weather" : "rec34"
-         }
-
-
-for code , loading in lShips :
-    reg = code_to_reg(code)
+    folder = join(env["output_path"], code, loading, r'Input_Files')
+
+    mesh=Mesh(join(folder,loading+".hst"))
+    mesh.makeConformal(0)
+    mesh.sym()
+    mesh.write(join(folder,"mesh_conformal.hst"))
+    stlWithoutTrim = stlFile[:-4] + "_without_trim.stl"
+    mesh.writeSTL(stlWithoutTrim)
 
-    #runFreq( code , loading, speed  , AmgParam = {"MPAR" : "50 20\n"}, wadim = [ 0.3, 2.4 , 0.3 ] , nbproc = 2 )
-    #runSpec( code, loading, speed, config, option = "time" )
-    #runSpec( code, loading, speed, config, option = "spec" )
-    if (createSTL == True):
-      print (reg)
-      
-      # load intel mpi libraries for HydroStar 
-      proc=subprocess.Popen(['module load intel/2015.3.187 intelmpi/5.0.3.048 && env -0'], stdout = subprocess.PIPE, shell = True)
-      a = proc.stdout.read()
-      for b in a.split(b"\x00")[:-1]:
-         (key,  value) = b.decode().split('=',1)
-         os.environ[key] = value
-
-
-      createHST(reg, loading, database=env["database"] , withTrim = False )
-
-      folder = join(env["output_path"], code, loading, r'Input_Files')
-  
-      OFfolder =  join(env["output_path"], code, loading, r'foamMesh')
-      if not os.path.exists(OFfolder):
-          os.makedirs(OFfolder)
-  
-      mesh=Mesh(join(folder,loading+".hst"))
-      mesh.makeConformal(0)
-      mesh.sym()
-      mesh.write(join(folder,"mesh_conformal.hst"))
-      mesh.writeSTL(join(OFfolder,r"ship_without_trim.stl"))
-    
     # unload intelmpi libraries (incompatible with OpenFOAM mpi library)
-      print ("Unload intelmpi libraries")
-      proc=subprocess.Popen(['module unload intelmpi/5.0.3.048 && env -0'], stdout = subprocess.PIPE, shell = True)
-      a = proc.stdout.read()
-      for b in a.split(b"\x00")[:-1]:
-         (key,  value) = b.decode().split('=',1)
-         os.environ[key] = value
+    print ("Unload intelmpi libraries")
+    setEnvironment('module unload intelmpi/5.0.3.048')
 
     # load of5.x
-      print ("load OpenFOAM environment")
-      proc=subprocess.Popen(['module load gcc/4.9.3 openmpi/1.8.4-gcc lapack/3.6.1/gcc/4.9.3 && export FOAM_INST_DIR=/data/I1608251/OpenFOAM && source /data/I1608251/OpenFOAM/OpenFOAM-5.x/etc/bashrc && export LC_ALL=C && env -0'], stdout = subprocess.PIPE, shell = True)
-      a = proc.stdout.read()
-      for b in a.split(b"\x00")[:-1]:
-         (key,  value) = b.decode().split('=',1)
-         os.environ[key] = value
- 
+    print ("load OpenFOAM environment")
+    setEnvironment('module load gcc/4.9.3 openmpi/1.8.4-gcc lapack/3.6.1/gcc/4.9.3 && export FOAM_INST_DIR=/data/I1608251/OpenFOAM && source /data/I1608251/OpenFOAM/OpenFOAM-5.x/etc/bashrc && export LC_ALL=C')
+
     # rotate stl to exact trim
-      trim=getTrim(reg, loading, database=env["database"] )
-      print ("Apllied trim angle: ", trim)
-    
-      OFRotateCommand = 'surfaceTransformPoints -yawPitchRoll \'(0 ' + str(trim) + ' 0)\' ' + join(OFfolder,r"ship_without_trim.stl") + ' ' + join(OFfolder,r"ship.stl")
-      print (OFRotateCommand)
-  
-      subprocess.call(['surfaceTransformPoints -yawPitchRoll \'(0 ' + str(trim) + ' 0)\' ' + join(OFfolder,r"ship_without_trim.stl") + ' ' + join(OFfolder,r"ship.stl")], shell = True)
-
- #subprocess.call('transformPoints
-
-    if (createMeshes == True):
-       pass
-
-    # launch fsMesher
-    
-    
-    if (createfoamCases == True):
-       pass
-    # launch fsCall
+    trim=getTrim(reg, loading, database=env["database"] )
+    print ("Apllied trim angle: ", trim)
+
+    OFRotateCommand = 'surfaceTransformPoints -yawPitchRoll \'(0 ' + str(trim) + ' 0)\' ' + stlWithoutTrim + ' ' + stlFile
+    print (OFRotateCommand)
+    subprocess.call([OFRotateCommand], shell = True)
+
+
+if __name__ == "__main__":
+    campaign = SeakeepingCampaign( env["output_path"], grid,
+                                   meshParams  = meshParams,
+                                   caseParams  = caseParams,
+                                   shipParams  = shipParams,
+                                   stlFunction = createShipStl )
+    campaign.run( coreBudget = coreBudget )
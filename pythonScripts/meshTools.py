@@ -22,7 +22,7 @@ def readPoints(polyMeshDir):
         raise(FileNotFoundError( 1, "{} or {} does not exists".format(pointsFile,pointsFileGZ) ))
     pattern = r"\(\n(.*)\)\n\)"
     s = StringIO( re.search(pattern, data, re.DOTALL).group(1).replace("(", "").replace(")", ""))
-    return pd.read_csv(s, delim_whitespace = True, header = None, names = ["x", "y", "z"] )
+    return pd.read_csv(s, sep = r"\s+", header = None, names = ["x", "y", "z"] )
 
 
 def readPointsBin( polyMeshDir ):
@@ -58,3 +58,34 @@ def getBounds(polyMeshDir):
              (float(points.y.min()) , float(points.y.max())),
              (float(points.z.min()) , float(points.z.max())),
            )
+
+
+def getNCells(polyMeshDir):
+    """Return number of cells of a polyMesh
+
+    The number of cells is read from the "note" entry of owner header, so that the file is not read entirely.
+    """
+    for fname in [os.path.join(polyMeshDir,'owner'), os.path.join(polyMeshDir,'owner.gz')]:
+        if os.path.isfile(fname):
+            opener = gzip.open if fname.endswith('.gz') else open
+            with opener(fname, "rb") as f :
+                head = f.read(4096)
+            m = re.search(rb"nCells:\s*(\d+)", head)
+            if m is not None:
+                return int(m.group(1))
+            #No note in header, read owner and neighbour
+            from pythonScripts.foamFile import readList
+            return int(max( readList(os.path.join(polyMeshDir,'owner')).max(), readList(os.path.join(polyMeshDir,'neighbour')).max() )) + 1
+    raise(FileNotFoundError( 1, "{} or {}.gz does not exists".format(os.path.join(polyMeshDir,'owner'),os.path.join(polyMeshDir,'owner')) ))
+
+
+def getNProcs(nCells, cellsPerCore=50000, coresPerNode=None, maxProcs=None):
+    """Return number of processors giving about "cellsPerCore" cells per core, rounded up to full nodes
+    """
+    nProcs = max(1, int(np.ceil(nCells / float(cellsPerCore))))
+    if coresPerNode is not None:
+        nProcs = int(np.ceil(nProcs / float(coresPerNode))) * coresPerNode
+        if maxProcs is not None: maxProcs = max(coresPerNode, (maxProcs // coresPerNode) * coresPerNode)
+    if maxProcs is not None:
+        nProcs = min(nProcs, maxProcs)
+    return nProcs
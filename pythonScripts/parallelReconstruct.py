@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+import os
+import time
+import math
+import subprocess
+from os.path import join
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from pythonScripts.fsTools import getFoamTimeFolders, foamFileExist
+
+
+def isReconstructed(case, timeName, fields=None):
+    """Check if "timeName" is already available in the case root directory
+    fields : list of str, default None
+        Fields to check. If None, all files available in processor0 are required.
+    """
+    tdir = join(case, timeName)
+    if not os.path.isdir(tdir):
+        return False
+    if fields is None:
+        pdir = join(case, "processor0", timeName)
+        fields = [f for f in os.listdir(pdir) if os.path.isfile(join(pdir, f))] if os.path.isdir(pdir) else []
+        fields = [f[:-3] if f.endswith(".gz") else f for f in fields]
+    return all(foamFileExist(join(tdir, f)) for f in fields)
+
+
+def timeRanges(timeNames, allTimes):
+    """Convert list of time folders to OpenFOAM time range option, contiguous folders (in allTimes) are merged.
+    example : ["0.1","0.2","0.3","0.5"] => "0.1:0.3,0.5"
+    """
+    index = {t : i for i, t in enumerate(allTimes)}
+    ranges = []
+    start = prev = timeNames[0]
+    for t in timeNames[1:]:
+        if index[t] != index[prev] + 1:
+            ranges.append(start if start == prev else "{}:{}".format(start, prev))
+            start = t
+        prev = t
+    ranges.append(start if start == prev else "{}:{}".format(start, prev))
+    return ",".join(ranges)
+
+
+def getNWorkers(nWorkers, maxCores=None, memPerWorker=None, maxMemory=None):
+    """Number of concurrent reconstructPar within core and memory budget (memory in GB)
+    """
+    if maxCores is None:
+        maxCores = os.cpu_count()
+    n = min(nWorkers, maxCores)
+    if memPerWorker is not None and maxMemory is not None:
+        n = min(n, int(maxMemory // memPerWorker))
+    return max(1, n)
+
+
+def reconstructPar(case, fields=None, times=None, nWorkers=4, chunkSize=None, maxCores=None, memPerWorker=None, maxMemory=None,
+                   skipExisting=True, verbose=True):
+    """Run several "reconstructPar -time a:b" processes concurrently over the available time folders
+
+    Parameters
+    ----------
+    case : str
+        Case directory
+    fields : list of str, default None
+        Fields to reconstruct (all fields if None)
+    times : list of str, default None
+        Time folders to reconstruct (all time folders available in processor directories if None)
+    nWorkers : int, default 4
+        Maximum number of concurrent reconstructPar
+    chunkSize : int, default None
+        Number of time folders handled by each reconstructPar call. Default gives about 4 chunks per worker.
+    maxCores : int, default None
+        Core budget (number of cpu if None)
+    memPerWorker : float, default None
+        Memory used by one reconstructPar process (GB)
+    maxMemory : float, default None
+        Memory budget (GB)
+    skipExisting : bool, default True
+        Do not reconstruct time folders already available in the case directory
+
+    Returns
+    -------
+    dict with number of time folders reconstructed, failed chunks and elapsed time
+    """
+    case = os.path.abspath(case)
+    allTimes = getFoamTimeFolders(case, inprocs=True)
+    if times is None:
+        times = allTimes
+    else:
+        times = [t for t in allTimes if t in set(str(i) for i in times)]
+
+    if skipExisting:
+        todo = [t for t in times if not isReconstructed(case, t, fields)]
+        if verbose : print("{} / {} time folders already reconstructed".format(len(times)-len(todo), len(times)))
+    else:
+        todo = list(times)
+
+    if len(todo) == 0:
+        return {"nTimes" : 0, "failed" : [], "elapsed" : 0.}
+
+    nWorkers = getNWorkers(nWorkers, maxCores, memPerWorker, maxMemory)
+    if chunkSize is None:
+        chunkSize = max(1, int(math.ceil(len(todo) / float(4*nWorkers))))
+    chunks = [todo[i:i+chunkSize] for i in range(0, len(todo), chunkSize)]
+
+    def run(ichunk):
+        chunk = chunks[ichunk]
+        cmd = ["reconstructPar", "-time", timeRanges(chunk, allTimes)]
+        if fields is not None:
+            cmd += ["-fields", "({})".format(" ".join(fields))]
+        with open(join(case, "log.reconstructPar.{}".format(ichunk)), "w") as log:
+            return subprocess.call(cmd, cwd=case, stdout=log, stderr=subprocess.STDOUT)
+
+    if verbose : print("Reconstruct {} time folders in {} chunks with {} workers".format(len(todo), len(chunks), nWorkers))
+    start = time.time()
+    done, failed = 0, []
+    with ThreadPoolExecutor(max_workers=nWorkers) as pool:
+        futures = {pool.submit(run, i) : i for i in range(len(chunks))}
+        for future in as_completed(futures):
+            ichunk = futures[future]
+            if future.result() != 0:
+                failed.append(ichunk)
+                print("reconstructPar failed for chunk {}, see log.reconstructPar.{}".format(ichunk, ichunk))
+            else:
+                done += len(chunks[ichunk])
+            if verbose:
+                elapsed = time.time() - start
+                print("{:5d} / {} time folders, {:.2f} times/s".format(done, len(todo), done / max(elapsed, 1e-6)))
+
+    elapsed = time.time() - start
+    if verbose : print("{} time folders reconstructed in {:.1f}s ({:.2f} times/s)".format(done, elapsed, done / max(elapsed, 1e-6)))
+    return {"nTimes" : done, "failed" : failed, "elapsed" : elapsed}
+
+
+if __name__ == "__main__" :
+
+    import argparse
+    parser = argparse.ArgumentParser(description='Run reconstructPar concurrently over time ranges')
+    parser.add_argument( '-case' ,  help='Case directory' , type = str,  default = ".")
+    parser.add_argument( '-fields' , help='Fields to reconstruct (use "," as separator)' , type = str,  default = None)
+    parser.add_argument( '-tmin' ,  help='Tmin' , type = float,  default = None)
+    parser.add_argument( '-tmax' ,  help='Tmax' , type = float,  default = None)
+    parser.add_argument( '-nWorkers', '-n', help='Number of concurrent reconstructPar' , type = int,  default = 4)
+    parser.add_argument( '-chunkSize' , help='Number of time folders per reconstructPar call' , type = int,  default = None)
+    parser.add_argument( '-maxCores' , help='Core budget' , type = int,  default = None)
+    parser.add_argument( '-memPerWorker' , help='Memory used by one reconstructPar (GB)' , type = float,  default = None)
+    parser.add_argument( '-maxMemory' , help='Memory budget (GB)' , type = float,  default = None)
+    parser.add_argument( '-all' , help='Also reconstruct time folders already available' , action="store_true")
+
+    args = parser.parse_args()
+    fields = args.fields.split(",") if args.fields is not None else None
+    times = None
+    if args.tmin is not None or args.tmax is not None:
+        tmin = -1e30 if args.tmin is None else args.tmin
+        tmax = 1e30 if args.tmax is None else args.tmax
+        times = [t for t in getFoamTimeFolders(args.case, inprocs=True) if tmin <= float(t) <= tmax]
+    res = reconstructPar( args.case, fields = fields, times = times, nWorkers = args.nWorkers, chunkSize = args.chunkSize,
+                          maxCores = args.maxCores, memPerWorker = args.memPerWorker, maxMemory = args.maxMemory,
+                          skipExisting = not args.all )
+    if len(res["failed"]) > 0:
+        os._exit(1)
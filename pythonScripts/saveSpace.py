@@ -1,43 +1,172 @@
 #!/usr/bin/python
 import shutil
 import os
+import re
+import subprocess
 from os.path import join
-from seaKeepingVtkPicture import is_number
+from concurrent.futures import ThreadPoolExecutor
+from pythonScripts.timeIndex import selectTimes, timeEntries, listTimes
 
 
 def cleanFolder( caseDir , tmin , tmax, verbose = False ) :
-    for f in os.listdir(caseDir) :
-        if os.path.isdir( join(caseDir, f) ) and is_number(f) :
-            if tmin < float(f) < tmax :
-                r = join( caseDir , f )
-                if verbose : print ("cleaning" + r)
-                os.system("rm -rf {}".format(r))
-                #shutil.rmtree( r ) too slow !
+    for f in selectTimes( caseDir, tmin, tmax, parallel = False, strict = True ) :
+        r = join( caseDir , f )
+        if verbose : print ("cleaning" + r)
+        os.system("rm -rf {}".format(r))
+        #shutil.rmtree( r ) too slow !
 
 
-def cleanCase( caseDir , tmin, tmax, verbose , parallel = "auto" ) :
-    """Remove data between tmin and tmax
+def getProcDirs( caseDir , parallel = "auto" ) :
+    """Return list of directories containing time folders (processor directories or case directory)
     """
-    #Automatically choose ( parallel vs (serial/notRun))
-    if parallel == "auto" :
-        if os.path.exists( os.path.join(caseDir , "processor0") ) : parallel = True
-        else : parallel = False
+    procDirs = sorted( [ join(caseDir, p) for p in os.listdir( caseDir ) if re.match(r"processors?\d+$", p) ] )
+    if parallel == "auto" : parallel = len(procDirs) > 0
+    if parallel : return procDirs
+    return [ caseDir ]
 
-    if parallel :
-        for p in os.listdir( caseDir ) :
-            if "processor" in p : cleanFolder( os.path.abspath( join(caseDir,p )) , tmin , tmax, verbose = verbose )
-    else :
-        cleanFolder( os.path.abspath( caseDir ) , tmin , tmax , verbose = verbose )
+
+def getSize( path ) :
+    """Return size (bytes) of a directory
+    """
+    size = 0
+    for root, dirs, files in os.walk(path) :
+        for f in files :
+            try : size += os.lstat( join(root, f) ).st_size
+            except OSError : pass
+    return size
+
+
+def isRestartTime( procDirs, timeName ) :
+    """Check that "timeName" is complete in all processor directories and can be used for restart
+    """
+    for d in procDirs :
+        if timeName not in listTimes(d) : return False
+    return os.path.exists( join( procDirs[0], timeName, "uniform", "time" ) )
+
+
+def selectTimesToRemove( entries, tmin = None, tmax = None, keepEvery = None, keepLast = None, keepNear = None, nearTol = None, keep = [] ) :
+    """Apply retention policy to list of (name, value) of time folders (sorted)
+
+    Parameters
+    ----------
+    entries : list of (str, float)
+        Available time folders
+    tmin, tmax : float
+        Only time folders with tmin < t < tmax are removed (all time folders if None)
+    keepEvery : int
+        Keep one time folder every "keepEvery"
+    keepLast : int
+        Keep the last "keepLast" time folders
+    keepNear : list of float
+        Keep the time folder closest to each of these instants
+    nearTol : float
+        Maximum distance for "keepNear". If None, the closest time folder is always kept.
+    keep : list of str
+        Time folders to keep anyway
+
+    Returns
+    -------
+    List of time folders names to remove. The first time folder (initial condition) is never removed.
+    """
+    keepSet = set(keep)
+    if len(entries) > 0 : keepSet.add( entries[0][0] )
+    if keepEvery is not None and keepEvery > 0 :
+        keepSet.update( name for i, (name, value) in enumerate(entries) if i % keepEvery == 0 )
+    if keepLast is not None and keepLast > 0 :
+        keepSet.update( name for name, value in entries[-keepLast:] )
+    if keepNear is not None and len(entries) > 0 :
+        for t in keepNear :
+            name, value = min( entries, key = lambda e : abs(e[1] - t) )
+            if nearTol is None or abs(value - t) <= nearTol : keepSet.add(name)
+    res = []
+    for name, value in entries :
+        if name in keepSet : continue
+        if tmin is not None and value <= tmin : continue
+        if tmax is not None and value >= tmax : continue
+        res.append(name)
+    return res
+
+
+def _removeBatch( paths ) :
+    #shutil.rmtree is too slow, a single "rm" call handles the whole batch
+    subprocess.call( ["rm", "-rf"] + paths )
+
+
+def cleanCase( caseDir , tmin = None, tmax = None, verbose = False , parallel = "auto", keepEvery = None, keepLast = None,
+               keepNear = None, nearTol = None, keepRestart = True, dryRun = False, nWorkers = 8, batchSize = 200,
+               removeAll = False ) :
+    """Remove time folders according to retention policy (see selectTimesToRemove)
+
+    removeAll : bool, default False
+        Without time window (tmin/tmax) nor keep policy (keepEvery/keepLast/keepNear), nothing is removed unless removeAll
+        is True
+    keepRestart : bool, default True
+        Always keep the latest time folder that is complete in all processor directories
+    dryRun : bool, default False
+        Only report what would be removed, and the space reclaimed
+    nWorkers : int, default 8
+        Number of concurrent deletions (or size computation with dryRun)
+
+    Return the list of removed time folders
+    """
+    if not removeAll and all( v is None for v in (tmin, tmax, keepEvery, keepLast, keepNear) ) :
+        raise(ValueError("No time window (tmin/tmax) nor keep policy given, use removeAll=True to remove all time folders"))
+
+    caseDir = os.path.abspath( caseDir )
+    procDirs = getProcDirs( caseDir , parallel )
+    entries = timeEntries( procDirs[0] )
+
+    keep = []
+    if keepRestart :
+        for name, value in reversed(entries) :
+            if isRestartTime( procDirs, name ) :
+                keep.append(name)
+                break
+
+    toRemove = selectTimesToRemove( entries, tmin = tmin, tmax = tmax, keepEvery = keepEvery, keepLast = keepLast,
+                                    keepNear = keepNear, nearTol = nearTol, keep = keep )
+    print ("{} / {} time folders to remove in {} directories".format( len(toRemove), len(entries), len(procDirs) ))
+    if verbose :
+        for name in toRemove : print ("cleaning " + name)
+    if len(toRemove) == 0 : return toRemove
+
+    #Path to remove, processor by processor (time folders may not be available in all processors)
+    toRemoveSet = set(toRemove)
+    paths = []
+    for d in procDirs :
+        paths += [ join(d, name) for name in listTimes(d) if name in toRemoveSet ]
+
+    with ThreadPoolExecutor( max_workers = nWorkers ) as pool :
+        if dryRun :
+            size = sum( pool.map( getSize, paths ) )
+            print ("Dry run : {:.3f} GB ({:d} bytes) would be reclaimed".format( size / 1024.**3, size ))
+        else :
+            batches = [ paths[i:i+batchSize] for i in range(0, len(paths), batchSize) ]
+            list( pool.map( _removeBatch, batches ) )
+    return toRemove
 
 
 if __name__ == "__main__" :
 
     import argparse
     parser = argparse.ArgumentParser(description='Remove time step data')
-    parser.add_argument( '-tmin'  ,  help='Tmin ' , type = float )
-    parser.add_argument( '-tmax'  ,  help='Tmax ' , type = float )
+    parser.add_argument( '-tmin'  ,  help='Tmin ' , type = float, default = None )
+    parser.add_argument( '-tmax'  ,  help='Tmax ' , type = float, default = None )
     parser.add_argument( '-case' ,  help='Quantity to plot' , type = str,  default = ".")
+    parser.add_argument( '-keepEvery' , help='Keep one time folder every N' , type = int,  default = None)
+    parser.add_argument( '-keepLast' , help='Keep the last K time folders' , type = int,  default = None)
+    parser.add_argument( '-keepNear' , help='Keep time folders closest to these instants (use "," as separator)' , type = str,  default = None)
+    parser.add_argument( '-nearTol' , help='Tolerance for keepNear' , type = float,  default = None)
+    parser.add_argument( '-all' , help='Remove all time folders if no time window nor keep policy is given' , action="store_true")
+    parser.add_argument( '-noRestart' , help='Do not keep the latest restart time' , action="store_true")
+    parser.add_argument( '-nWorkers', '-n', help='Number of concurrent deletions' , type = int,  default = 8)
+    parser.add_argument( '-dryRun' , help='Only report the space that would be reclaimed' , action="store_true")
     parser.add_argument( '-verbose', '-v', help='verbose ouptut' , action="store_true")
 
     args = parser.parse_args()
-    cleanCase(  caseDir = args.case , tmin =  args.tmin , tmax = args.tmax , verbose = args.verbose  )
+    if not args.all and all( v is None for v in (args.tmin, args.tmax, args.keepEvery, args.keepLast, args.keepNear) ) :
+        parser.error("no time window (-tmin/-tmax) nor keep policy (-keepEvery/-keepLast/-keepNear) given, use -all to remove all time folders")
+    keepNear = [ float(t) for t in args.keepNear.split(",") ] if args.keepNear is not None else None
+    cleanCase(  caseDir = args.case , tmin =  args.tmin , tmax = args.tmax , verbose = args.verbose,
+                keepEvery = args.keepEvery, keepLast = args.keepLast, keepNear = keepNear, nearTol = args.nearTol,
+                keepRestart = not args.noRestart, dryRun = args.dryRun, nWorkers = args.nWorkers, removeAll = args.all )
@@ -2,6 +2,7 @@
 import os
 import numpy as np
 import vtk
+from pythonScripts.timeIndex import getTimeMap
 
 try:
     from Pluto.System import Chrono
@@ -18,11 +19,7 @@ def is_number(s):
 
 
 def getAvailableTimeData(caseDir, parallel):
-    if parallel:
-        d = os.path.join(caseDir, "processor0")
-    else:
-        d = caseDir
-    return sorted([float(f) for f in os.listdir(d) if is_number(f) and os.path.isdir(os.path.join(d, f))])
+    return list(getTimeMap(caseDir, parallel=parallel).values())
 
 
 def getFreeSurfaceActor(vtk_r, scale = [1,1,1], fsRange = None):
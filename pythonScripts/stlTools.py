@@ -0,0 +1,309 @@
+#!/usr/bin/env python
+import os
+import re
+import numpy as np
+
+"""
+  STL surfaces (ascii or binary, with several solids), read, transformed and written without OpenFOAM utilities.
+
+  Triangles are stored in a single float32 array of shape (nTriangles, 3, 3). Solids are stored as (name, start, end)
+  ranges of triangles, so that transformations apply to the whole surface at once.
+
+  Example
+  -------
+  >>> stl = Stl.read("hull.stl") + Stl.read("deck.stl")
+  >>> stl.translate([0., 0., -11.75])
+  >>> stl.rotate([0., 0., 10.])
+  >>> print(stl.boundingBox, stl.solidNames)
+  >>> stl.write("ship.stl")
+"""
+
+_binaryDtype = np.dtype([("normal", "<f4", (3,)), ("vertices", "<f4", (3, 3)), ("attribute", "<u2")])
+_solidPattern = re.compile(rb"^[ \t]*solid[ \t]*([^\r\n]*)$", re.M)
+_endSolidPattern = re.compile(rb"^[ \t]*endsolid", re.M)
+_vertexPattern = re.compile(rb"vertex\s+(\S+\s+\S+\s+\S+)")
+
+
+def isBinaryStl(filename):
+    """Return True if filename is a binary STL file (from its size)
+    """
+    size = os.path.getsize(filename)
+    if size < 84:
+        return False
+    with open(filename, "rb") as f:
+        f.seek(80)
+        nTriangles = int(np.frombuffer(f.read(4), dtype="<u4")[0])
+    return size == 84 + 50 * nTriangles
+
+
+def rotationMatrix(rollPitchYaw):
+    """Rotation matrix from roll, pitch and yaw angles (degrees), as surfaceTransformPoints -rollPitchYaw
+
+    OpenFOAM composes the rotations as quaternion(x, roll) * quaternion(y, pitch) * quaternion(z, yaw), so that the
+    matrix is Rx.Ry.Rz (the yaw is applied first, in the fixed frame).
+    """
+    r, p, y = np.radians(rollPitchYaw)
+    Rx = np.array([[1., 0., 0.], [0., np.cos(r), -np.sin(r)], [0., np.sin(r), np.cos(r)]])
+    Ry = np.array([[np.cos(p), 0., np.sin(p)], [0., 1., 0.], [-np.sin(p), 0., np.cos(p)]])
+    Rz = np.array([[np.cos(y), -np.sin(y), 0.], [np.sin(y), np.cos(y), 0.], [0., 0., 1.]])
+    return Rx.dot(Ry).dot(Rz)
+
+
+def _lineBlocks(f, blockSize):
+    """Read binary file object f by blocks of complete lines
+    """
+    rest = b""
+    while True:
+        block = f.read(blockSize)
+        if not block:
+            if rest : yield rest
+            return
+        block = rest + block
+        i = block.rfind(b"\n")
+        if i < 0:
+            rest = block
+            continue
+        rest = block[i+1:]
+        yield block[:i+1]
+
+
+def _binaryName(header, filename):
+    name = os.path.splitext(os.path.basename(filename))[0]
+    if header.startswith(b"solid "):
+        name = header[6:80].split(b"\0")[0].strip().decode(errors="replace") or name
+    return name
+
+
+def _asciiFacets(vertices, normals=None):
+    """Ascii STL facets (bytes) of triangles given as array (n, 3, 3)
+    """
+    facet = " facet normal %.9g %.9g %.9g\n  outer loop\n" + "   vertex %.9g %.9g %.9g\n" * 3 + "  endloop\n endfacet\n"
+    if normals is None:
+        normals = Stl(vertices).normals
+    values = np.concatenate([normals, vertices.reshape(-1, 9)], axis=1).astype(np.float64)
+    return ((facet * len(values)) % tuple(values.ravel())).encode()
+
+
+def _scanStl(filename, out=None, boundingBox=False, blockSize=1<<24):
+    """Single pass over filename : return solid names (and bounding box), optionally copying the file to the (binary)
+    file object out, binary files being converted to ascii
+    """
+    bb = [ np.full(3, np.inf), np.full(3, -np.inf) ]
+    def updateBB(p):
+        if p.size:
+            bb[0] = np.minimum(bb[0], p.min(axis=0))
+            bb[1] = np.maximum(bb[1], p.max(axis=0))
+
+    names = []
+    if isBinaryStl(filename):
+        with open(filename, "rb") as f:
+            header = f.read(84)
+            names.append(_binaryName(header, filename))
+            if out is not None : out.write("solid {}\n".format(names[0]).encode())
+            while True:
+                data = np.frombuffer(f.read(_binaryDtype.itemsize * (blockSize // 200)), dtype=_binaryDtype)
+                if data.size == 0 : break
+                if boundingBox : updateBB(data["vertices"].reshape(-1, 3))
+                if out is not None : out.write(_asciiFacets(data["vertices"], data["normal"]))
+            if out is not None : out.write("endsolid {}\n".format(names[0]).encode())
+    else:
+        block = b"\n"
+        with open(filename, "rb") as f:
+            for block in _lineBlocks(f, blockSize):
+                names += [ m.group(1).strip().decode(errors="replace") for m in _solidPattern.finditer(block) ]
+                if boundingBox:
+                    updateBB( np.array(b" ".join(_vertexPattern.findall(block)).split(), dtype=np.float32).reshape(-1, 3) )
+                if out is not None:
+                    out.write(block)
+            if out is not None and not block.endswith(b"\n"):
+                out.write(b"\n")
+    if boundingBox:
+        return names, [ float(v) for v in np.concatenate(bb) ]
+    return names
+
+
+def stlSolids(filename):
+    """Return names of the solids of STL file, without loading the triangles
+    """
+    return _scanStl(filename)
+
+
+def stlInfo(filename):
+    """Return solid names and bounding box [xmin, ymin, zmin, xmax, ymax, zmax] of STL file, in a single pass
+    """
+    return _scanStl(filename, boundingBox=True)
+
+
+def mergeStlFiles(stlFiles, output, boundingBox=False):
+    """Concatenate STL files (copied by blocks, binary files are converted to ascii) in a single multi-solid ascii file
+
+    Return the solid names (and the bounding box if boundingBox is True), collected while copying
+    """
+    names = []
+    bb = None
+    tmp = output + ".tmp"
+    with open(tmp, "wb") as out:
+        for fstl in stlFiles:
+            res = _scanStl(fstl, out=out, boundingBox=boundingBox)
+            if boundingBox:
+                res, b = res
+                bb = b if bb is None else [ min(bb[i], b[i]) for i in range(3) ] + [ max(bb[i], b[i]) for i in range(3, 6) ]
+            names += res
+    os.replace(tmp, output)
+    return (names, bb) if boundingBox else names
+
+
+class Stl(object):
+    """STL surface
+
+    Parameters
+    ----------
+    triangles : np.ndarray
+        Vertices of triangles, shape (nTriangles, 3, 3)
+    solids : list of (str, int, int)
+        Name, first and last+1 triangle of each solid. Default to a single solid named "name"
+    name : str, default "surface"
+        Name of the solid, if solids is not given
+    """
+
+    def __init__(self, triangles, solids=None, name="surface"):
+        self.triangles = np.ascontiguousarray(triangles, dtype=np.float32).reshape(-1, 3, 3)
+        self.solids = [(name, 0, len(self.triangles))] if solids is None else list(solids)
+
+    @classmethod
+    def read(cls, filename):
+        """Read ascii or binary STL file
+        """
+        name = os.path.splitext(os.path.basename(filename))[0]
+        if isBinaryStl(filename):
+            with open(filename, "rb") as f:
+                header = f.read(84)
+                data = np.frombuffer(f.read(), dtype=_binaryDtype)
+            return cls(data["vertices"], name=_binaryName(header, filename))
+
+        with open(filename, "rb") as f:
+            content = f.read()
+        starts = list(_solidPattern.finditer(content))
+        if len(starts) == 0:
+            raise(ValueError("{} is not a valid STL file".format(filename)))
+        triangles, solids, n = [], [], 0
+        for i, m in enumerate(starts):
+            end = starts[i+1].start() if i+1 < len(starts) else len(content)
+            block = content[m.end():end]
+            e = _endSolidPattern.search(block)
+            if e is not None : block = block[:e.start()]
+            values = np.array(b" ".join(_vertexPattern.findall(block)).split(), dtype=np.float32)
+            nTri = values.size // 9
+            triangles.append(values.reshape(nTri, 3, 3))
+            solids.append( (m.group(1).strip().decode(errors="replace") or name, n, n + nTri) )
+            n += nTri
+        return cls(np.concatenate(triangles), solids=solids)
+
+    @classmethod
+    def box(cls, BB, name="box"):
+        """Box [xmin, ymin, zmin, xmax, ymax, zmax], with outward normals
+        """
+        x = [BB[0], BB[3]]
+        y = [BB[1], BB[4]]
+        z = [BB[2], BB[5]]
+        p = np.array([[x[i], y[j], z[k]] for i in range(2) for j in range(2) for k in range(2)])
+        faces = [(0,1,3),(0,3,2),(4,6,7),(4,7,5),(0,4,5),(0,5,1),(2,3,7),(2,7,6),(0,2,6),(0,6,4),(1,5,7),(1,7,3)]
+        return cls(p[np.array(faces)], name=name)
+
+    @classmethod
+    def merge(cls, stls):
+        """Merge several surfaces, keeping all solids
+        """
+        triangles, solids, n = [], [], 0
+        for s in stls:
+            triangles.append(s.triangles)
+            solids += [ (name, start + n, end + n) for name, start, end in s.solids ]
+            n += len(s.triangles)
+        return cls(np.concatenate(triangles), solids=solids)
+
+    def __add__(self, other):
+        return Stl.merge([self, other])
+
+    def __len__(self):
+        return len(self.triangles)
+
+    @property
+    def solidNames(self):
+        return [ s[0] for s in self.solids ]
+
+    @property
+    def boundingBox(self):
+        """Bounding box [xmin, ymin, zmin, xmax, ymax, zmax]
+        """
+        p = self.triangles.reshape(-1, 3)
+        return [ float(v) for v in np.concatenate([p.min(axis=0), p.max(axis=0)]) ]
+
+    @property
+    def normals(self):
+        n = np.cross(self.triangles[:,1] - self.triangles[:,0], self.triangles[:,2] - self.triangles[:,0])
+        norm = np.linalg.norm(n, axis=1)
+        norm[norm == 0.] = 1.
+        return (n / norm[:,None]).astype(np.float32)
+
+    def translate(self, vector):
+        self.triangles += np.asarray(vector, dtype=np.float32)
+        return self
+
+    def scale(self, factors):
+        self.triangles *= np.asarray(factors, dtype=np.float32)
+        return self
+
+    def rotate(self, rollPitchYaw, center=(0., 0., 0.)):
+        """Rotate around center, angles in degrees (as surfaceTransformPoints -rollPitchYaw)
+        """
+        R = rotationMatrix(rollPitchYaw)
+        c = np.asarray(center, dtype=np.float64)
+        p = (self.triangles.reshape(-1, 3).astype(np.float64) - c).dot(R.T) + c
+        self.triangles = p.astype(np.float32).reshape(-1, 3, 3)
+        return self
+
+    def write(self, filename, binary=False):
+        """Write STL file (binary files can only hold one solid, solid names are then lost)
+        """
+        tmp = filename + ".tmp"
+        normals = self.normals
+        if binary:
+            data = np.zeros(len(self.triangles), dtype=_binaryDtype)
+            data["normal"] = normals
+            data["vertices"] = self.triangles
+            with open(tmp, "wb") as f:
+                f.write("solid {}".format(self.solids[0][0] if len(self.solids) == 1 else "merged").encode()[:80].ljust(80, b"\0"))
+                f.write(np.array([len(data)], dtype="<u4").tobytes())
+                f.write(data.tobytes())
+        else:
+            with open(tmp, "wb") as f:
+                for name, start, end in self.solids:
+                    f.write("solid {}\n".format(name).encode())
+                    for chunk in range(start, end, 100000):
+                        i = slice(chunk, min(end, chunk + 100000))
+                        f.write(_asciiFacets(self.triangles[i], normals[i]))
+                    f.write("endsolid {}\n".format(name).encode())
+        os.replace(tmp, filename)
+        return filename
+
+
+if __name__ == "__main__" :
+
+    import argparse
+    parser = argparse.ArgumentParser(description='Transform STL file (translation, rotation, scaling, merge)')
+    parser.add_argument( 'input' , nargs = "+", help='Input STL file(s), merged if several')
+    parser.add_argument( '-o', '--output' , help='Output STL file' , type = str,  default = None)
+    parser.add_argument( '-translate' , help='Translation vector' , type = float, nargs = 3,  default = None)
+    parser.add_argument( '-rollPitchYaw' , help='Rotation angles (degrees)' , type = float, nargs = 3,  default = None)
+    parser.add_argument( '-scale' , help='Scaling factors' , type = float, nargs = 3,  default = None)
+    parser.add_argument( '-binary' , help='Write binary STL' , action="store_true")
+
+    args = parser.parse_args()
+    stl = Stl.merge([ Stl.read(f) for f in args.input ])
+    if args.scale is not None : stl.scale(args.scale)
+    if args.rollPitchYaw is not None : stl.rotate(args.rollPitchYaw)
+    if args.translate is not None : stl.translate(args.translate)
+    print("{} triangles, solids {}".format(len(stl), stl.solidNames))
+    print("Bounding box : {}".format(stl.boundingBox))
+    if args.output is not None:
+        stl.write(args.output, binary = args.binary)
@@ -4,50 +4,279 @@ import os, sys
 import argparse
 import configparser
 import subprocess as sub
+import json
+import fnmatch
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
 
-#Parse arguments
-parser = argparse.ArgumentParser()
-parser.add_argument('-f', dest='inputFile', default='sync.me', help='read source directories from input file.')
-parser.add_argument('-u','--update', dest='updateTree', action='store_true', help='use this option to update list of directories in tree.')
-parser.add_argument('-p','--print-config', dest='showConfig', action='store_true', help='print sample config file')
-args = parser.parse_args()
-
-#Print config file
-if args.showConfig:
-    print('Output default parameters to file: "sync.me"')
-    with open('sync.me','w') as f:
+MANIFEST = '.syncManifest'
+
+
+def writeSampleConfig(filename='sync.me'):
+    print('Output default parameters to file: "{}"'.format(filename))
+    with open(filename,'w') as f:
         f.write('[sync]\n')
         f.write('server = username@liger.ec-nantes.fr\n')
-        f.write('sshkey = ~/.ssh/id_rsa\n') 
+        f.write('sshkey = ~/.ssh/id_rsa\n')
         f.write('src = /scratch/username/mycase\n')
-    os._exit(1)
 
-#Read inputfile
-config = configparser.ConfigParser()
-config.read(args.inputFile)
-server = str(config['sync']['server'])
-sshkey = str(config['sync']['sshkey'])
-src = str(config['sync']['src'])
 
-#Update tree of folders to download
-if args.updateTree or (not os.path.isfile('.filetree')):
+def readConfig(inputFile):
+    """Return server, sshkey and src from config file. server = local to synchronize from a local directory
+    """
+    config = configparser.ConfigParser()
+    config.read(inputFile)
+    server = str(config['sync']['server'])
+    sshkey = str(config['sync'].get('sshkey', '~/.ssh/id_rsa'))
+    src = str(config['sync']['src'])
+    return server, sshkey, src
+
+
+def isLocal(server):
+    return server in ['', 'local', 'localhost']
+
+
+def remoteCall(server, sshkey, cmd, **kwargs):
+    """Run shell command "cmd" on server (or locally) and return its output
+    """
+    if isLocal(server):
+        return sub.check_output(['bash', '-c', cmd], **kwargs)
+    return sub.check_output(['ssh', '-a', '-q', '-i', os.path.expanduser(sshkey), server, cmd], **kwargs)
+
+
+def sourcePath(server, src):
+    src = src.rstrip('/') + '/'
+    return src if isLocal(server) else server + ':' + src
+
+
+def rsyncCommand(server, sshkey):
+    cmd = ['rsync', '--times', '--links', '-s']
+    if not isLocal(server):
+        cmd += ['-e', 'ssh -a -q -i ' + sshkey]
+    return cmd
+
+
+#--------------- Full synchronization (one rsync per postProcessing directory)
+def updateTree(server, sshkey, src):
     print('Read and update folders to synchronize')
     with open('.filetree','w') as ftree:
-        sub.call('ssh -a '+server+' "cd '+src+'; find . -type d -name postProcessing"', stdout=ftree, shell=True)
-
-#Read folders to download
-with open('.filetree') as f:
-    tree = f.readlines()
-tree = [x.strip()[2:] for x in tree if x.startswith('./')]
-
-#Make all directories
-print('Synchronize directories')
-for f in tree:
-    directory = os.path.dirname(f)
-    if len(directory)>0:
-        if not (os.path.exists(directory)): os.makedirs(directory)
-        string = '( cd '+directory+'; scp -r '+server+':'+os.path.join(src,f)+' .; )'
-        string = '( cd '+directory+'; rsync --recursive --times --progress --links --backup --itemize-changes -s -e "ssh -a -q -i '+sshkey+'" '+server+':'+os.path.join(src,f)+' ./ ;)'
+        ftree.write( remoteCall(server, sshkey, 'cd '+src+'; find . -type d -name postProcessing').decode() )
+
+
+def syncTree(server, sshkey, src):
+    #Read folders to download
+    with open('.filetree') as f:
+        tree = f.readlines()
+    tree = [x.strip()[2:] for x in tree if x.startswith('./')]
+
+    #Make all directories
+    print('Synchronize directories')
+    for f in tree:
+        directory = os.path.dirname(f)
+        if len(directory)>0:
+            if not (os.path.exists(directory)): os.makedirs(directory)
+            string = '( cd '+directory+'; rsync --recursive --times --progress --links --backup --itemize-changes -s -e "ssh -a -q -i '+sshkey+'" '+server+':'+os.path.join(src,f)+' ./ ;)'
+        else:
+            string = '(rsync --recursive --times --progress --links --backup --itemize-changes -s -e "ssh -a -q -i '+sshkey+'" '+server+':'+os.path.join(src,f)+' ./ ;)'
+        sub.call(string,shell=True)
+
+
+#--------------- Incremental synchronization
+def listRemote(server, sshkey, src):
+    """Return dict relative path => (size, mtime) of all files in postProcessing folders, with a single remote call
+    """
+    out = remoteCall(server, sshkey, "cd {} && find . -path '*/postProcessing/*' -type f -printf '%s %T@ %P\\n'".format(src))
+    files = {}
+    for line in out.decode().splitlines():
+        size, mtime, path = line.split(' ', 2)
+        files[path] = (int(size), float(mtime))
+    return files
+
+
+def readManifest(filename=MANIFEST):
+    if not os.path.isfile(filename):
+        return {}
+    with open(filename) as f:
+        return { k : tuple(v) for k, v in json.load(f).items() }
+
+
+def writeManifest(manifest, filename=MANIFEST):
+    with open(filename + '.tmp', 'w') as f:
+        json.dump(manifest, f, indent=0, sort_keys=True)
+    os.replace(filename + '.tmp', filename)
+
+
+def postProcessingInfo(path):
+    """Return (function object name, start time folder) from path relative to source directory
+    """
+    parts = path.split('/')
+    i = len(parts) - 1 - parts[::-1].index('postProcessing')
+    quantity = parts[i+1] if len(parts) > i+2 else ''
+    timeName = parts[i+2] if len(parts) > i+3 else None
+    return quantity, timeName
+
+
+def filterFiles(files, quantities=None, tmin=None, tmax=None):
+    """Select files by function object name (fnmatch patterns) and start time folder
+    """
+    res = {}
+    for path, info in files.items():
+        quantity, timeName = postProcessingInfo(path)
+        if quantities is not None and not any(fnmatch.fnmatch(quantity, q) for q in quantities):
+            continue
+        if (tmin is not None or tmax is not None) and timeName is not None:
+            try:
+                t = float(timeName)
+            except ValueError:
+                t = None
+            if t is not None and ((tmin is not None and t < tmin) or (tmax is not None and t > tmax)):
+                continue
+        res[path] = info
+    return res
+
+
+def filesToTransfer(remote, manifest, dest='.'):
+    """Return list of files that are new, or modified since last synchronization
+    """
+    res = []
+    for path, info in remote.items():
+        if manifest.get(path) != info or not os.path.isfile(os.path.join(dest, path)):
+            res.append(path)
+    return res
+
+
+def restartedQuantities(remote, manifest):
+    """Return set of postProcessing/<function object> folders where a new start time folder appeared since last synchronization
+    """
+    def startFolders(files):
+        res = set()
+        for path in files:
+            quantity, timeName = postProcessingInfo(path)
+            if timeName is not None:
+                res.add( (path[:path.rindex('postProcessing/')] + 'postProcessing/' + quantity, timeName) )
+        return res
+    known = startFolders(manifest)
+    return set( q for q, t in startFolders(remote) - known if any(k[0] == q for k in known) )
+
+
+def appendableFiles(paths, remote, manifest, dest='.'):
+    """Return files that only grew since last synchronization (the trailing part is enough)
+
+    Files that shrank, new files, and files of function objects that have been restarted are fully copied.
+    """
+    restarted = restartedQuantities(remote, manifest)
+    res = []
+    for path in paths:
+        local = os.path.join(dest, path)
+        if path not in manifest or not os.path.isfile(local):
+            continue
+        if any(path.startswith(q + '/') for q in restarted):
+            continue
+        if remote[path][0] > os.path.getsize(local) == manifest[path][0]:
+            res.append(path)
+    return res
+
+
+def splitBatches(paths, sizes, nBatches):
+    """Split paths in nBatches lists of similar total size
+    """
+    batches = [ [] for i in range(nBatches) ]
+    load = [ 0 ] * nBatches
+    for path in sorted(paths, key=lambda p : -sizes[p]):
+        i = load.index(min(load))
+        batches[i].append(path)
+        load[i] += sizes[path]
+    return [ b for b in batches if len(b) > 0 ]
+
+
+def rsyncBatch(server, sshkey, src, paths, dest='.', options=[]):
+    """Transfer list of files (relative to src) with a single rsync call. Return True if successful
+    """
+    with tempfile.NamedTemporaryFile('w', suffix='.files', delete=False) as f:
+        f.write('\n'.join(paths) + '\n')
+        listFile = f.name
+    try:
+        cmd = rsyncCommand(server, sshkey) + options + ['--files-from=' + listFile, sourcePath(server, src), dest]
+        return sub.call(cmd) == 0
+    finally:
+        os.remove(listFile)
+
+
+def syncIncremental(server, sshkey, src, dest='.', quantities=None, tmin=None, tmax=None, maxConnections=4, dryRun=False, append=False):
+    """Transfer new or grown postProcessing files, using a local manifest of remote sizes and modification times
+
+    Parameters
+    ----------
+    quantities : list of str
+        Function object names to synchronize (fnmatch patterns), all if None
+    tmin, tmax : float
+        Range of start time folders to synchronize
+    maxConnections : int
+        Maximum number of concurrent rsync
+    append : bool
+        Only fetch the trailing part of files that grew (rsync --append-verify)
+    """
+    manifestFile = os.path.join(dest, MANIFEST)
+    manifest = readManifest(manifestFile)
+    remote = filterFiles(listRemote(server, sshkey, src), quantities, tmin, tmax)
+    paths = filesToTransfer(remote, manifest, dest)
+    sizes = { p : remote[p][0] for p in paths }
+    print('{} / {} files to transfer ({:.1f} MB)'.format(len(paths), len(remote), sum(sizes.values()) / 1024.**2))
+    appendPaths = appendableFiles(paths, remote, manifest, dest) if append else []
+    if append:
+        print('{} files grew, only their trailing part is transferred'.format(len(appendPaths)))
+    if dryRun or len(paths) == 0:
+        return paths
+
+    appendSet = set(appendPaths)
+    fullPaths = [ p for p in paths if p not in appendSet ]
+    batches = splitBatches(fullPaths, sizes, maxConnections)
+    options = [ [] ] * len(batches)
+    if len(appendPaths) > 0:
+        appendBatches = splitBatches(appendPaths, sizes, maxConnections)
+        batches += appendBatches
+        options += [ ['--append-verify'] ] * len(appendBatches)
+    with ThreadPoolExecutor(max_workers=maxConnections) as pool:
+        status = list(pool.map(lambda b, o : rsyncBatch(server, sshkey, src, b, dest, o), batches, options))
+
+    for batch, ok in zip(batches, status):
+        if ok:
+            for p in batch : manifest[p] = remote[p]
+        else:
+            print('Transfer failed for {} files, they will be retried on next synchronization'.format(len(batch)))
+    writeManifest(manifest, manifestFile)
+    return paths
+
+
+if __name__ == "__main__" :
+
+    #Parse arguments
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-f', dest='inputFile', default='sync.me', help='read source directories from input file.')
+    parser.add_argument('-u','--update', dest='updateTree', action='store_true', help='use this option to update list of directories in tree.')
+    parser.add_argument('-p','--print-config', dest='showConfig', action='store_true', help='print sample config file')
+    parser.add_argument('-i','--incremental', dest='incremental', action='store_true', help='only transfer new or modified files (manifest based)')
+    parser.add_argument('-q','--quantity', dest='quantities', action='append', default=None, help='function object to synchronize (incremental mode, can be repeated, wildcards allowed)')
+    parser.add_argument('-tmin', dest='tmin', type=float, default=None, help='first start time folder to synchronize (incremental mode)')
+    parser.add_argument('-tmax', dest='tmax', type=float, default=None, help='last start time folder to synchronize (incremental mode)')
+    parser.add_argument('-n','--connections', dest='maxConnections', type=int, default=4, help='maximum number of concurrent rsync (incremental mode)')
+    parser.add_argument('-a','--append', dest='append', action='store_true', help='only fetch trailing part of grown files (incremental mode)')
+    parser.add_argument('--dry-run', dest='dryRun', action='store_true', help='only list files to transfer (incremental mode)')
+    args = parser.parse_args()
+
+    #Print config file
+    if args.showConfig:
+        writeSampleConfig()
+        os._exit(1)
+
+    #Read inputfile
+    server, sshkey, src = readConfig(args.inputFile)
+
+    if args.incremental:
+        syncIncremental(server, sshkey, src, quantities=args.quantities, tmin=args.tmin, tmax=args.tmax,
+                        maxConnections=args.maxConnections, dryRun=args.dryRun, append=args.append)
     else:
-        string = '(rsync --recursive --times --progress --links --backup --itemize-changes -s -e "ssh -a -q -i '+sshkey+'" '+server+':'+os.path.join(src,f)+' ./ ;)'
-    sub.call(string,shell=True)
+        #Update tree of folders to download
+        if args.updateTree or (not os.path.isfile('.filetree')):
+            updateTree(server, sshkey, src)
+        syncTree(server, sshkey, src)
@@ -0,0 +1,125 @@
+import os
+import re
+from collections import OrderedDict
+
+"""
+  Index of OpenFOAM time folders, shared by the different tools.
+
+  Directory content is listed once (os.scandir when available) and kept in cache as long as the directory is not
+  modified (mtime and link count unchanged). Time folders are always handled by their name (str), the numerical
+  value is only used for sorting and selection, so that no name has to be rebuilt from a float.
+"""
+
+_cache = {}
+
+
+def _scan(directory):
+    """Yield (name, isDir) for each entry of directory"""
+    if hasattr(os, "scandir"):
+        for entry in os.scandir(directory):
+            try:
+                yield entry.name, entry.is_dir()
+            except OSError:
+                pass
+    else:
+        for name in os.listdir(directory):
+            yield name, os.path.isdir(os.path.join(directory, name))
+
+
+def _toFloat(name):
+    try:
+        return float(name)
+    except ValueError:
+        return None
+
+
+def timeEntries(directory):
+    """Return list of (name, value) of time folders in "directory", sorted by value
+    """
+    directory = os.path.abspath(directory)
+    st = os.stat(directory)
+    key = (st.st_mtime, st.st_nlink)
+    cached = _cache.get(directory)
+    if cached is not None and cached[0] == key:
+        return cached[1]
+    entries = []
+    for name, isDir in _scan(directory):
+        if not isDir:
+            continue
+        value = _toFloat(name)
+        if value is not None:
+            entries.append((name, value))
+    entries.sort(key=lambda e: e[1])
+    _cache[directory] = (key, entries)
+    return entries
+
+
+def clearCache():
+    _cache.clear()
+
+
+def timeDirectory(case, parallel="auto"):
+    """Return directory containing the time folders of a case
+
+    parallel : bool or "auto"
+        If True, times are listed in the first processor directory (processor0, or processorsN for collated cases).
+        With "auto", the processor directory is used if it exists.
+    """
+    if parallel is False:
+        return case
+    procs = []
+    for name, isDir in _scan(case):
+        if isDir and (name == "processor0" or re.match(r"processors\d+$", name)):
+            procs.append(name)
+    if len(procs) == 0:
+        if parallel is True:
+            raise(FileNotFoundError(1, "No processor directory found in {}".format(case)))
+        return case
+    #prefer the collated directory when both exist, as uncollated leftovers are usually older
+    return os.path.join(case, sorted(procs)[-1])
+
+
+def listTimes(directory):
+    """Return list of time folder names in "directory", sorted by value
+    """
+    return [name for name, value in timeEntries(directory)]
+
+
+def getTimes(case, parallel="auto"):
+    """Return list of time folder names of a case (serial, decomposed or collated), sorted by value
+    """
+    return listTimes(timeDirectory(case, parallel))
+
+
+def getTimeMap(case, parallel="auto"):
+    """Return OrderedDict name => value of the time folders of a case, sorted by value
+    """
+    return OrderedDict(timeEntries(timeDirectory(case, parallel)))
+
+
+def selectTimes(case, tmin=None, tmax=None, parallel="auto", strict=False):
+    """Return names of time folders with tmin <= t <= tmax (tmin < t < tmax if strict)
+    """
+    res = []
+    for name, value in timeEntries(timeDirectory(case, parallel)):
+        if tmin is not None and (value <= tmin if strict else value < tmin):
+            continue
+        if tmax is not None and (value >= tmax if strict else value > tmax):
+            continue
+        res.append(name)
+    return res
+
+
+def findTime(case, value, parallel="auto", tol=None):
+    """Return name of the time folder closest to "value"
+
+    tol : float, default None
+        If given, None is returned when no time folder is found within tol
+    """
+    entries = timeEntries(timeDirectory(case, parallel))
+    if len(entries) == 0:
+        return None
+    name, found = min(entries, key=lambda e: abs(e[1] - value))
+    if tol is not None and abs(found - value) > tol:
+        return None
+    return name
@@ -0,0 +1,50 @@
+import os
+import sys
+import subprocess
+
+import pytest
+
+from pythonScripts.saveSpace import cleanCase
+
+SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "pythonScripts", "saveSpace.py")
+
+
+def makeCase(root, times=("0", "1", "2", "3"), nProcs=2):
+    for i in range(nProcs):
+        for t in times:
+            os.makedirs(os.path.join(str(root), "processor{}".format(i), t, "uniform"))
+            with open(os.path.join(str(root), "processor{}".format(i), t, "uniform", "time"), "w") as f:
+                f.write(t)
+    return str(root)
+
+
+def timeFolders(case):
+    return { p : sorted(os.listdir(os.path.join(case, p))) for p in os.listdir(case) }
+
+
+def test_default_call_removes_nothing(tmp_path):
+    case = makeCase(tmp_path)
+    before = timeFolders(case)
+    with pytest.raises(ValueError):
+        cleanCase(case)
+    assert timeFolders(case) == before
+
+
+def test_default_command_line_removes_nothing(tmp_path):
+    case = makeCase(tmp_path)
+    before = timeFolders(case)
+    res = subprocess.run([sys.executable, SCRIPT, "-case", case], capture_output=True)
+    assert res.returncode != 0
+    assert timeFolders(case) == before
+
+
+def test_time_window(tmp_path):
+    case = makeCase(tmp_path)
+    assert cleanCase(case, tmin=0.5, tmax=2.5) == ["1", "2"]
+    assert timeFolders(case) == { "processor0" : ["0", "3"], "processor1" : ["0", "3"] }
+
+
+def test_remove_all_keeps_initial_and_restart_times(tmp_path):
+    case = makeCase(tmp_path)
+    assert cleanCase(case, removeAll=True) == ["1", "2"]
+    assert timeFolders(case) == { "processor0" : ["0", "3"], "processor1" : ["0", "3"] }